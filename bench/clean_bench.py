@@ -0,0 +1,104 @@
+"""Benchmark keyword text cleaning against the original full-Markdown path, checking both give identical output.
+
+    python -m bench.clean_bench --comments 10000 50000 --markdown-density 0.25
+
+Results are printed as they come in and written out as json so that runs can be diffed against each other.
+"""
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+import numpy
+
+from bench.synthetic import SyntheticDT, generate_comments
+from tacostats import text
+
+# bump when paths are added, removed or renamed so that old results aren't compared against new ones
+BENCH_VERSION = 1
+
+
+def _reference(bodies: List[str]) -> List[str]:
+    """how keywords cleaned comments before the fast path, a full Markdown conversion for every one of them"""
+    return [text._normalise(text.strip_markdown(b)) for b in bodies]
+
+
+PATHS: Dict[str, Callable[[List[str]], List[str]]] = {
+    "reference": _reference,
+    "clean_text": lambda bodies: [text.clean_text(b) for b in bodies],
+    "clean_texts": text.clean_texts,
+}
+
+
+def run_path(fn: Callable[[List[str]], List[str]], bodies: List[str], repeats: int) -> Dict[str, Any]:
+    timings = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        fn(bodies)
+        timings.append(time.perf_counter() - start)
+    return {"min_s": min(timings), "median_s": float(numpy.median(timings)), "max_s": max(timings)}
+
+
+def run_benchmark(params: SyntheticDT, repeats: int = 3) -> Dict[str, Any]:
+    print(f"generating {params.comments} comments...", file=sys.stderr)
+    bodies = [c.body for c in generate_comments(params)]
+
+    expected = _reference(bodies)
+    results = {}
+    for name, fn in PATHS.items():
+        if (mismatched := sum(a != b for a, b in zip(fn(bodies), expected))) > 0:
+            raise AssertionError(f"{name} differs from the reference on {mismatched} comments")
+        results[name] = run_path(fn, bodies, repeats)
+        print(f"{params.comments:>8} {name:<12} {results[name]['median_s']:>9.4f}s", file=sys.stderr)
+
+    return {
+        "params": params.to_dict(),
+        "plain_comments": sum(text.is_plain(b) for b in bodies),
+        "paths": results,
+    }
+
+
+def get_environment() -> Dict[str, Any]:
+    return {
+        "bench_version": BENCH_VERSION,
+        "started": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+
+if __name__ == "__main__":
+    defaults = SyntheticDT()
+    parser = argparse.ArgumentParser(description="benchmark keyword text cleaning against synthetic DTs")
+    parser.add_argument("--comments", type=int, nargs="+", default=[10_000, 50_000], help="DT sizes to run")
+    parser.add_argument("--markdown-density", type=float, default=0.25)
+    parser.add_argument("--emoji-density", type=float, default=defaults.emoji_density)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default=None, help="write json results here, otherwise to stdout")
+    args = parser.parse_args()
+
+    runs = []
+    for n in args.comments:
+        params = SyntheticDT(
+            comments=n,
+            markdown_density=args.markdown_density,
+            emoji_density=args.emoji_density,
+            seed=args.seed,
+        )
+        runs.append(run_benchmark(params, args.repeats))
+
+    output = json.dumps({"environment": get_environment(), "runs": runs}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
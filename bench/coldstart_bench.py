@@ -0,0 +1,94 @@
+"""Benchmark keywords cold starts: how long a fresh interpreter takes to import the module and parse its first comment.
+
+    python -m bench.coldstart_bench --runs 5
+
+Each run is a new python process, the same as a new lambda container, so nothing is shared between runs apart from
+whatever the OS has cached. Point NLTK_DATA_DIR somewhere empty to measure the download fallback instead.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import numpy
+
+# bump when measurements are added, removed or renamed so that old results aren't compared against new ones
+BENCH_VERSION = 1
+
+# runs in the child process, prints its measurements as json on the last line
+_PROBE = """
+import json, time
+start = time.perf_counter()
+from tacostats import keywords
+imported = time.perf_counter()
+chunks = keywords._parse_bodies([("probe", "The Fed raised rates again and housing prices are still climbing.")])["probe"]
+parsed = time.perf_counter()
+# parser errors are swallowed comment by comment, a probe which didn't parse hasn't timed anything worth keeping
+if chunks == [(-1, "")]:
+    raise SystemExit("probe comment failed to parse, check that pattern and its corpora are available")
+print(json.dumps({"import_s": imported - start, "first_parse_s": parsed - imported, "total_s": parsed - start}))
+"""
+
+
+def run_once(env: Dict[str, str]) -> Dict[str, float]:
+    result = subprocess.run([sys.executable, "-c", _PROBE], env=env, capture_output=True, text=True)
+    if result.returncode:
+        # config logs plenty on its way in, the error is at the end
+        raise RuntimeError(f"probe exited with {result.returncode}:\n{result.stderr.strip()[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run_benchmark(runs: int) -> Dict[str, Any]:
+    env = dict(os.environ)
+    # keywords wants a storage backend with at least one dt in it, give it an empty local one unless told otherwise
+    if "LOCAL_PATH" not in env:
+        env["LOCAL_PATH"] = tempfile.mkdtemp(prefix="tacostats-bench-")
+        os.makedirs(os.path.join(env["LOCAL_PATH"], "2024-02-17"))
+    env.setdefault("LOCAL_STATS", "True")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH")]))
+
+    samples: List[Dict[str, float]] = []
+    for i in range(runs):
+        samples.append(run_once(env))
+        print(f"run {i + 1:>3} import {samples[-1]['import_s']:>7.3f}s first parse {samples[-1]['first_parse_s']:>7.3f}s", file=sys.stderr)
+
+    return {
+        measurement: {
+            "min_s": min(s[measurement] for s in samples),
+            "median_s": float(numpy.median([s[measurement] for s in samples])),
+            "max_s": max(s[measurement] for s in samples),
+        }
+        for measurement in samples[0]
+    }
+
+
+def get_environment() -> Dict[str, Any]:
+    return {
+        "bench_version": BENCH_VERSION,
+        "started": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "nltk_data_dir": os.getenv("NLTK_DATA_DIR"),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark keywords cold starts, ie: time to first parse")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", default=None, help="write json results here, otherwise to stdout")
+    args = parser.parse_args()
+
+    output = json.dumps({"environment": get_environment(), "results": run_benchmark(args.runs)}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
@@ -0,0 +1,189 @@
+"""Benchmark each stage of the stats pipeline against synthetic DTs.
+
+    python -m bench.stats_bench --comments 10000 50000 200000 --output bench-stats.json
+
+Every stage is timed over a few repeats, then run once more under tracemalloc for its peak memory. Results are
+printed as they come in and written out as json so that runs can be diffed against each other.
+"""
+
+import argparse
+import gc
+import io
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy
+import pandas
+from pandas import DataFrame
+
+# StatsIO wants a backend with at least one dt in it, give it an empty local one unless told otherwise
+if "LOCAL_PATH" not in os.environ:
+    os.environ["LOCAL_PATH"] = tempfile.mkdtemp(prefix="tacostats-bench-")
+    os.makedirs(os.path.join(os.environ["LOCAL_PATH"], "2024-02-17"))
+os.environ.setdefault("LOCAL_STATS", "True")
+
+from bench.synthetic import SyntheticDT, generate_comments
+from tacostats import stats, util
+from tacostats.folding import fold_comments
+from tacostats.fullstats import compact_full_stats
+from tacostats.partials import StatsPartial
+
+# bump when stages are added, removed or renamed so that old results aren't compared against new ones
+BENCH_VERSION = 2
+
+Stage = Tuple[str, Callable[[Dict[str, Any]], Any]]
+
+
+def _fold(ctx: Dict[str, Any]):
+    # the emoji cache would turn every repeat after the first into a dictionary lookup
+    util._EMOJI_CACHE.clear()
+    partial = StatsPartial()
+    ctx["comments_by_id"] = fold_comments(partial, ctx["comments"])
+    ctx["partial"] = partial
+
+
+def _refold(ctx: Dict[str, Any]):
+    """an unchanged DT against an up to date partial, ie: the common case for a harvest window"""
+    fold_comments(ctx["partial"], ctx["comments"])
+
+
+def _top_emoji(ctx: Dict[str, Any]):
+    util._EMOJI_CACHE.clear()
+    cdf = DataFrame({"body": [c.body for c in ctx["comments"]]})
+    return stats.find_top_emoji(cdf)
+
+
+def _process(full: bool) -> Callable[[Dict[str, Any]], Any]:
+    def run(ctx: Dict[str, Any]):
+        util._EMOJI_CACHE.clear()
+        ctx["full_stats" if full else "short_only"] = stats._process_comments(ctx["comments"], StatsPartial(), full=full)[0]
+
+    return run
+
+
+# order matters, later stages use what earlier ones leave in the context
+STAGES: List[Stage] = [
+    ("fold_comments", _fold),
+    ("refold_unchanged", _refold),
+    ("build_authors_df", lambda ctx: ctx.update(adf=stats._build_authors_df(ctx["partial"]))),
+    ("find_unique_users", lambda ctx: stats._find_unique_users(ctx["partial"])),
+    ("find_spammiest", lambda ctx: stats._find_spammiest(ctx["adf"])),
+    ("find_wordiest", lambda ctx: stats._find_wordiest(ctx["adf"])),
+    ("find_wordiest_per_comment", lambda ctx: stats._find_wordiest_per_comment(ctx["adf"])),
+    ("find_upvoted_redditors", lambda ctx: stats._find_upvoted_redditors(ctx["adf"])),
+    ("find_avg_scores", lambda ctx: stats._find_avg_scores(ctx["adf"])),
+    ("find_emoji_spammers", lambda ctx: stats._find_emoji_spammers(ctx["adf"])),
+    ("rank_emoji", lambda ctx: stats._rank_emoji(ctx["partial"].emoji)),
+    ("find_upvoted_comments", lambda ctx: stats._find_upvoted_comments(ctx["partial"], ctx["comments_by_id"])),
+    ("build_hourly_table", lambda ctx: ctx.update(hourly=stats._build_hourly_table(ctx["partial"]))),
+    ("find_activity_by_hour", lambda ctx: stats._find_activity_by_hour(ctx["hourly"])),
+    ("find_wordiest_by_hour", lambda ctx: stats._find_wordiest_by_hour(ctx["hourly"])),
+    ("find_spammiest_by_hour", lambda ctx: stats._find_spammiest_by_hour(ctx["hourly"])),
+    ("find_top_emoji", _top_emoji),
+    ("process_comments_full", _process(full=True)),
+    ("process_comments_short", _process(full=False)),
+    ("build_short_stats", lambda ctx: stats._build_short_stats(ctx["full_stats"])),
+    ("compact_full_stats", lambda ctx: compact_full_stats(ctx["full_stats"])),
+]
+
+
+def run_stage(fn: Callable[[Dict[str, Any]], Any], ctx: Dict[str, Any], repeats: int) -> Dict[str, Any]:
+    """time `fn` over `repeats` runs, then measure its peak traced allocations on one more"""
+    timings = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        fn(ctx)
+        timings.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    fn(ctx)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "min_s": min(timings),
+        "median_s": float(numpy.median(timings)),
+        "max_s": max(timings),
+        "peak_bytes": peak,
+    }
+
+
+def run_benchmark(params: SyntheticDT, repeats: int = 3) -> Dict[str, Any]:
+    print(f"generating {params.comments} comments...", file=sys.stderr)
+    ctx: Dict[str, Any] = {"comments": generate_comments(params)}
+
+    results = {}
+    for name, fn in STAGES:
+        # the stages print their progress, which would otherwise end up in the json on stdout
+        with redirect_stdout(io.StringIO()):
+            results[name] = stage = run_stage(fn, ctx, repeats)
+        print(f"{params.comments:>8} {name:<28} {stage['median_s']:>9.4f}s {stage['peak_bytes'] / 2**20:>9.1f}MiB", file=sys.stderr)
+
+    return {
+        "params": params.to_dict(),
+        "stages": results,
+        # ru_maxrss is in KiB on linux, and covers everything the process has done so far
+        "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def get_environment() -> Dict[str, Any]:
+    return {
+        "bench_version": BENCH_VERSION,
+        "started": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "pandas": pandas.__version__,
+        "numpy": numpy.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+
+if __name__ == "__main__":
+    defaults = SyntheticDT()
+    parser = argparse.ArgumentParser(description="benchmark the stats pipeline against synthetic DTs")
+    parser.add_argument("--comments", type=int, nargs="+", default=[10_000, 50_000, 200_000], help="DT sizes to run")
+    parser.add_argument("--authors", type=int, default=None, help="distinct authors, defaults to 15%% of comments (max 10k)")
+    parser.add_argument("--author-skew", type=float, default=defaults.author_skew)
+    parser.add_argument("--emoji-density", type=float, default=defaults.emoji_density)
+    parser.add_argument("--flair-density", type=float, default=defaults.flair_density)
+    parser.add_argument("--max-depth", type=int, default=defaults.max_depth)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default=None, help="write json results here, otherwise to stdout")
+    args = parser.parse_args()
+
+    logging.getLogger("tacostats").setLevel(logging.WARNING)
+
+    runs = []
+    for n in args.comments:
+        params = SyntheticDT(
+            comments=n,
+            authors=args.authors or min(10_000, max(100, n * 15 // 100)),
+            author_skew=args.author_skew,
+            emoji_density=args.emoji_density,
+            flair_density=args.flair_density,
+            max_depth=args.max_depth,
+            seed=args.seed,
+        )
+        runs.append(run_benchmark(params, args.repeats))
+
+    output = json.dumps({"environment": get_environment(), "runs": runs}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
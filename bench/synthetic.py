@@ -0,0 +1,126 @@
+"""Seeded generator for synthetic DTs, used to benchmark the stats and keywords pipelines without real data."""
+
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import numpy
+
+from tacostats.models import Comment
+
+WORDS = (
+    "the of and to a in is that it for on was with as be this have are not but they you at his from by or an "
+    "taco fed rates housing zoning yimby nimby inflation jobs report gdp tariffs trade carbon tax nuclear "
+    "election polls senate house court ruling bill budget deficit market stocks bonds crypto rent prices"
+).split()
+EMOJI = ["🌮", "😤", "🤡", "😭", "🔥", "👀", "🇺🇸", "🇨🇦", "👍🏽", "🏳️‍🌈", "👨‍👩‍👧", "🤯", "🧐", "💀", "🙏"]
+FLAIRS = [":flag-us: United States", ":taco: Taco", ":ben: Bernanke", ":yimby: YIMBY", ":flag-ca: Canada", "Unflaired text"]
+BLANK_BODIES = ["[deleted]", "[removed]"]
+# the sort of formatting people actually use, each applied to a comment's text
+MARKDOWN = [
+    lambda s: f"> {s}",
+    lambda s: f"**{s}**",
+    lambda s: f"*{s}*",
+    lambda s: f"[{s}](https://www.reddit.com/r/neoliberal/)",
+    lambda s: f"`{s}`",
+    lambda s: f"{s}\n\n{s}",
+    lambda s: f"- {s}\n- {s}",
+    lambda s: f"{s} https://example.com/some/article?id=420",
+    lambda s: f"I'm sure it's {s} but don't ask",
+]
+
+# DTs start at 07:00 UTC
+DT_START = datetime(2024, 2, 17, 7, tzinfo=timezone.utc)
+
+
+@dataclass
+class SyntheticDT:
+    """Knobs for a synthetic DT. Defaults roughly match a busy weekday."""
+
+    comments: int = 20_000
+    authors: int = 3_000
+    # zipf exponent for comments per author, higher means a few authors write most of the DT
+    author_skew: float = 1.1
+    # fraction of comments with any emoji, and the mean number of emoji when there are some
+    emoji_density: float = 0.15
+    emoji_per_comment: float = 1.8
+    # fraction of authors wearing a flair
+    flair_density: float = 0.6
+    # fraction of comments which are replies, and how deep reply chains may go
+    reply_rate: float = 0.7
+    max_depth: int = 8
+    # fraction of comments which end up deleted or removed
+    blank_rate: float = 0.03
+    # fraction of comments with some markdown (or links and contractions) in them
+    markdown_density: float = 0.0
+    seed: int = 420
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def generate_comments(params: SyntheticDT) -> List[Comment]:
+    """Build a reproducible DT's worth of comments."""
+    rng = numpy.random.default_rng(params.seed)
+    n = params.comments
+
+    weights = 1 / numpy.arange(1, params.authors + 1) ** params.author_skew
+    author_ids = rng.choice(params.authors, size=n, p=weights / weights.sum())
+    flaired = rng.random(params.authors) < params.flair_density
+    author_flairs = rng.choice(len(FLAIRS), size=params.authors)
+
+    # busier in the afternoon and evening (ET), quiet overnight
+    hour_weights = numpy.array([3, 2, 1, 1, 1, 2, 4, 6, 8, 9, 9, 9, 9, 9, 9, 10, 10, 9, 8, 7, 6, 5, 4, 3], dtype=float)
+    hours = rng.choice(24, size=n, p=hour_weights / hour_weights.sum())
+    timestamps = numpy.sort(DT_START.timestamp() + hours * 3600 + rng.integers(0, 3600, size=n))
+
+    word_counts = numpy.minimum(rng.geometric(0.08, size=n), 400)
+    scores = (rng.pareto(1.5, size=n) * 3).astype(int) - rng.integers(0, 3, size=n)
+    has_emoji = rng.random(n) < params.emoji_density
+    emoji_counts = rng.poisson(params.emoji_per_comment, size=n) + 1
+    blanks = rng.random(n) < params.blank_rate
+    replies = rng.random(n) < params.reply_rate
+
+    comments: List[Comment] = []
+    depths: List[int] = []
+    for i in range(n):
+        comment_id = f"s{i:07x}"
+
+        # reply to one of the last few hundred comments, as long as the chain isn't already too deep
+        parent_id, depth = "t3_synthdt", 0
+        if replies[i] and i > 0:
+            j = int(rng.integers(max(0, i - 300), i))
+            if depths[j] < params.max_depth:
+                parent_id, depth = f"t1_{comments[j].id}", depths[j] + 1
+        depths.append(depth)
+
+        if blanks[i]:
+            author, flair, body = "", "", BLANK_BODIES[int(rng.integers(0, 2))]
+        else:
+            author_id = int(author_ids[i])
+            author = f"synthuser{author_id}"
+            flair = FLAIRS[author_flairs[author_id]] if flaired[author_id] else None
+            body = " ".join(rng.choice(WORDS, size=int(word_counts[i])))
+            if has_emoji[i]:
+                body += " " + "".join(rng.choice(EMOJI, size=int(emoji_counts[i])))
+
+        comments.append(
+            Comment(
+                author=author,
+                author_flair_text=flair,
+                score=int(scores[i]),
+                id=comment_id,
+                permalink=f"/r/neoliberal/comments/synthdt/_/{comment_id}/",
+                body=body,
+                created_utc=datetime.fromtimestamp(float(timestamps[i])),
+                parent_id=parent_id,
+            )
+        )
+
+    # drawn separately so that turning it on doesn't change anything else about the DT
+    if params.markdown_density:
+        md_rng = numpy.random.default_rng(params.seed + 1)
+        for i in numpy.flatnonzero(md_rng.random(n) < params.markdown_density):
+            if not blanks[i]:
+                comments[i].body = MARKDOWN[int(md_rng.integers(0, len(MARKDOWN)))](comments[i].body)
+    return comments
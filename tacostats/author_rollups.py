@@ -0,0 +1,161 @@
+import logging
+
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional
+
+from tacostats.config import AUTHOR_ROLLUP_KEY, STATS_PARTIAL_KEY
+from tacostats.folding import fold_comments
+from tacostats.models import Comment
+from tacostats.partials import StatsPartial
+from tacostats.statsio import StatsIO
+
+# bump whenever the shape of the stored rollups changes, older rollups are rebuilt, see `_backfill_author_rollup`
+AUTHOR_ROLLUP_VERSION = 2
+
+# how much of each author's top comment is kept, enough for userstats to quote it without reading the dt
+TOP_COMMENT_EXCERPT = 1000
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class AuthorDay:
+    """One author's totals over one or more DTs"""
+
+    comment_count: int = 0
+    word_count: int = 0
+    max_words: int = 0
+    score: int = 0
+    top_comment_id: str = ""
+    top_score: Optional[int] = None
+    emoji: Dict[str, int] = field(default_factory=dict)
+    top_permalink: str = ""
+    # the start of the top comment's body, see TOP_COMMENT_EXCERPT
+    top_body: str = ""
+
+    def add(self, comment_id: str, word_count: int, score: int, emoji: List[str]):
+        self.comment_count += 1
+        self.word_count += word_count
+        self.max_words = max(self.max_words, word_count)
+        self.score += score
+        if self._beats(score, comment_id):
+            self.top_comment_id, self.top_score = comment_id, score
+        for e in emoji:
+            self.emoji[e] = self.emoji.get(e, 0) + 1
+
+    def merge(self, other: "AuthorDay") -> "AuthorDay":
+        self.comment_count += other.comment_count
+        self.word_count += other.word_count
+        self.max_words = max(self.max_words, other.max_words)
+        self.score += other.score
+        if other.top_score is not None and self._beats(other.top_score, other.top_comment_id):
+            self.top_comment_id, self.top_score = other.top_comment_id, other.top_score
+            self.top_permalink, self.top_body = other.top_permalink, other.top_body
+        for e, count in other.emoji.items():
+            self.emoji[e] = self.emoji.get(e, 0) + count
+        return self
+
+    def _beats(self, score: int, comment_id: str) -> bool:
+        # ties go to the lower id so that the result doesn't depend on the order comments turn up in
+        return self.top_score is None or (score, self.top_comment_id) > (self.top_score, comment_id)
+
+    def to_list(self) -> List[Any]:
+        return [
+            self.comment_count,
+            self.word_count,
+            self.max_words,
+            self.score,
+            self.top_comment_id,
+            self.top_score,
+            self.emoji,
+            self.top_permalink,
+            self.top_body,
+        ]
+
+    @staticmethod
+    def from_list(data: List[Any]) -> "AuthorDay":
+        return AuthorDay(*data)
+
+
+@dataclass
+class AuthorRollup:
+    """Every author's totals for a single DT, so that per-user stats don't need to read the DT's comments."""
+
+    version: int = AUTHOR_ROLLUP_VERSION
+    authors: Dict[str, AuthorDay] = field(default_factory=dict)
+
+    @staticmethod
+    def from_partial(partial: StatsPartial, dt_comments: Iterable[Comment]) -> "AuthorRollup":
+        """Build a rollup from a partial's ledger, quoting each author's top comment from `dt_comments`. Blank
+        comments aren't attributed to anyone, so they're left out."""
+        rollup = AuthorRollup()
+        for comment_id, c in partial.ledger.items():
+            if c.author:
+                rollup.authors.setdefault(c.author, AuthorDay()).add(comment_id, c.word_count, c.score, c.emoji)
+
+        tops = {author_day.top_comment_id: author_day for author_day in rollup.authors.values()}
+        for comment in dt_comments:
+            if author_day := tops.get(comment.id):
+                author_day.top_permalink, author_day.top_body = comment.permalink, comment.body[:TOP_COMMENT_EXCERPT]
+        return rollup
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"version": self.version, "authors": {k: v.to_list() for k, v in self.authors.items()}}
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> Optional["AuthorRollup"]:
+        """Load a stored rollup. Returns None if it was written by an incompatible version."""
+        if data.get("version") != AUTHOR_ROLLUP_VERSION:
+            return None
+        return AuthorRollup(authors={k: AuthorDay.from_list(v) for k, v in data["authors"].items()})
+
+
+def merge_author_days(author_days: Iterable[AuthorDay]) -> AuthorDay:
+    """Total up author days, whether one author's across several DTs or everyone's."""
+    total = AuthorDay()
+    for author_day in author_days:
+        total.merge(author_day)
+    return total
+
+
+def read_author_rollups(statsio: StatsIO, dt_dates: List[date]) -> Dict[date, AuthorRollup]:
+    """Read each DT's author rollup, building any that are missing. DTs with nothing in storage are skipped."""
+    rollups = {}
+    for dt_date in dt_dates:
+        if not statsio.has_dt(dt_date):
+            continue
+        try:
+            if rollup := AuthorRollup.from_dict(statsio.read(statsio.get_dt_prefix(dt_date), AUTHOR_ROLLUP_KEY)):
+                rollups[dt_date] = rollup
+                continue
+        except KeyError:
+            pass
+        rollups[dt_date] = _backfill_author_rollup(statsio, dt_date)
+    return rollups
+
+
+def _backfill_author_rollup(statsio: StatsIO, dt_date: date) -> AuthorRollup:
+    """Build and store a rollup for a DT from before rollups existed (or from an older version), from its partials if
+    it has them. Its comments are read regardless, for the top comments."""
+    log.info(f"no author rollup for {dt_date}, building one...")
+    dt_prefix = statsio.get_dt_prefix(dt_date)
+    try:
+        dt_comments = statsio.read_dt_comments(dt_date)
+    except KeyError:
+        # built without top comments, but not stored, so that it's built properly once the comments turn up
+        log.warning(f"no comments found for {dt_date}, its author rollup won't be saved.")
+        dt_comments = []
+    partial = None
+    try:
+        partial = StatsPartial.from_dict(statsio.read(dt_prefix, STATS_PARTIAL_KEY))
+    except KeyError:
+        pass
+    if partial is None:
+        partial = StatsPartial()
+        fold_comments(partial, dt_comments)
+
+    rollup = AuthorRollup.from_partial(partial, dt_comments)
+    if dt_comments:
+        statsio.write(dt_prefix, **{AUTHOR_ROLLUP_KEY: rollup.to_dict()})
+    return rollup
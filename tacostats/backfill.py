@@ -0,0 +1,94 @@
+import argparse
+import logging
+import os
+
+from datetime import date, datetime, timedelta, timezone
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Set, Tuple
+
+from tacostats.config import BACKFILL_PREFIX
+from tacostats.flairs import FlairDictionary, get_flair_dictionary, write_flair_dictionary
+from tacostats.statsio import StatsIO
+
+log = logging.getLogger(__name__)
+
+statsio = StatsIO()
+
+
+def backfill_stats(start: date, end: date, workers: Optional[int] = None, restart: bool = False):
+    """Recompute stats for every stored dt between `start` and `end` (inclusive) across a pool of processes.
+
+    Finished days are checkpointed as they complete, so rerunning the same range picks up where it left off unless
+    `restart` is set. Nothing is read from or posted to reddit.
+    """
+    started = datetime.now(timezone.utc)
+    checkpoint_key = _get_checkpoint_key(start, end)
+    done = set() if restart else _read_checkpoint(checkpoint_key)
+
+    dt_dates = [d for d in _date_range(start, end) if statsio.has_dt(d)]
+    todo = [d for d in dt_dates if d.isoformat() not in done]
+    log.info(f"{len(dt_dates)} dts between {start} and {end}, {len(dt_dates) - len(todo)} already done. {len(todo)} to go...")
+
+    failed = []
+    # workers only hand back the flairs they parsed, the dictionary is written once from here so they can't race
+    flair_dictionary = FlairDictionary()
+    # each day reads its own comments file, so nothing carries over between days apart from module-level caches (eg:
+    # emoji). a fresh process every few days keeps those from building up
+    with Pool(processes=workers or os.cpu_count(), maxtasksperchild=4) as pool:
+        for dt_date, error, flairs in pool.imap_unordered(_backfill_day, todo):
+            flair_dictionary.merge(flairs)
+            if error:
+                log.error(f"{dt_date} failed: {error}")
+                failed.append(dt_date)
+                continue
+            done.add(dt_date.isoformat())
+            _write_checkpoint(checkpoint_key, done)
+            log.info(f"{dt_date} done ({len(done)}/{len(dt_dates)})")
+    write_flair_dictionary(statsio, flair_dictionary)
+
+    duration = (datetime.now(timezone.utc) - started).total_seconds()
+    log.info(f"backfill finished in {duration} seconds. {len(failed)} failed: {sorted(failed)}")
+
+
+def _backfill_day(dt_date: date) -> Tuple[date, Optional[str], Dict[str, List[str]]]:
+    """Runs in a worker process. Returns the date, an error message if it failed and every flair the worker has
+    parsed so far."""
+    # imported here so that each worker sets up its own StatsIO rather than sharing the parent's
+    from tacostats.stats import rebuild_stats
+
+    error = None
+    try:
+        rebuild_stats(dt_date, save_flairs=False)
+    except Exception as e:
+        log.exception(f"unable to rebuild stats for {dt_date}")
+        error = repr(e)
+    return dt_date, error, get_flair_dictionary(statsio).flairs
+
+
+def _date_range(start: date, end: date) -> List[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def _get_checkpoint_key(start: date, end: date) -> str:
+    return f"stats-{start.isoformat()}-{end.isoformat()}"
+
+
+def _read_checkpoint(key: str) -> Set[str]:
+    try:
+        return set(statsio.read(BACKFILL_PREFIX, key)["done"])
+    except KeyError:
+        return set()
+
+
+def _write_checkpoint(key: str, done: Set[str]):
+    statsio.write(BACKFILL_PREFIX, **{key: {"done": sorted(done)}})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="recompute full_stats/short_stats for a range of stored dts")
+    parser.add_argument("start", type=date.fromisoformat, help="first dt date, YYYY-MM-DD")
+    parser.add_argument("end", type=date.fromisoformat, help="last dt date, YYYY-MM-DD")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, defaults to the cpu count")
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint and redo every day")
+    args = parser.parse_args()
+    backfill_stats(args.start, args.end, workers=args.workers, restart=args.restart)
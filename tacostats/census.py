@@ -0,0 +1,78 @@
+import logging
+import sys
+
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from pandas import DataFrame
+
+from tacostats.config import PRIDE_FLAIRMOJI, ROLLUP_DAYS, ROLLUPS_PREFIX
+from tacostats.flairs import FlairDictionary, get_flair_dictionary, write_flair_dictionary
+from tacostats.partials import StatsPartial
+from tacostats.reddit import report
+from tacostats.rollup import get_last_completed_dt_date, merge_daily_partials
+from tacostats.statsio import StatsIO
+
+log = logging.getLogger(__name__)
+
+statsio = StatsIO()
+
+
+def lambda_handler(event, context):
+    process_census()
+
+
+def process_census(days: int = ROLLUP_DAYS, date_from: Optional[date] = None):
+    """count who wore which flair over the last N completed dts, using the daily partials and the flair dictionary"""
+    start = datetime.now(timezone.utc)
+    log.info(f"process_census started at {start}...")
+
+    dt_dates = statsio.get_dt_dates(daysago=days, date_from=date_from or get_last_completed_dt_date())
+    log.info(f"merging daily partials from {dt_dates[-1]} to {dt_dates[0]}...")
+    partial, found = merge_daily_partials(dt_dates)
+    if not found:
+        raise KeyError(f"no daily partials found between {dt_dates[-1]} and {dt_dates[0]}")
+
+    log.info("joining flairs...")
+    flair_dictionary = get_flair_dictionary(statsio)
+    census = _build_census(partial, flair_dictionary)
+    write_flair_dictionary(statsio, flair_dictionary)
+
+    log.info("writing results...")
+    statsio.write(ROLLUPS_PREFIX, **{f"{statsio.get_dt_prefix(max(found))}-{days}d-census": census})
+
+    log.info("posting results...")
+    report.post(census, "census.md.j2")
+
+    done = datetime.now(timezone.utc)
+    duration = (done - start).total_seconds()
+    log.info(f"Finished at {done.isoformat()}, took {duration} seconds")
+
+
+def _build_census(partial: StatsPartial, flair_dictionary: FlairDictionary) -> Dict[str, Any]:
+    """Each author is counted once, under the flair they used most often."""
+    authors = DataFrame({"author": list(partial.authors)})
+    flairs = authors["author"].map(partial.get_flair)
+    authors["flair"] = flair_dictionary.get_labels(flairs)
+    authors["flairmoji"] = flair_dictionary.get_flairmoji(flairs)
+    census: Dict[str, Any] = {
+        "unique_users": {"total": len(authors), "flaired": int((authors["flair"] != "").sum())},
+        "flair_census": _count_flairs(authors),
+    }
+    if PRIDE_FLAIRMOJI:
+        census["queer_census"] = {"total": int(authors["flairmoji"].isin(PRIDE_FLAIRMOJI).sum())}
+    return census
+
+
+def _count_flairs(authors: DataFrame) -> List[Dict[str, Any]]:
+    """Returns:
+    [{"name": <flair label>, "count": <authors>}, ...]
+    """
+    counts = authors.loc[authors["flair"] != "", "flair"].value_counts()
+    counts = counts.rename_axis("name").reset_index().sort_values(["count", "name"], ascending=[False, True])
+    return counts.to_dict("records")
+
+
+if __name__ == "__main__":
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else ROLLUP_DAYS
+    process_census(days=days)
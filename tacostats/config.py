@@ -31,7 +31,21 @@ get_secret = lambda x: secrets.get_secret_value(SecretId=x)["SecretString"]
 # filenames shared among all modules, storage module handles extension
 COMMENTS_KEY = "comments"
 FULLSTATS_KEY = "full_stats"
+STATS_PARTIAL_KEY = "stats_partial"
+DAILY_PARTIAL_KEY = "daily_partial"
+KEYWORD_PARTIAL_KEY = "keyword_partial"
+AUTHOR_ROLLUP_KEY = "author_rollup"
+ROLLUPS_PREFIX = "rollups"
+BACKFILL_PREFIX = "backfill"
+TIMINGS_KEY = "timings"
+MEMORY_KEY = "memory"
+SKETCHES_KEY = "sketches"
+FLAIRS_PREFIX = "flairs"
+FLAIR_DICTIONARY_KEY = "flair_dictionary"
+TRENDS_PREFIX = "trends"
+KEYWORD_BASELINE_KEY = "keyword_baseline"
 KEYWORDS_KEY = "keywords"
+PARSE_CACHE_KEY = "keyword_parse_cache"
 
 # data bucket
 S3_BUCKET = os.getenv("S3_BUCKET")
@@ -59,6 +73,18 @@ log.info(f"RECAP             {RECAP}")
 CREATE_TIME = time(hour=7, tzinfo=timezone.utc)
 log.info(f"CREATE_TIME       {CREATE_TIME}")
 
+# build and write the complete full_stats, otherwise only what short_stats needs is built -- only for stats atm
+FULL_STATS = bool(strtobool(os.getenv("FULL_STATS", "True")))
+log.info(f"FULL_STATS        {FULL_STATS}")
+
+# record rss and tracemalloc peaks for each pipeline stage. slows everything down a fair bit, leave off unless sizing
+PROFILE_MEMORY = bool(strtobool(os.getenv("PROFILE_MEMORY", "False")))
+log.info(f"PROFILE_MEMORY    {PROFILE_MEMORY}")
+
+# how many allocation sites to keep per stage when profiling memory
+PROFILE_MEMORY_SITES = int(os.getenv("PROFILE_MEMORY_SITES", 5))
+log.info(f"PROFILE_MEMORY_SITES {PROFILE_MEMORY_SITES}")
+
 # use cached results if they exist -- only for userstats atm
 USE_CACHE = bool(strtobool(os.getenv("USE_CACHE", "True")))
 log.info(f"USE_CACHE         {USE_CACHE}")
@@ -71,6 +97,40 @@ log.info(f"GPT_MODE          {GPT_MODE}")
 USERSTATS_HISTORY = int(os.getenv("USERSTATS_HISTORY", 7))
 log.info(f"USERSTATS_HISTORY {USERSTATS_HISTORY}d")
 
+# how many users from a batch of userstats requests are worked on at once
+USERSTATS_WORKERS = int(os.getenv("USERSTATS_WORKERS", 4))
+log.info(f"USERSTATS_WORKERS {USERSTATS_WORKERS}")
+
+# processes used to parse keywords, 0 for one per cpu. lambda only gets a second vcpu past ~1.8GB of memory
+KEYWORD_WORKERS = int(os.getenv("KEYWORD_WORKERS", 1))
+log.info(f"KEYWORD_WORKERS   {KEYWORD_WORKERS}")
+
+# rank keywords by how unusual they are compared to the last TREND_DAYS dts, rather than by raw score
+KEYWORD_TRENDS = bool(strtobool(os.getenv("KEYWORD_TRENDS", "False")))
+TREND_DAYS = int(os.getenv("TREND_DAYS", 14))
+log.info(f"KEYWORD_TRENDS    {KEYWORD_TRENDS} ({TREND_DAYS}d)")
+
+# also keep every comment's parsed chunks, not just the keywords which count. only saves parsing when the keyword
+# partials are rebuilt (eg: after a version bump), at the cost of a second per-comment store for each dt
+KEYWORD_PARSE_CACHE = bool(strtobool(os.getenv("KEYWORD_PARSE_CACHE", "False")))
+log.info(f"KEYWORD_PARSE_CACHE {KEYWORD_PARSE_CACHE}")
+
+# comma separated flairmoji (eg: ":flairmoji:,:other:") counted towards the pride census, which is left out when unset
+PRIDE_FLAIRMOJI = [f.strip() for f in os.getenv("PRIDE_FLAIRMOJI", "").split(",") if f.strip()]
+log.info(f"PRIDE_FLAIRMOJI   {PRIDE_FLAIRMOJI}")
+
+# keywords scoring less than this over a whole dt are dropped
+KEYWORD_MIN_SCORE = 3
+
+# nltk corpora needed by pattern, baked into the image. anything missing is downloaded to /tmp on first use
+NLTK_DATA_DIR = os.getenv("NLTK_DATA_DIR", "/var/task/nltk_data")
+NLTK_CORPORA = ["wordnet", "wordnet_ic", "sentiwordnet", "stopwords"]
+log.info(f"NLTK_DATA_DIR     {NLTK_DATA_DIR}")
+
+# how many days a stats rollup (ie: "this week in the dt") covers
+ROLLUP_DAYS = int(os.getenv("ROLLUP_DAYS", 7))
+log.info(f"ROLLUP_DAYS       {ROLLUP_DAYS}d")
+
 # openai model to use for chat completions -- only for userstats atm
 CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4-turbo-preview")
 log.info(f"CHAT_MODEL        {CHAT_MODEL}")
@@ -133,12 +193,14 @@ log.info(f'RULES_PROMPT\n"""\n{RULES_PROMPT}\n"""')
 
 THUNDERDOME_TITLES = ["thunderdome", "dôme du tonnerre", "elefantenrunde"]
 
+# only hit secretsmanager when the env doesn't supply credentials, which lets benchmarks and tests run offline (boto3
+# still wants a region to create the client)
 REDDIT = {
-    "client_id": os.getenv("REDDIT_ID", get_secret("tacostats-reddit-client-id")),
-    "client_secret": os.getenv("REDDIT_SECRET", get_secret("tacostats-reddit-client-secret")),
+    "client_id": os.getenv("REDDIT_ID") or get_secret("tacostats-reddit-client-id"),
+    "client_secret": os.getenv("REDDIT_SECRET") or get_secret("tacostats-reddit-client-secret"),
     "user_agent": os.getenv("REDDIT_UA"),
     "username": os.getenv("REDDIT_USER"),
-    "password": os.getenv("REDDIT_PASS", get_secret("tacostats-reddit-password")),
+    "password": os.getenv("REDDIT_PASS") or get_secret("tacostats-reddit-password"),
 }
 
 EXCLUDED_AUTHORS = [
@@ -0,0 +1,106 @@
+import logging
+import re
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from pandas import Series
+
+from tacostats.config import FLAIR_DICTIONARY_KEY, FLAIRS_PREFIX
+from tacostats.statsio import StatsIO
+
+# bump whenever the parsing changes, older dictionaries are thrown away and rebuilt
+FLAIR_DICTIONARY_VERSION = 1
+
+# ":flairmoji: Label", with anything in front of the last flairmoji ignored
+FLAIRMOJI_REGEX = re.compile(r".*(\:[\-\w]+\:)\s(.*)")
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class FlairDictionary:
+    """Raw author_flair_text -> [flairmoji, label]. Flairs without a flairmoji get blanks for both."""
+
+    version: int = FLAIR_DICTIONARY_VERSION
+    flairs: Dict[str, List[str]] = field(default_factory=dict)
+    # flairs parsed since the dictionary was loaded
+    unsaved: int = field(default=0, compare=False)
+
+    def parse(self, raw_flairs: Iterable[Optional[str]]) -> int:
+        """Parse any flairs which haven't been seen before. Returns how many were new."""
+        # missing flairs turn up as None or NaN depending on where they came from
+        unseen = Series(list({f if isinstance(f, str) else "" for f in raw_flairs} - self.flairs.keys()), dtype=object)
+        if not len(unseen):
+            return 0
+
+        # `match` rather than `search`, same as the regex has always been used
+        parsed = unseen.str.extract(f"^(?:{FLAIRMOJI_REGEX.pattern})", expand=True).fillna("")
+        self.flairs.update(zip(unseen, parsed[[0, 1]].to_numpy().tolist()))
+        self.unsaved += len(unseen)
+        return len(unseen)
+
+    def merge(self, flairs: Dict[str, List[str]]) -> int:
+        """Add flairs parsed somewhere else (eg: a backfill worker) which haven't been seen before. Returns how many
+        were new."""
+        unseen = flairs.keys() - self.flairs.keys()
+        self.flairs.update((raw, flairs[raw]) for raw in unseen)
+        self.unsaved += len(unseen)
+        return len(unseen)
+
+    def get_labels(self, raw_flairs: Series) -> Series:
+        """Map a column of raw flairs to their labels, parsing any new ones along the way."""
+        self.parse(raw_flairs.unique())
+        return raw_flairs.fillna("").map({raw: parsed[1] for raw, parsed in self.flairs.items()})
+
+    def get_flairmoji(self, raw_flairs: Series) -> Series:
+        """Map a column of raw flairs to their flairmoji, parsing any new ones along the way."""
+        self.parse(raw_flairs.unique())
+        return raw_flairs.fillna("").map({raw: parsed[0] for raw, parsed in self.flairs.items()})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"version": self.version, "flairs": self.flairs}
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> Optional["FlairDictionary"]:
+        """Load a stored dictionary. Returns None if it was written by an incompatible version."""
+        if data.get("version") != FLAIR_DICTIONARY_VERSION:
+            return None
+        return FlairDictionary(flairs=data["flairs"])
+
+
+# loaded on first use and shared by everything running in this process
+_flair_dictionary: Optional[FlairDictionary] = None
+
+
+def get_flair_dictionary(statsio: StatsIO) -> FlairDictionary:
+    """The shared flair dictionary, read from storage the first time it's needed."""
+    global _flair_dictionary
+    if _flair_dictionary is None:
+        _flair_dictionary = read_flair_dictionary(statsio)
+    return _flair_dictionary
+
+
+def read_flair_dictionary(statsio: StatsIO) -> FlairDictionary:
+    """Read the stored flair dictionary, starting a fresh one if there isn't a usable one stored."""
+    try:
+        if flair_dictionary := FlairDictionary.from_dict(statsio.read(FLAIRS_PREFIX, FLAIR_DICTIONARY_KEY)):
+            log.info(f"found {len(flair_dictionary.flairs)} known flairs")
+            return flair_dictionary
+        log.info("stored flair dictionary is from an older version, rebuilding...")
+    except KeyError:
+        log.info("no flair dictionary found, starting fresh...")
+    return FlairDictionary()
+
+
+def write_flair_dictionary(statsio: StatsIO, flair_dictionary: FlairDictionary):
+    """Store the flair dictionary, skipping the write if nothing new was parsed. Anything other runs stored since it was
+    read is merged in rather than written over, but two writes racing each other can still lose one side's flairs. Keep
+    it to one writer per run, backfill workers hand theirs back to the parent rather than writing them."""
+    if not flair_dictionary.unsaved:
+        return
+    log.info(f"saving {flair_dictionary.unsaved} new flairs")
+    stored = read_flair_dictionary(statsio)
+    flair_dictionary.flairs = {**stored.flairs, **flair_dictionary.flairs}
+    statsio.write(FLAIRS_PREFIX, **{FLAIR_DICTIONARY_KEY: flair_dictionary.to_dict()})
+    flair_dictionary.unsaved = 0
@@ -0,0 +1,62 @@
+import logging
+
+from typing import Dict, Iterable
+
+from pandas import DataFrame, Series
+
+from tacostats.config import EXCLUDED_AUTHORS
+from tacostats.models import Comment
+from tacostats.partials import BLANK_BODIES, Contribution, StatsPartial
+from tacostats.timings import span, stage
+from tacostats.util import body_hash, find_emoji_batch, to_epoch_seconds
+
+log = logging.getLogger(__name__)
+
+
+@stage
+def fold_comments(partial: StatsPartial, dt_comments: Iterable[Comment]) -> Dict[str, Comment]:
+    """fold new and changed comments into the partial, retracting any that disappeared. returns all comments by id."""
+    log.info("removing bot comments...")
+    # keying on id also drops the duplicates thunderdomes tend to produce
+    comments = {c.id: c for c in dt_comments if c.author not in EXCLUDED_AUTHORS}
+
+    gone = [i for i in partial.ledger if i not in comments]
+    fingerprints = {i: fingerprint(c) for i, c in comments.items()}
+    stale = [c for i, c in comments.items() if not partial.is_current(i, fingerprints[i])]
+    log.info(f"{len(stale)} new or changed comments, {len(gone)} gone, {len(comments) - len(stale)} unchanged")
+
+    for comment_id in gone:
+        partial.retract(comment_id)
+    if not stale:
+        return comments
+
+    log.info("adding derived columns...")
+    # created_utc stays as python datetimes, see `to_eastern`
+    created_utc = Series([c.created_utc for c in stale], dtype=object)
+    cdf = DataFrame({"id": [c.id for c in stale], "body": [c.body for c in stale], "created_utc": created_utc})
+    # one pass over the bodies feeds both emoji_count and top_emoji
+    with span("find_emoji") as s:
+        cdf["emoji"] = find_emoji_batch(cdf["body"], cdf["id"])
+        s.rows = len(cdf)
+    cdf["word_count"] = cdf["body"].str.count(" ") + 1
+    cdf["hour"] = to_epoch_seconds(cdf["created_utc"]) // 3600 * 3600
+
+    for c, emoji, word_count, hour in zip(stale, cdf["emoji"], cdf["word_count"], cdf["hour"]):
+        contribution = Contribution(
+            fingerprint=fingerprints[c.id],
+            author=c.author,
+            author_flair_text=c.author_flair_text or "",
+            score=int(c.score),
+            word_count=int(word_count) if c.author else 0,
+            hour=int(hour),
+            emoji=emoji if c.author else [],
+            blank=BLANK_BODIES.get(c.body, ""),
+        )
+        partial.add(c.id, contribution)
+
+    return comments
+
+
+def fingerprint(comment: Comment) -> str:
+    """changes whenever anything the partials care about changes"""
+    return f"{comment.author}|{comment.author_flair_text or ''}|{comment.score}|{body_hash(comment.body)}"
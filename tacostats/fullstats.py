@@ -0,0 +1,76 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from tacostats.models import Comment
+from tacostats.util import neuter_ping
+
+# version 1 was the original record-oriented format, which has no `format` key at all
+FULLSTATS_FORMAT = 2
+
+# lists of lists which need their columns named
+PAIR_COLUMNS = {"top_emoji": ["count", "emoji"]}
+
+
+def compact_full_stats(full_stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert full_stats to the compact format.
+
+    Lists of records become a dict of columns, and comments are stored as their ids and scores only.
+    """
+    compact: Dict[str, Any] = {"format": FULLSTATS_FORMAT}
+    for k, v in full_stats.items():
+        if k == "upvoted_comments":
+            compact[k] = {"id": [c["id"] for c in v], "score": [c["score"] for c in v]}
+        elif k in PAIR_COLUMNS:
+            compact[k] = {col: [i[idx] for i in v] for idx, col in enumerate(PAIR_COLUMNS[k])}
+        elif isinstance(v, list) and v and isinstance(v[0], dict):
+            compact[k] = {col: [i[col] for i in v] for col in v[0]}
+        else:
+            compact[k] = v
+    return compact
+
+
+def expand_full_stats(
+    data: Dict[str, Any],
+    get_comments: Optional[Callable[[List[str]], Iterable[Comment]]] = None,
+    comment_limit: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Convert full_stats from any format back to the original record-oriented format.
+
+    Bodies for the top `comment_limit` (default all) upvoted comments are looked up via `get_comments`. Without it,
+    upvoted_comments only carry their `id` and `score`.
+    """
+    if data.get("format") is None:
+        return data
+    if data["format"] != FULLSTATS_FORMAT:
+        raise ValueError(f"unknown full_stats format: {data['format']}")
+
+    full_stats = {}
+    for k, v in data.items():
+        if k == "format":
+            continue
+        elif k == "upvoted_comments":
+            full_stats[k] = _expand_comments(v, get_comments, comment_limit)
+        elif k in PAIR_COLUMNS:
+            full_stats[k] = [list(i) for i in zip(*[v[col] for col in PAIR_COLUMNS[k]])]
+        elif isinstance(v, dict) and v and all(isinstance(i, list) for i in v.values()):
+            full_stats[k] = _to_records(v)
+        else:
+            full_stats[k] = v
+    return full_stats
+
+
+def _to_records(columns: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+
+def _expand_comments(
+    columns: Dict[str, List[Any]],
+    get_comments: Optional[Callable[[List[str]], Iterable[Comment]]],
+    comment_limit: Optional[int],
+) -> List[Dict[str, Any]]:
+    records = _to_records(columns)[:comment_limit]
+    if not get_comments:
+        return records
+
+    comments = {c.id: c for c in get_comments([r["id"] for r in records])}
+    # neuter pings again, the stored comments are raw
+    return [neuter_ping(comments[r["id"]].to_dict()) if r["id"] in comments else r for r in records]
@@ -4,13 +4,16 @@ import sys
 
 from datetime import date, datetime, timezone
 
-from tacostats.statsio import get_latest_dt_date, write, get_dt_prefix
-from tacostats.config import RECAP
+from tacostats.statsio import StatsIO
+from tacostats.config import COMMENTS_KEY, RECAP
 from tacostats.reddit.dt import fetch_comments
+from tacostats.timings import span, timed, write_timings
 from tacostats.util import get_target_dt_date
 
 NEUTER_RE = re.compile(r"!ping", re.MULTILINE | re.IGNORECASE | re.UNICODE)
 
+statsio = StatsIO()
+
 
 def lambda_handler(event, context):
     harvest_comments()
@@ -25,13 +28,18 @@ def harvest_comments(daysago=None):
     if RECAP or daysago:
         dt_date = get_target_dt_date(1 if not daysago else daysago)
     else:
-        dt_date = get_latest_dt_date()
+        dt_date = statsio.latest_dt_date
+
+    with timed("harvest") as timer:
+        with span("fetch") as s:
+            comments = list(fetch_comments(dt_date))
+            s.rows = len(comments)
+
+        print("writing results...")
+        with span("write") as s:
+            s.bytes = statsio.write(statsio.get_dt_prefix(dt_date), **{COMMENTS_KEY: [c.to_dict() for c in comments]})
 
-    print("writing results...")
-    write(
-        get_dt_prefix(dt_date),
-        comments=list(fetch_comments(dt_date)),
-    )
+    write_timings(statsio, statsio.get_dt_prefix(dt_date), timer)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,71 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+import numpy
+
+from tacostats.partials import StatsPartial
+
+HOUR = 3600
+
+
+@dataclass
+class HourlyTable:
+    """One row per author per one-hour span they were active in, as parallel arrays.
+
+    Hours are stored as bucket numbers counted from `start`, so per-hour sums are a single `bincount`.
+    """
+
+    start: int = 0
+    hours: int = 0
+    bucket: numpy.ndarray = field(default_factory=lambda: numpy.zeros(0, dtype=numpy.int64))
+    authors: numpy.ndarray = field(default_factory=lambda: numpy.zeros(0, dtype=object))
+    # position of each row's author in alphabetical order, used for tie-breaks
+    author_rank: numpy.ndarray = field(default_factory=lambda: numpy.zeros(0, dtype=numpy.int64))
+    comment_count: numpy.ndarray = field(default_factory=lambda: numpy.zeros(0, dtype=numpy.int64))
+    word_count: numpy.ndarray = field(default_factory=lambda: numpy.zeros(0, dtype=numpy.int64))
+
+    @staticmethod
+    def from_partial(partial: StatsPartial) -> "HourlyTable":
+        if not partial.author_hours:
+            return HourlyTable()
+        rows = [(hour, author, s[0], s[1]) for hour, authors in partial.author_hours.items() for author, s in authors.items()]
+        hour, authors, comment_count, word_count = zip(*rows)
+        hour = numpy.array(hour, dtype=numpy.int64)
+        authors = numpy.array(authors, dtype=object)
+        start = int(hour.min())
+        return HourlyTable(
+            start=start,
+            hours=int(hour.max() - start) // HOUR + 1,
+            bucket=(hour - start) // HOUR,
+            authors=authors,
+            author_rank=numpy.unique(authors, return_inverse=True)[1],
+            comment_count=numpy.array(comment_count, dtype=numpy.int64),
+            word_count=numpy.array(word_count, dtype=numpy.int64),
+        )
+
+    def totals(self, column: str) -> numpy.ndarray:
+        """Sum a column for every hour from the first to the last, quiet hours included."""
+        return numpy.bincount(self.bucket, weights=getattr(self, column), minlength=self.hours).astype(numpy.int64)
+
+    def top(self, column: str, keep_ties: bool = False) -> List[Dict[str, Any]]:
+        """The author(s) with the highest `column` in each hour, ties going to the author's name unless `keep_ties`.
+
+        Returns:
+            [{'created_et': int, 'author': str, <column>: int}, ...]
+        """
+        if not len(self.bucket):
+            return []
+        values = getattr(self, column)
+        # hour first, then highest value, then author name
+        order = numpy.lexsort((self.author_rank, -values, self.bucket))
+        firsts = order[numpy.r_[True, self.bucket[order][1:] != self.bucket[order][:-1]]]
+        if keep_ties:
+            best = numpy.zeros(self.hours, dtype=values.dtype)
+            best[self.bucket[firsts]] = values[firsts]
+            tied = numpy.flatnonzero(values == best[self.bucket])
+            firsts = tied[numpy.lexsort((self.author_rank[tied], self.bucket[tied]))]
+
+        created_et = (self.bucket[firsts] * HOUR + self.start).tolist()
+        return [
+            {"created_et": h, "author": a, column: v} for h, a, v in zip(created_et, self.authors[firsts].tolist(), values[firsts].tolist())
+        ]
@@ -1,24 +1,38 @@
 import logging
 import os
-import re
 
 from datetime import datetime, timezone
-from io import StringIO
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection, wait
 import sys
-from typing import Generator, Iterable, Optional, Tuple
+from typing import Dict, Generator, Iterable, List, Optional, Tuple
 
-import contractions
 import nltk
 
-from markdown import Markdown
-from pandas import DataFrame
-
 from tacostats.statsio import StatsIO
+from tacostats.text import clean_texts
 from tacostats.reddit import report
 from tacostats.reddit.dt import fetch_comments
-from tacostats.config import RECAP, STOPWORDS, COMMON_WORDS, CHUNK_TYPES, BOT_TRIGGERS, EXCLUDED_AUTHORS, USE_EXISTING
+from tacostats.config import (
+    RECAP,
+    EXCLUDED_AUTHORS,
+    KEYWORD_MIN_SCORE,
+    KEYWORD_PARSE_CACHE,
+    KEYWORD_PARTIAL_KEY,
+    KEYWORD_TRENDS,
+    KEYWORD_WORKERS,
+    KEYWORDS_KEY,
+    NLTK_CORPORA,
+    NLTK_DATA_DIR,
+    USE_EXISTING,
+)
+from tacostats.lexicon import CHUNK_TYPE_SET, filter_tokens, has_bot_trigger, is_common, is_junk
 from tacostats.models import Comment
-from tacostats.tacostats.util import get_target_dt_date
+from tacostats.parse_cache import ParseCache, read_parse_cache, write_parse_cache
+from tacostats.partials import KeywordContribution, KeywordPartial
+from tacostats.timings import span, timed, write_timings
+from tacostats.trends import read_baseline, refresh_baseline, write_baseline
+from tacostats.util import body_hash, get_target_dt_date
 
 logging.basicConfig(level=logging.DEBUG)
 log = logging.getLogger(__name__)
@@ -29,15 +43,12 @@ logging.getLogger("botocore").setLevel(logging.WARNING)
 
 statsio = StatsIO()
 
-# before importing pattern need to download the reqd corpora to /tmp, but only in remote Lambda
-# for whatever reason, this doesn't appear to be necessary locally, even using sam invoke
-if os.getenv("AWS_EXECUTION_ENV", "").startswith("AWS_Lambda"):
-    nltk.data.path.append("/tmp")
-    for corpus in ["wordnet", "wordnet_ic", "sentiwordnet", "stopwords"]:
-        log.debug(f"downloading nltk corpus: {corpus}")
-        nltk.download(corpus, download_dir="/tmp")
+# comments cleaned and parsed at a time. big enough for batched cleanup to pay off, small enough that only a sliver
+# of the dt is held as cleaned text at once
+PARSE_BATCH_SIZE = 256
 
-from pattern.en import parsetree  # type: ignore
+# pattern is slow to import and only needed when there's something to parse, see `_get_parsetree`
+_parsetree = None
 
 
 def lambda_handler(event, context):
@@ -54,44 +65,92 @@ def process_keywords(daysago: Optional[int] = 0):
     if RECAP or daysago:
         dt_date = get_target_dt_date(1 if not daysago else daysago)
 
-    dt_comments: Iterable[Comment] = []
-    if USE_EXISTING:
-        log.info("using existing comments...")
-        dt_comments = statsio.read_comments(dt_date)
-    else:
-        log.info("getting comments from reddit...")
-        dt_comments = fetch_comments(dt_date)
-
-    log.info("processing comments...")
-    processed = list(_process_comments(dt_comments))
-    log.info(f"keyword count: {len(processed)}")
-    filtered = [(_format_keyword(i[0]), i[1]) for i in processed if i[1] > 3]
-    keywords = {
-        "keyword_scores": filtered,
-        "keywords_h1": [i[0] for i in filtered[:10]],
-        "keywords_h2": [i[0] for i in filtered[10:30]],
-        "keywords_h3": [i[0] for i in filtered[30:60]],
-        "keywords_h4": [i[0] for i in filtered[60:120]],
-        "keywords_h5": [i[0] for i in filtered[120:180]],
-        "keywords_h6": [i[0] for i in filtered[180:240]],
-    }
-
-    log.info("writing stats...")
-    statsio.write(statsio.get_dt_prefix(dt_date), keywords=keywords)
-
-    log.info("posting comment...")
-    report.post(keywords, "keywords.md.j2")
+    dt_prefix = statsio.get_dt_prefix(dt_date)
+    with timed("keywords") as timer:
+        with span("fetch") as s:
+            if USE_EXISTING:
+                log.info("using existing comments...")
+                dt_comments = list(statsio.read_comments(dt_date))
+            else:
+                log.info("getting comments from reddit...")
+                dt_comments = list(fetch_comments(dt_date))
+            s.rows = len(dt_comments)
+
+        log.info("reading keyword partials from earlier runs...")
+        with span("read_partial") as s:
+            partial = _read_partial(dt_prefix)
+            s.rows = len(partial.ledger)
+
+        parse_cache = None
+        if KEYWORD_PARSE_CACHE:
+            with span("read_parse_cache") as s:
+                parse_cache = read_parse_cache(statsio, dt_prefix)
+                s.rows = len(parse_cache.comments)
+
+        log.info("processing comments...")
+        with span("process_comments") as s:
+            processed = list(_process_comments(dt_comments, partial, parse_cache))
+            s.rows = len(processed)
+
+        if parse_cache is not None:
+            with span("write_parse_cache") as s:
+                s.bytes = write_parse_cache(statsio, dt_prefix, parse_cache)
+        log.info(f"keyword count: {len(processed)}")
+
+        trends = []
+        if KEYWORD_TRENDS:
+            log.info("ranking keywords against the baseline...")
+            with span("trends") as s:
+                baseline = refresh_baseline(statsio, read_baseline(statsio), dt_date)
+                trends = baseline.rank(processed)
+                processed = [(keyword, score) for keyword, score, _ in trends]
+                s.bytes = write_baseline(statsio, baseline)
+
+        filtered = [(_format_keyword(i[0]), i[1]) for i in processed if i[1] >= KEYWORD_MIN_SCORE]
+        keywords = {
+            "keyword_scores": filtered,
+            "keywords_h1": [i[0] for i in filtered[:10]],
+            "keywords_h2": [i[0] for i in filtered[10:30]],
+            "keywords_h3": [i[0] for i in filtered[30:60]],
+            "keywords_h4": [i[0] for i in filtered[60:120]],
+            "keywords_h5": [i[0] for i in filtered[120:180]],
+            "keywords_h6": [i[0] for i in filtered[180:240]],
+        }
+        if trends:
+            keywords["keyword_trends"] = [
+                (_format_keyword(k), score, surprise) for k, score, surprise in trends if score >= KEYWORD_MIN_SCORE
+            ]
+
+        log.info("writing stats...")
+        with span("write") as s:
+            s.bytes = statsio.write(dt_prefix, **{KEYWORDS_KEY: keywords, KEYWORD_PARTIAL_KEY: partial.to_dict()})
+
+        log.info("posting comment...")
+        report.post(keywords, "keywords.md.j2")
+
+    write_timings(statsio, dt_prefix, timer)
 
     done = datetime.now(timezone.utc)
     duration = (done - start).total_seconds()
     log.info(f"Finished at {done.isoformat()}, took {duration} seconds")
 
 
-def _parse_comment(comment: str) -> Generator[Tuple[float, str], None, None]:
-    """use pattern to parse keywords out of a comment"""
-    comment_str = _clean(comment)
+def _read_partial(dt_prefix: str) -> KeywordPartial:
+    """read the keyword partials left by earlier runs against this dt, starting fresh if there are none"""
+    try:
+        if partial := KeywordPartial.from_dict(statsio.read(dt_prefix, KEYWORD_PARTIAL_KEY)):
+            log.info(f"found keyword partials covering {len(partial.ledger)} comments")
+            return partial
+        log.info("stored keyword partials are from an older version, rebuilding...")
+    except KeyError:
+        log.info("no keyword partials found, starting fresh...")
+    return KeywordPartial()
+
+
+def _parse_comment(comment_str: str) -> Generator[Tuple[float, str], None, None]:
+    """use pattern to parse keywords out of a comment, which should already have been cleaned"""
     try:
-        parsed = parsetree(
+        parsed = _get_parsetree()(
             comment_str,
             tokenize=True,  # Split punctuation marks from words?
             tags=True,  # Parse part-of-speech tags? (NN, JJ, ...)
@@ -110,6 +169,32 @@ def _parse_comment(comment: str) -> Generator[Tuple[float, str], None, None]:
             yield from _parse_sentence(sentence)
 
 
+def _get_parsetree():
+    """load pattern's parser on first use, making sure the corpora it needs are available first"""
+    global _parsetree
+    if _parsetree is None:
+        with span("load_parser"):
+            _find_corpora()
+            from pattern.en import parsetree  # type: ignore
+
+            _parsetree = parsetree
+    return _parsetree
+
+
+def _find_corpora():
+    """point nltk at the corpora baked into the image, downloading any which are missing to /tmp"""
+    if NLTK_DATA_DIR not in nltk.data.path:
+        nltk.data.path.insert(0, NLTK_DATA_DIR)
+    for corpus in NLTK_CORPORA:
+        try:
+            nltk.data.find(f"corpora/{corpus}")
+        except LookupError:
+            log.warning(f"nltk corpus {corpus} not found in {NLTK_DATA_DIR}, downloading...")
+            if "/tmp" not in nltk.data.path:
+                nltk.data.path.append("/tmp")
+            nltk.download(corpus, download_dir="/tmp", quiet=True)
+
+
 def _parse_sentence(sentence) -> Generator[Tuple[float, str], None, None]:
     """flip through each chunk of a sentence, scoring and cleaning it."""
     for chunk in sentence.chunks:
@@ -120,57 +205,139 @@ def _parse_sentence(sentence) -> Generator[Tuple[float, str], None, None]:
 
 def _clean_chunk(chunk) -> str:
     """remove stopwords from final chunk"""
-    goodstr = lambda s: 2 < len(s) < 40 and s not in STOPWORDS
-    strings = chunk.string.split(" ")
-    return " ".join([i for i in strings if goodstr(i)])
+    return " ".join(filter_tokens(chunk.string.split(" ")))
 
 
 def _score_chunk(chunk) -> float:
     """rates a sentence chunk by the type of word, how many other chunks it relates to, and filters junk words."""
     score = 0
     score += len(chunk.relations) / 2 if len(chunk.relations) > 0 else 0
-    score += 1 if chunk.type in CHUNK_TYPES else 0
+    score += 1 if chunk.type in CHUNK_TYPE_SET else 0
     score += 1 if chunk.role is not None else 0
     score += 0.5 if len(chunk.modifiers) > 0 else 0
 
-    junk_words = COMMON_WORDS + STOPWORDS + BOT_TRIGGERS
-    score = 0 if chunk.head.string in junk_words else score
-    score = 0 if any([i in chunk.string for i in BOT_TRIGGERS]) else score
+    score = 0 if is_junk(chunk.head.string) or has_bot_trigger(chunk.string) else score
     return score
 
 
-def _process_comments(comments: Iterable[Comment]) -> Generator[Tuple[str, float], None, None]:
-    """pull significant keywords from comment list"""
-    cdf = DataFrame([c.to_dict() for c in comments])  # type: ignore
-
-    log.debug("removing bot comments...")
-    # pandas syntax is dumb so pylance (rightly) thinks this returns a series
-    cdf: DataFrame = cdf[~cdf.author.isin(EXCLUDED_AUTHORS)]  # type: ignore
-
-    log.debug(f"got {cdf.count()} comments")
-
-    # parse each comment, sorting the results by score
-    parsed_comments: DataFrame = cdf[["body"]].apply(lambda x: [sorted(_parse_comment(c), key=lambda y: y[0], reverse=True) for c in x])
-
-    # explode each result (a list of tuples) into rows of tuples, drop NaNs
-    parsed_comments = parsed_comments.explode("body").dropna()
+def _process_comments(
+    comments: Iterable[Comment],
+    partial: Optional[KeywordPartial] = None,
+    parse_cache: Optional[ParseCache] = None,
+    workers: int = KEYWORD_WORKERS,
+) -> Generator[Tuple[str, float], None, None]:
+    """pull significant keywords from comment list, highest scoring first.
 
-    # create a new dataframe, turning each tuple element into a column and filter common words (why isn't the scoring doing this??)
-    keywords_df = DataFrame(parsed_comments["body"].to_list(), columns=["score", "keyword"])
-    keywords_df = keywords_df.loc[keywords_df["score"] > 1]
-    keywords_df = keywords_df.loc[~keywords_df["keyword"].isin(COMMON_WORDS)]
-
-    # group matching keywords and sum their scores
-    keywords_df = keywords_df.groupby("keyword").sum().reset_index().sort_values(["score"], ascending=False)  # type: ignore
-
-    log.debug(f"keywords_df count {keywords_df.count()}")
-    for _, row in keywords_df.iterrows():
-        if row["score"] >= 3:
-            yield _get_keyword_tuple(row)
+    comments are folded into `partial`, so only those it hasn't seen before (or which were edited since) need to be
+    parsed. those stream through the parse cache, if there is one, and the parser a batch at a time, straight into
+    the partial."""
+    partial = partial if partial is not None else KeywordPartial()
 
+    log.debug("removing bot comments...")
+    stale = [c for c in comments if c.author not in EXCLUDED_AUTHORS and not partial.is_current(c.id, body_hash(c.body))]
+    log.info(f"partials cover {len(partial.ledger)} comments, {len(stale)} new or edited")
+
+    with span("parse") as s:
+        for comment, chunks in _parse_comments(stale, parse_cache, workers):
+            keywords = [(score, keyword) for score, keyword in chunks if score > 1 and not is_common(keyword)]
+            partial.add(comment.id, KeywordContribution(body_hash(comment.body), int(comment.created_utc.timestamp()), keywords))
+        s.rows = len(stale)
+
+    log.debug(f"keyword count {len(partial.keywords)}")
+    yield from partial.get_scores(min_score=KEYWORD_MIN_SCORE)
+
+
+def _parse_comments(
+    comments: List[Comment], parse_cache: Optional[ParseCache] = None, workers: int = KEYWORD_WORKERS
+) -> Generator[Tuple[Comment, List[Tuple[float, str]]], None, None]:
+    """scored chunks for each comment, straight from the parse cache where possible. comments missing from it (or
+    edited since they were cached) are parsed and added to it. without a cache everything is parsed."""
+    unparsed: Dict[str, Comment] = {}
+    for comment in comments:
+        if parse_cache is not None and (cached := parse_cache.get(comment)) is not None:
+            yield comment, cached
+        else:
+            unparsed[comment.id] = comment
+    log.info(f"{len(comments) - len(unparsed)} comments already parsed, {len(unparsed)} to go")
+
+    workers = workers or os.cpu_count() or 1
+    bodies = [(c.id, c.body) for c in unparsed.values()]
+    batches = _parse_parallel(bodies, workers) if workers > 1 and len(bodies) > workers else _parse_batches(bodies)
+    for batch in batches:
+        for comment_id, chunks in batch.items():
+            if parse_cache is not None:
+                parse_cache.put(unparsed[comment_id], chunks)
+            yield unparsed[comment_id], chunks
+
+
+def _parse_batches(bodies: List[Tuple[str, str]]) -> Generator[Dict[str, List[Tuple[float, str]]], None, None]:
+    """parse (comment id, body) pairs a batch at a time, yielding each batch's scored chunks by id"""
+    for i in range(0, len(bodies), PARSE_BATCH_SIZE):
+        yield _parse_bodies(bodies[i : i + PARSE_BATCH_SIZE])
+
+
+def _parse_bodies(bodies: Iterable[Tuple[str, str]]) -> Dict[str, List[Tuple[float, str]]]:
+    """parse (comment id, body) pairs, returning each comment's scored chunks by id"""
+    bodies = list(bodies)
+    cleaned = clean_texts(body for _, body in bodies)
+    return {comment_id: list(_parse_comment(comment_str)) for (comment_id, _), comment_str in zip(bodies, cleaned)}
+
+
+def _parse_parallel(bodies: List[Tuple[str, str]], workers: int) -> Generator[Dict[str, List[Tuple[float, str]]], None, None]:
+    """split the comments across worker processes, each with its own parser, yielding batches as they finish.
+
+    multiprocessing.Pool (and concurrent.futures) need /dev/shm, which lambda doesn't have. pipes work everywhere.
+    """
+    log.info(f"parsing {len(bodies)} comments across {workers} processes...")
+    receivers: List[Connection] = []
+    processes: List[Process] = []
+    # every Nth comment rather than contiguous blocks, so one worker doesn't get stuck with a thread full of essays
+    for shard in [bodies[i::workers] for i in range(workers)]:
+        receiver, sender = Pipe(duplex=False)
+        process = Process(target=_parse_worker, args=(shard, sender), daemon=True)
+        process.start()
+        # the parent's copy has to be closed for recv() to notice if a worker dies
+        sender.close()
+        receivers.append(receiver)
+        processes.append(process)
 
-def _get_keyword_tuple(row) -> Tuple[str, float]:
-    return (row["keyword"], row["score"])
+    try:
+        pending = list(receivers)
+        while pending:
+            for receiver in wait(pending):
+                try:
+                    result = receiver.recv()  # type: ignore
+                except EOFError:
+                    process = processes[receivers.index(receiver)]  # type: ignore
+                    process.join()
+                    raise RuntimeError(f"keyword worker exited early with code {process.exitcode}")
+                if isinstance(result, Exception):
+                    raise result
+                if result is None:
+                    pending.remove(receiver)
+                else:
+                    yield result
+    finally:
+        # on the way out early (an error, or the caller stopping) the other workers can be stuck sending to a full pipe
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for receiver in receivers:
+            receiver.close()
+        for process in processes:
+            process.join()
+
+
+def _parse_worker(bodies: List[Tuple[str, str]], sender: Connection):
+    """runs in a worker process, sends back each batch as it's parsed then None, or whatever went wrong"""
+    try:
+        for batch in _parse_batches(bodies):
+            sender.send(batch)
+        sender.send(None)
+    except Exception as e:
+        sender.send(e)
+    finally:
+        sender.close()
 
 
 def _format_keyword(keyword) -> str:
@@ -178,41 +345,6 @@ def _format_keyword(keyword) -> str:
     return keyword.title()
 
 
-def _clean(text: str) -> str:
-    """Normalise strings by stripping markdown and URLs, lowercasing, and expanding contractions."""
-    text = _unmark(text)
-    text = re.sub(r"https?://\S+", "", text, flags=re.MULTILINE)
-    text = text.lower()
-    text = contractions.fix(text)  # type: ignore
-    return text
-
-
-### stuff to remove markdown
-# https://stackoverflow.com/questions/761824/python-how-to-convert-markdown-formatted-text-to-text
-def _unmark_element(element, stream=None):
-    """Clean markdown from comment"""
-    if stream is None:
-        stream = StringIO()
-    if element.text:
-        stream.write(element.text)
-    for sub in element:
-        _unmark_element(sub, stream)
-    if element.tail:
-        stream.write(element.tail)
-    return stream.getvalue()
-
-
-# patching Markdown
-Markdown.output_formats["plain"] = _unmark_element  # type: ignore
-__md = Markdown(output_format="plain")  # type: ignore
-__md.stripTopLevelTags = False  # type: ignore
-
-
-def _unmark(text):
-    """strip markdown from comment"""
-    return __md.convert(text)
-
-
 if __name__ == "__main__":
     daysago = int(sys.argv[1]) if len(sys.argv) > 1 else None
     process_keywords(daysago=daysago)
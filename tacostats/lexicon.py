@@ -0,0 +1,40 @@
+import re
+
+from typing import Iterable, List, Optional, Pattern
+
+from tacostats.config import BOT_TRIGGERS, CHUNK_TYPES, COMMON_WORDS, STOPWORDS
+
+# the word lists from config, built once for the keyword scoring to share
+
+STOPWORD_SET = frozenset(STOPWORDS)
+COMMON_WORD_SET = frozenset(COMMON_WORDS)
+CHUNK_TYPE_SET = frozenset(CHUNK_TYPES)
+# words which can't head a keyword
+JUNK_WORD_SET = COMMON_WORD_SET | STOPWORD_SET | frozenset(BOT_TRIGGERS)
+
+
+def _compile_triggers(triggers: Iterable[str]) -> Optional[Pattern]:
+    # longest first so overlapping triggers don't matter, and no pattern at all rather than one matching everything
+    triggers = sorted(set(triggers), key=len, reverse=True)
+    return re.compile("|".join(re.escape(t) for t in triggers)) if triggers else None
+
+
+BOT_TRIGGER_REGEX = _compile_triggers(BOT_TRIGGERS)
+
+
+def is_junk(word: str) -> bool:
+    return word in JUNK_WORD_SET
+
+
+def is_common(word: str) -> bool:
+    return word in COMMON_WORD_SET
+
+
+def has_bot_trigger(text: str) -> bool:
+    """True if any bot trigger appears anywhere in `text`, including inside other words"""
+    return BOT_TRIGGER_REGEX is not None and BOT_TRIGGER_REGEX.search(text) is not None
+
+
+def filter_tokens(tokens: Iterable[str], min_len: int = 3, max_len: int = 39) -> List[str]:
+    """Drop stopwords and tokens too short or too long to be worth keeping"""
+    return [t for t in tokens if min_len <= len(t) <= max_len and t not in STOPWORD_SET]
@@ -2,6 +2,7 @@ import json
 import logging
 
 from collections import namedtuple
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 
 from openai import OpenAI
@@ -27,9 +28,19 @@ class MaxTokensExceededError(Exception):
         self.max_tokens = max_threads
 
 
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """tiktoken's encoding for a model. These are slow to load, so each is only loaded once."""
+    return tiktoken.encoding_for_model(model)
+
+
 def estimate_tokens(text: str, model) -> int:
-    encoding = tiktoken.encoding_for_model(model)
-    return len(encoding.encode(text))
+    return len(get_encoding(model).encode(text))
+
+
+def estimate_tokens_batch(texts: List[str], model) -> List[int]:
+    """`estimate_tokens` for many texts at once"""
+    return [len(tokens) for tokens in get_encoding(model).encode_batch(texts)]
 
 
 def build_prompts(
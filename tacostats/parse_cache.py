@@ -0,0 +1,67 @@
+import logging
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from tacostats.config import PARSE_CACHE_KEY
+from tacostats.models import Comment
+from tacostats.statsio import StatsIO
+from tacostats.util import body_hash
+
+# bump whenever parsing or scoring changes, older caches are thrown away and rebuilt
+PARSE_CACHE_VERSION = 1
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class ParseCache:
+    """Comment id -> [body hash, [[score, chunk], ...]] for one DT. An edited comment's hash no longer matches, so
+    it's parsed again."""
+
+    version: int = PARSE_CACHE_VERSION
+    comments: Dict[str, List[Any]] = field(default_factory=dict)
+    # comments parsed since the cache was loaded
+    unsaved: int = field(default=0, compare=False)
+
+    def get(self, comment: Comment) -> Optional[List[Tuple[float, str]]]:
+        """The comment's scored chunks, or None if it hasn't been parsed or was edited since."""
+        if (cached := self.comments.get(comment.id)) and cached[0] == body_hash(comment.body):
+            return [(score, chunk) for score, chunk in cached[1]]
+        return None
+
+    def put(self, comment: Comment, parsed: List[Tuple[float, str]]):
+        self.comments[comment.id] = [body_hash(comment.body), [[score, chunk] for score, chunk in parsed]]
+        self.unsaved += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"version": self.version, "comments": self.comments}
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> Optional["ParseCache"]:
+        """Load a stored cache. Returns None if it was written by an incompatible version."""
+        if data.get("version") != PARSE_CACHE_VERSION:
+            return None
+        return ParseCache(comments=data["comments"])
+
+
+def read_parse_cache(statsio: StatsIO, dt_prefix: str) -> ParseCache:
+    """Read a DT's parse cache, starting a fresh one if there isn't a usable one stored."""
+    try:
+        if cache := ParseCache.from_dict(statsio.read(dt_prefix, PARSE_CACHE_KEY)):
+            log.info(f"found {len(cache.comments)} parsed comments")
+            return cache
+        log.info("stored parse cache is from an older version, rebuilding...")
+    except KeyError:
+        log.info("no parse cache found, starting fresh...")
+    return ParseCache()
+
+
+def write_parse_cache(statsio: StatsIO, dt_prefix: str, cache: ParseCache) -> int:
+    """Store a DT's parse cache, skipping the write if nothing new was parsed. Returns bytes written."""
+    if not cache.unsaved:
+        return 0
+    log.info(f"saving {cache.unsaved} newly parsed comments")
+    written = statsio.write(dt_prefix, **{PARSE_CACHE_KEY: cache.to_dict()})
+    cache.unsaved = 0
+    return written
@@ -0,0 +1,263 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# bump whenever the shape of the stored partials changes, older partials will be rebuilt from scratch
+PARTIAL_VERSION = 1
+KEYWORD_PARTIAL_VERSION = 1
+
+BLANK_BODIES = {"[deleted]": "deleted", "[removed]": "removed"}
+
+
+@dataclass
+class Contribution:
+    """Everything a single comment added to a partial. Kept so that it can be retracted when the comment changes."""
+
+    fingerprint: str
+    author: str
+    author_flair_text: str
+    score: int
+    word_count: int
+    hour: int
+    emoji: List[str] = field(default_factory=list)
+    blank: str = ""
+
+    def to_list(self) -> List[Any]:
+        return [self.fingerprint, self.author, self.author_flair_text, self.score, self.word_count, self.hour, self.emoji, self.blank]
+
+    @staticmethod
+    def from_list(data: List[Any]) -> "Contribution":
+        return Contribution(*data)
+
+
+@dataclass
+class StatsPartial:
+    """Mergeable aggregates for one or more DTs.
+
+    Everything except the ledger is a sum, so partials from different harvest windows (or days) can be added
+    together. The ledger records each comment's contribution so that an edited, rescored or deleted comment can be
+    swapped out without recounting the rest of the DT.
+    """
+
+    version: int = PARTIAL_VERSION
+    blanks: Dict[str, int] = field(default_factory=lambda: {"deleted": 0, "removed": 0, "other_blank": 0})
+    # author -> [comment_count, word_count, score, emoji_count]
+    authors: Dict[str, List[int]] = field(default_factory=dict)
+    # author -> flair -> comment_count
+    flairs: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    # hour (unix timestamp) -> [comment_count, word_count]
+    hours: Dict[int, List[int]] = field(default_factory=dict)
+    # hour (unix timestamp) -> author -> [comment_count, word_count]
+    author_hours: Dict[int, Dict[str, List[int]]] = field(default_factory=dict)
+    # emoji -> uses
+    emoji: Dict[str, int] = field(default_factory=dict)
+    # comment id -> contribution
+    ledger: Dict[str, Contribution] = field(default_factory=dict)
+
+    def is_current(self, comment_id: str, fingerprint: str) -> bool:
+        """True if the comment has already been folded in and hasn't changed since."""
+        known = self.ledger.get(comment_id)
+        return known is not None and known.fingerprint == fingerprint
+
+    def add(self, comment_id: str, contribution: Contribution):
+        """Fold a comment's contribution in, replacing whatever it contributed previously."""
+        self.retract(comment_id)
+        self.ledger[comment_id] = contribution
+        self._apply(contribution, 1)
+
+    def retract(self, comment_id: str):
+        """Remove a comment's contribution entirely. Does nothing for unknown comments."""
+        if contribution := self.ledger.pop(comment_id, None):
+            self._apply(contribution, -1)
+
+    def merge(self, other: "StatsPartial") -> "StatsPartial":
+        """Add another partial's sums into this one. A comment in both is only counted once, as `other` has it."""
+        for k, v in other.blanks.items():
+            self.blanks[k] = self.blanks.get(k, 0) + v
+        for author, sums in other.authors.items():
+            _add_sums(self.authors, author, sums)
+        for author, flairs in other.flairs.items():
+            for flair, count in flairs.items():
+                _add_count(self.flairs.setdefault(author, {}), flair, count)
+        for hour, sums in other.hours.items():
+            _add_sums(self.hours, hour, sums)
+        for hour, authors in other.author_hours.items():
+            for author, sums in authors.items():
+                _add_sums(self.author_hours.setdefault(hour, {}), author, sums)
+        for e, count in other.emoji.items():
+            _add_count(self.emoji, e, count)
+        for comment_id, contribution in other.ledger.items():
+            # `other`'s sums already include the comment, so only this side's copy needs taking back out
+            if known := self.ledger.get(comment_id):
+                self._apply(known, -1)
+            self.ledger[comment_id] = contribution
+        return self
+
+    def get_flair(self, author: str) -> str:
+        """The flair an author used most often."""
+        flairs = self.flairs.get(author)
+        return max(flairs, key=flairs.__getitem__) if flairs else ""
+
+    def _apply(self, c: Contribution, sign: int):
+        if c.blank in BLANK_BODIES.values():
+            self.blanks[c.blank] += sign
+        if not c.author:
+            self.blanks["other_blank"] += sign
+            return
+
+        _add_sums(self.authors, c.author, [sign, sign * c.word_count, sign * c.score, sign * len(c.emoji)])
+        _add_count(self.flairs.setdefault(c.author, {}), c.author_flair_text, sign)
+        _add_sums(self.hours, c.hour, [sign, sign * c.word_count])
+        _add_sums(self.author_hours.setdefault(c.hour, {}), c.author, [sign, sign * c.word_count])
+        for e in c.emoji:
+            _add_count(self.emoji, e, sign)
+
+        # prune anything which has been retracted down to nothing
+        if not self.flairs[c.author]:
+            del self.flairs[c.author]
+        if not self.author_hours[c.hour]:
+            del self.author_hours[c.hour]
+
+    def to_dict(self, include_ledger: bool = True) -> Dict[str, Any]:
+        """Serialize the partial. Without the ledger it can still be merged, but can no longer be updated."""
+        data = {
+            "version": self.version,
+            "blanks": self.blanks,
+            "authors": self.authors,
+            "flairs": self.flairs,
+            "hours": self.hours,
+            "author_hours": self.author_hours,
+            "emoji": self.emoji,
+        }
+        if include_ledger:
+            data["ledger"] = {k: v.to_list() for k, v in self.ledger.items()}
+        return data
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> Optional["StatsPartial"]:
+        """Load a stored partial. Returns None if it was written by an incompatible version."""
+        if data.get("version") != PARTIAL_VERSION:
+            return None
+        # json turns the int keys into strings
+        return StatsPartial(
+            blanks=data["blanks"],
+            authors=data["authors"],
+            flairs=data["flairs"],
+            hours={int(k): v for k, v in data["hours"].items()},
+            author_hours={int(k): v for k, v in data["author_hours"].items()},
+            emoji=data["emoji"],
+            ledger={k: Contribution.from_list(v) for k, v in data.get("ledger", {}).items()},
+        )
+
+
+@dataclass
+class KeywordContribution:
+    """The keywords a single comment added to a keyword partial, already filtered down to the ones which count."""
+
+    fingerprint: str
+    created: int
+    # [[score, keyword], ...]
+    keywords: List[Tuple[float, str]] = field(default_factory=list)
+
+    def to_list(self) -> List[Any]:
+        return [self.fingerprint, self.created, [list(k) for k in self.keywords]]
+
+    @staticmethod
+    def from_list(data: List[Any]) -> "KeywordContribution":
+        return KeywordContribution(data[0], data[1], [(score, keyword) for score, keyword in data[2]])
+
+
+@dataclass
+class KeywordPartial:
+    """Running keyword tallies for one or more DTs, updated a comment at a time.
+
+    Works the same way as StatsPartial: sums plus a ledger of what each comment contributed, so that intraday runs
+    only need to parse what's new or edited. `last_seen` isn't rolled back when a comment is retracted.
+    """
+
+    version: int = KEYWORD_PARTIAL_VERSION
+    # keyword -> [score, count, last_seen (unix timestamp)]
+    keywords: Dict[str, List[float]] = field(default_factory=dict)
+    # comment id -> contribution
+    ledger: Dict[str, KeywordContribution] = field(default_factory=dict)
+
+    def is_current(self, comment_id: str, fingerprint: str) -> bool:
+        """True if the comment has already been folded in and hasn't changed since."""
+        known = self.ledger.get(comment_id)
+        return known is not None and known.fingerprint == fingerprint
+
+    def add(self, comment_id: str, contribution: KeywordContribution):
+        """Fold a comment's keywords in, replacing whatever it contributed previously."""
+        self.retract(comment_id)
+        self.ledger[comment_id] = contribution
+        self._apply(contribution, 1)
+
+    def retract(self, comment_id: str):
+        """Remove a comment's keywords entirely. Does nothing for unknown comments."""
+        if contribution := self.ledger.pop(comment_id, None):
+            self._apply(contribution, -1)
+
+    def merge(self, other: "KeywordPartial") -> "KeywordPartial":
+        """Add another partial's tallies into this one. A comment in both is only counted once, as `other` has it."""
+        for keyword, (score, count, last_seen) in other.keywords.items():
+            self._add_keyword(keyword, score, count, last_seen)
+        for comment_id, contribution in other.ledger.items():
+            if known := self.ledger.get(comment_id):
+                self._apply(known, -1)
+            self.ledger[comment_id] = contribution
+        return self
+
+    def get_scores(self, min_score: float = 0) -> List[Tuple[str, float]]:
+        """(keyword, score) for every keyword scoring at least `min_score`, highest first and ties by keyword"""
+        scores = [(k, v[0]) for k, v in self.keywords.items() if v[0] >= min_score]
+        return sorted(scores, key=lambda i: (-i[1], i[0]))
+
+    def _apply(self, c: KeywordContribution, sign: int):
+        for score, keyword in c.keywords:
+            self._add_keyword(keyword, sign * score, sign, c.created)
+
+    def _add_keyword(self, keyword: str, score: float, count: int, last_seen: float):
+        current = self.keywords.get(keyword)
+        if current is None:
+            self.keywords[keyword] = [score, count, last_seen]
+            return
+        current[0] += score
+        current[1] += count
+        current[2] = max(current[2], last_seen)
+        if current[1] == 0:
+            del self.keywords[keyword]
+
+    def to_dict(self, include_ledger: bool = True) -> Dict[str, Any]:
+        """Serialize the partial. Without the ledger it can still be merged, but can no longer be updated."""
+        data: Dict[str, Any] = {"version": self.version, "keywords": self.keywords}
+        if include_ledger:
+            data["ledger"] = {k: v.to_list() for k, v in self.ledger.items()}
+        return data
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> Optional["KeywordPartial"]:
+        """Load a stored partial. Returns None if it was written by an incompatible version."""
+        if data.get("version") != KEYWORD_PARTIAL_VERSION:
+            return None
+        return KeywordPartial(
+            keywords=data["keywords"],
+            ledger={k: KeywordContribution.from_list(v) for k, v in data.get("ledger", {}).items()},
+        )
+
+
+def _add_sums(sums: Dict[Any, List[int]], key: Any, values: List[int]):
+    """Element-wise add `values` to `sums[key]`, dropping the key once its count (the first element) hits zero."""
+    current = sums.get(key)
+    if current is None:
+        sums[key] = list(values)
+        return
+    for i, v in enumerate(values):
+        current[i] += v
+    if current[0] == 0:
+        del sums[key]
+
+
+def _add_count(counts: Dict[Any, int], key: Any, value: int):
+    """Add `value` to `counts[key]`, dropping the key once it hits zero."""
+    counts[key] = counts.get(key, 0) + value
+    if counts[key] == 0:
+        del counts[key]
@@ -0,0 +1,130 @@
+import logging
+import sys
+
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from pandas import Series
+
+from tacostats.config import CREATE_TIME, DAILY_PARTIAL_KEY, ROLLUP_DAYS, ROLLUPS_PREFIX, SKETCHES_KEY
+from tacostats.partials import StatsPartial
+from tacostats.reddit import report
+from tacostats.sketches import DailySketches
+from tacostats.stats import _build_short_stats, summarize_partial
+from tacostats.statsio import StatsIO
+from tacostats.util import to_eastern
+
+log = logging.getLogger(__name__)
+
+statsio = StatsIO()
+
+
+def lambda_handler(event, context):
+    process_rollup()
+
+
+def process_rollup(days: int = ROLLUP_DAYS, date_from: Optional[date] = None):
+    """merge the daily partials for the last N completed dts into stats covering the whole span, no raw comments required"""
+    start = datetime.now(timezone.utc)
+    log.info(f"process_rollup started at {start}...")
+
+    dt_dates = statsio.get_dt_dates(daysago=days, date_from=date_from or get_last_completed_dt_date())
+    log.info(f"merging daily partials from {dt_dates[-1]} to {dt_dates[0]}...")
+    partial, found = merge_daily_partials(dt_dates)
+    if not found:
+        raise KeyError(f"no daily partials found between {dt_dates[-1]} and {dt_dates[0]}")
+
+    log.info("summarizing...")
+    full_stats = summarize_partial(partial)
+    full_stats["activity"] = _find_activity_by_hour_of_day(partial)
+    full_stats["span"] = _get_span(days)
+    full_stats["days"] = len(found)
+    full_stats["first_dt"] = statsio.get_dt_prefix(min(found))
+    full_stats["last_dt"] = statsio.get_dt_prefix(max(found))
+
+    log.info("merging sketches...")
+    full_stats.update(_merge_daily_sketches(found).summarize())
+    short_stats = _build_short_stats(full_stats)
+
+    log.info("writing results...")
+    statsio.write(ROLLUPS_PREFIX, **{_get_rollup_key(days, max(found)): full_stats})
+
+    log.info("posting results...")
+    report.post(short_stats, "rollup.md.j2")
+
+    done = datetime.now(timezone.utc)
+    duration = (done - start).total_seconds()
+    log.info(f"Finished at {done.isoformat()}, took {duration} seconds")
+
+
+def get_last_completed_dt_date(now: Optional[datetime] = None) -> date:
+    """The newest dt which has finished. Each one runs until the next is created, so the latest is still going."""
+    now = now or datetime.now(timezone.utc)
+    latest = now.date() if now >= datetime.combine(now.date(), CREATE_TIME) else now.date() - timedelta(days=1)
+    return latest - timedelta(days=1)
+
+
+def merge_daily_partials(dt_dates: List[date]) -> Tuple[StatsPartial, List[date]]:
+    """Read and merge daily partials. Returns the merged partial and the dates which actually had one."""
+    merged = StatsPartial()
+    found = []
+    for dt_date in dt_dates:
+        try:
+            partial = StatsPartial.from_dict(statsio.read(statsio.get_dt_prefix(dt_date), DAILY_PARTIAL_KEY))
+        except KeyError:
+            log.warning(f"no daily partial found for {dt_date}, skipping.")
+            continue
+        if not partial:
+            log.warning(f"daily partial for {dt_date} is from an older version, skipping. rerun stats for that day to rebuild it.")
+            continue
+        merged.merge(partial)
+        found.append(dt_date)
+    return merged, found
+
+
+def _merge_daily_sketches(dt_dates: List[date]) -> DailySketches:
+    """Read and merge daily sketches, skipping any days which don't have them."""
+    merged = DailySketches()
+    for dt_date in dt_dates:
+        try:
+            sketches = DailySketches.from_dict(statsio.read(statsio.get_dt_prefix(dt_date), SKETCHES_KEY))
+        except KeyError:
+            log.warning(f"no sketches found for {dt_date}, skipping.")
+            continue
+        if not sketches:
+            log.warning(f"sketches for {dt_date} are from an older version, skipping. rerun stats for that day to rebuild them.")
+            continue
+        merged.merge(sketches)
+    return merged
+
+
+def _find_activity_by_hour_of_day(partial: StatsPartial) -> List[float]:
+    """Get a normalized activity indicator for each hour of the day (ET), midnight first.
+
+    Returns:
+        [0<float<1, ...]
+    """
+    if not partial.hours:
+        return []
+    counts = Series({hour: s[0] for hour, s in partial.hours.items()})
+    hour_of_day = to_eastern(Series(counts.index)).dt.hour.to_numpy()
+    counts = counts.groupby(hour_of_day).sum().reindex(range(24), fill_value=0)
+    spread = counts.max() - counts.min()
+    return ((counts - counts.min()) / spread if spread else counts * 0.0).tolist()
+
+
+def _get_span(days: int) -> str:
+    if days == 7:
+        return "week"
+    if days == 30:
+        return "month"
+    return f"{days} days"
+
+
+def _get_rollup_key(days: int, last_dt: date) -> str:
+    return f"{statsio.get_dt_prefix(last_dt)}-{days}d"
+
+
+if __name__ == "__main__":
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else ROLLUP_DAYS
+    process_rollup(days=days)
@@ -0,0 +1,218 @@
+import base64
+import hashlib
+import math
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Optional
+
+import numpy
+
+# bump whenever the shape of the stored sketches changes, older sketches are skipped when merging
+SKETCH_VERSION = 1
+
+# 2^12 registers, about 1.6% standard error on distinct counts at 4KiB per sketch
+HLL_PRECISION = 12
+
+# quantiles are within 1% of the true value
+QUANTILE_ACCURACY = 0.01
+
+
+@dataclass
+class DistinctSketch:
+    """HyperLogLog estimate of how many distinct values were added. Sketches merge without losing accuracy."""
+
+    precision: int = HLL_PRECISION
+    registers: numpy.ndarray = field(default_factory=lambda: numpy.zeros(2**HLL_PRECISION, dtype=numpy.uint8))
+
+    def add(self, value: str):
+        h = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+        idx = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        # position of the first set bit in what's left of the hash
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def update(self, values: Iterable[str]) -> "DistinctSketch":
+        for v in values:
+            self.add(v)
+        return self
+
+    def merge(self, other: "DistinctSketch") -> "DistinctSketch":
+        if other.precision != self.precision:
+            raise ValueError(f"can't merge sketches with precision {self.precision} and {other.precision}")
+        numpy.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / numpy.sum(numpy.power(2.0, -self.registers.astype(numpy.float64)))
+        zeros = int(numpy.count_nonzero(self.registers == 0))
+        # linear counting is far more accurate while most registers are still empty
+        if raw <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"precision": self.precision, "registers": base64.b64encode(self.registers.tobytes()).decode("ascii")}
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "DistinctSketch":
+        registers = numpy.frombuffer(base64.b64decode(data["registers"]), dtype=numpy.uint8).copy()
+        return DistinctSketch(precision=data["precision"], registers=registers)
+
+
+@dataclass
+class QuantileSketch:
+    """Log-bucketed histogram (DDSketch) which answers quantile queries to within `accuracy` of the true value.
+
+    Buckets are just counts, so sketches merge exactly no matter how many days go into them.
+    """
+
+    accuracy: float = QUANTILE_ACCURACY
+    count: int = 0
+    zero: int = 0
+    # bucket index -> count, for positive values and for the magnitude of negative values
+    positive: Dict[int, int] = field(default_factory=dict)
+    negative: Dict[int, int] = field(default_factory=dict)
+    min: Optional[float] = None
+    max: Optional[float] = None
+
+    @property
+    def _gamma(self) -> float:
+        return (1 + self.accuracy) / (1 - self.accuracy)
+
+    def update(self, values: Iterable[float]) -> "QuantileSketch":
+        """Add many values at once"""
+        arr = numpy.fromiter(values, dtype=numpy.float64)
+        if not len(arr):
+            return self
+        self.count += len(arr)
+        self.min = float(arr.min()) if self.min is None else min(self.min, float(arr.min()))
+        self.max = float(arr.max()) if self.max is None else max(self.max, float(arr.max()))
+        self.zero += int(numpy.count_nonzero(arr == 0))
+        for store, magnitudes in ((self.positive, arr[arr > 0]), (self.negative, -arr[arr < 0])):
+            indexes, counts = numpy.unique(numpy.ceil(numpy.log(magnitudes) / math.log(self._gamma)), return_counts=True)
+            for i, c in zip(indexes.astype(int).tolist(), counts.tolist()):
+                store[i] = store.get(i, 0) + c
+        return self
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        if other.accuracy != self.accuracy:
+            raise ValueError(f"can't merge sketches with accuracy {self.accuracy} and {other.accuracy}")
+        if not other.count:
+            return self
+        self.count += other.count
+        self.zero += other.zero
+        self.min = other.min if self.min is None else min(self.min, other.min)  # type: ignore
+        self.max = other.max if self.max is None else max(self.max, other.max)  # type: ignore
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for i, c in other_store.items():
+                store[i] = store.get(i, 0) + c
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        """The value at quantile `q` (0 <= q <= 1), or None if the sketch is empty."""
+        if not self.count:
+            return None
+        # the extremes are tracked exactly
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        rank = q * (self.count - 1)
+        seen = 0
+        # walk from the most negative value up to the most positive
+        for i in sorted(self.negative, reverse=True):
+            seen += self.negative[i]
+            if seen > rank:
+                return max(-self._value(i), self.min)  # type: ignore
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for i in sorted(self.positive):
+            seen += self.positive[i]
+            if seen > rank:
+                return min(self._value(i), self.max)  # type: ignore
+        return self.max
+
+    def percentiles(self, percentiles: Iterable[int] = (50, 90, 99)) -> Dict[str, Optional[float]]:
+        return {f"p{p}": self.quantile(p / 100) for p in percentiles}
+
+    def _value(self, index: int) -> float:
+        return 2 * self._gamma**index / (self._gamma + 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "accuracy": self.accuracy,
+            "count": self.count,
+            "zero": self.zero,
+            "positive": self.positive,
+            "negative": self.negative,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "QuantileSketch":
+        # json turns the int keys into strings
+        return QuantileSketch(
+            accuracy=data["accuracy"],
+            count=data["count"],
+            zero=data["zero"],
+            positive={int(k): v for k, v in data["positive"].items()},
+            negative={int(k): v for k, v in data["negative"].items()},
+            min=data["min"],
+            max=data["max"],
+        )
+
+
+@dataclass
+class DailySketches:
+    """Everything sketched for one or more DTs."""
+
+    version: int = SKETCH_VERSION
+    authors: DistinctSketch = field(default_factory=DistinctSketch)
+    # per comment
+    score: QuantileSketch = field(default_factory=QuantileSketch)
+    word_count: QuantileSketch = field(default_factory=QuantileSketch)
+    # per author per dt
+    comments_per_user: QuantileSketch = field(default_factory=QuantileSketch)
+
+    def merge(self, other: "DailySketches") -> "DailySketches":
+        self.authors.merge(other.authors)
+        self.score.merge(other.score)
+        self.word_count.merge(other.word_count)
+        self.comments_per_user.merge(other.comments_per_user)
+        return self
+
+    def summarize(self, percentiles: Iterable[int] = (50, 90, 99)) -> Dict[str, Any]:
+        percentiles = list(percentiles)
+        return {
+            "unique_users_estimate": self.authors.estimate(),
+            "score_percentiles": self.score.percentiles(percentiles),
+            "word_count_percentiles": self.word_count.percentiles(percentiles),
+            "comments_per_user_percentiles": self.comments_per_user.percentiles(percentiles),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "authors": self.authors.to_dict(),
+            "score": self.score.to_dict(),
+            "word_count": self.word_count.to_dict(),
+            "comments_per_user": self.comments_per_user.to_dict(),
+        }
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> Optional["DailySketches"]:
+        """Load stored sketches. Returns None if they were written by an incompatible version."""
+        if data.get("version") != SKETCH_VERSION:
+            return None
+        return DailySketches(
+            authors=DistinctSketch.from_dict(data["authors"]),
+            score=QuantileSketch.from_dict(data["score"]),
+            word_count=QuantileSketch.from_dict(data["word_count"]),
+            comments_per_user=QuantileSketch.from_dict(data["comments_per_user"]),
+        )
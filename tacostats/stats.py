@@ -1,22 +1,47 @@
+import heapq
 import logging
-import re
 import sys
 
 from typing import Any, Dict, Iterable, List, Optional, Tuple
 from datetime import date, datetime, timezone
 
-import pandas
-
-from pandas import DataFrame, Series
+from pandas import DataFrame
 from scipy import stats
 from tacostats.statsio import StatsIO
-from tacostats.config import EXCLUDED_AUTHORS, RECAP
+from tacostats.config import (
+    AUTHOR_ROLLUP_KEY,
+    DAILY_PARTIAL_KEY,
+    FULL_STATS,
+    FULLSTATS_KEY,
+    RECAP,
+    SKETCHES_KEY,
+    STATS_PARTIAL_KEY,
+    USE_EXISTING,
+)
 from tacostats.reddit import report
+from tacostats.author_rollups import AuthorRollup
 from tacostats.reddit.dt import fetch_comments
+from tacostats.flairs import get_flair_dictionary, write_flair_dictionary
+from tacostats.folding import fold_comments
+from tacostats.fullstats import compact_full_stats
+from tacostats.hourly import HourlyTable
 from tacostats.models import Comment
-from tacostats.util import build_time_indexed_df, find_emoji, get_target_dt_date, neuter_ping
-
-_FLAIRMOJI_REGEX = re.compile(r".*(\:[\-\w]+\:)\s(.*)")
+from tacostats.partials import StatsPartial
+from tacostats.sketches import DailySketches
+from tacostats.timings import span, stage, timed, write_timings
+from tacostats.util import find_emoji_batch, get_target_dt_date, neuter_ping
+
+# how many entries of each list make it into short_stats, hourly lists are always kept whole
+SHORT_STATS_LIMITS = {
+    "spammiest": 3,
+    "wordiest_overall": 3,
+    "wordiest": 3,
+    "upvoted_comments": 3,
+    "upvoted_redditors": 3,
+    "best_redditors": 3,
+    "emoji_spammers": 3,
+    "top_emoji": 150,
+}
 
 logging.basicConfig(level=logging.DEBUG)
 log = logging.getLogger(__name__)
@@ -43,286 +68,356 @@ def process_stats(daysago: Optional[int] = None):
     else:
         dt_date = statsio.latest_dt_date
 
-    dt_comments = fetch_comments(dt_date)
+    with timed("stats") as timer:
+        # materialized here so that fetching is timed on its own rather than as part of folding
+        with span("fetch") as s:
+            if USE_EXISTING:
+                print("using existing comments...")
+                dt_comments = statsio.read_dt_comments(dt_date)
+            else:
+                print("getting comments from reddit...")
+                dt_comments = list(fetch_comments(dt_date))
+            s.rows = len(dt_comments)
+
+        print("reading partials from earlier runs...")
+        with span("read_partial") as s:
+            partial = _read_partial(dt_date)
+            s.rows = len(partial.ledger)
 
-    # TODO: no longer necessary?
-    # during thunderdomes, calling comments() twice often results in duplicated
-    # comments. reworking the way comments are written to s3 would be a proper fix
-    # but deduping this way is simpler and not too high-cost.
-    # if len(dts) > 1:
-    #     dt_comments = [dict(t) for t in {tuple(sorted(d.items())) for d in dt_comments}]
+        print("processing comments...")
+        with span("process_comments"):
+            full_stats, short_stats = _process_comments(dt_comments, partial, full=FULL_STATS)
 
-    print("processing comments...")
-    full_stats, short_stats = _process_comments(dt_comments)
+        print("writing results...")
+        with span("write") as s:
+            s.bytes = _write_results(dt_date, full_stats, short_stats, partial, dt_comments)
 
-    print("writing results...")
-    statsio.write(
-        statsio.get_dt_prefix(dt_date),
-        full_stats=full_stats,
-        short_stats=short_stats,
-    )
+        print("posting results...")
+        report.post(short_stats, "template.md.j2")
 
-    print("posting results...")
-    report.post(short_stats, "template.md.j2")
+    write_timings(statsio, statsio.get_dt_prefix(dt_date), timer)
 
     done = datetime.now(timezone.utc)
     duration = (done - start).total_seconds()
     print(f"Finished at {done.isoformat()}, took {duration} seconds")
 
 
-def _process_comments(dt_comments: Iterable[Comment]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
-    """build a full dataset and a short dataset from a list of comments"""
-    cdf = DataFrame([c.to_dict() for c in dt_comments])  # type: ignore
+def rebuild_stats(dt_date: date, save_flairs: bool = True):
+    """recompute a dt's stats from scratch using stored comments. nothing is read from or posted to reddit.
+
+    backfill workers turn off `save_flairs` and hand the flairs they parsed back to be stored once."""
+    print(f"rebuilding stats for {dt_date}...")
+    partial = StatsPartial()
+    # straight from the dt's own file, the shared index would hold onto every dt a backfill worker has seen
+    dt_comments = statsio.read_dt_comments(dt_date)
+    full_stats, short_stats = _process_comments(dt_comments, partial)
+    _write_results(dt_date, full_stats, short_stats, partial, dt_comments, save_flairs)
+
+
+def _write_results(
+    dt_date: date,
+    full_stats: Optional[Dict[str, Any]],
+    short_stats: Dict[str, Any],
+    partial: StatsPartial,
+    dt_comments: Iterable[Comment],
+    save_flairs: bool = True,
+) -> int:
+    """write stats and partials to the dt's prefix. full_stats is skipped if there isn't one. returns bytes written.
+
+    `dt_comments` are only used to look up each author's top comment for their rollup."""
+    # the ledger is only needed by later runs against the same dt, rollups only need the sums
+    results = {
+        "short_stats": short_stats,
+        STATS_PARTIAL_KEY: partial.to_dict(),
+        DAILY_PARTIAL_KEY: partial.to_dict(include_ledger=False),
+        SKETCHES_KEY: _build_sketches(partial).to_dict(),
+        AUTHOR_ROLLUP_KEY: AuthorRollup.from_partial(partial, dt_comments).to_dict(),
+    }
+    if full_stats:
+        results[FULLSTATS_KEY] = compact_full_stats(full_stats)
+    if save_flairs:
+        write_flair_dictionary(statsio, get_flair_dictionary(statsio))
+    return statsio.write(statsio.get_dt_prefix(dt_date), **results)
+
+
+def _read_partial(dt_date: date) -> StatsPartial:
+    """read the partials left by earlier runs against this dt, starting fresh if there are none"""
+    try:
+        if partial := StatsPartial.from_dict(statsio.read(statsio.get_dt_prefix(dt_date), STATS_PARTIAL_KEY)):
+            print(f"found partials covering {len(partial.ledger)} comments")
+            return partial
+        print("stored partials are from an older version, rebuilding...")
+    except KeyError:
+        print("no partials found, starting fresh...")
+    return StatsPartial()
+
+
+def _process_comments(
+    dt_comments: Iterable[Comment], partial: Optional[StatsPartial] = None, full: bool = True
+) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+    """build a full dataset and a short dataset from a list of comments, folding them into `partial` along the way.
+
+    when `full` is False, only the rows which make it into short_stats are selected and full_stats is None.
+    """
+    partial = partial if partial is not None else StatsPartial()
+
+    print("folding comments into partials...")
+    comments = fold_comments(partial, dt_comments)
 
-    print("removing bot comments...")
-    # pandas syntax is dumb so pylance (rightly) thinks this returns a series
-    cdf: DataFrame = cdf[~cdf.author.isin(EXCLUDED_AUTHORS)]  # type: ignore
+    limits = None if full else SHORT_STATS_LIMITS
+    results = summarize_partial(partial, limits)
 
-    print("counting bad authors...")
-    deleted, removed, other = _find_bad_author_counts(cdf)
+    print("creating hourly table...")
+    hourly = _build_hourly_table(partial)
 
-    print("pruning bad authors from dataframe...")
-    cdf = cdf[cdf["author"] != ""]
+    print("adding comment and hourly stats...")
+    # neuter upvoted comments to prevent pinging groupbot
+    upvoted_limit = limits["upvoted_comments"] if limits else None
+    results["upvoted_comments"] = [neuter_ping(c) for c in _find_upvoted_comments(partial, comments, upvoted_limit)]
+    results["activity"] = _find_activity_by_hour(hourly)
+    results["hourly_wordiest"] = _find_wordiest_by_hour(hourly)
+    results["hourly_spammiest"] = _find_spammiest_by_hour(hourly)
 
-    print("adding derived columns...")
-    cdf["emoji_count"] = cdf["body"].apply(lambda x: len(find_emoji(x)))
-    cdf["word_count"] = cdf["body"].str.count(" ") + 1
+    if not full:
+        return None, results
+    return results, _build_short_stats(results)
 
-    # prep time-indexed dataframe
-    print("creating time-indexed dataframe...")
-    tdf = build_time_indexed_df(cdf)
 
-    # build new dataframes used in other metrics
-    print("creating spammiest dataframe...")
-    spammiest = _find_spammiest(cdf)
-    print("creating wordiest dataframe...")
-    wordiest = _find_wordiest(cdf)
-    print("creating upvoted_redditors dataframe...")
-    upvoted_redditors = _find_upvoted_redditors(cdf)
+@stage
+def summarize_partial(partial: StatsPartial, limits: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """build the stats which need nothing but a partial's sums, ie: no comment bodies or hourly detail.
+
+    `limits` caps the length of each leaderboard, see SHORT_STATS_LIMITS. leaderboards are complete without it.
+    """
+    limit = (limits or {}).get
+    print("creating authors dataframe...")
+    adf = _build_authors_df(partial)
     print("creating unique_users dataframe...")
-    unique_users = _find_unique_users(cdf)
-
-    # build stats dicts
-    print("building full_stats dict...")
-    full_stats = {
-        "deleted": deleted,
-        "removed": removed,
-        "other_blank": other,
-        "spammiest": spammiest.to_dict("records"),
-        "wordiest_overall": wordiest.to_dict("records"),
-        "wordiest": _find_wordiest_per_comment(wordiest, spammiest),
-        # neuter upvoted comments to prevent pinging groupbot
-        "upvoted_comments": [neuter_ping(c) for c in _find_upvoted_comments(cdf)],
-        "upvoted_redditors": upvoted_redditors.to_dict("records"),
-        "best_redditors": _find_avg_scores(upvoted_redditors, spammiest),
+    unique_users = _find_unique_users(partial)
+
+    print("building stats dict...")
+    return {
+        "deleted": partial.blanks["deleted"],
+        "removed": partial.blanks["removed"],
+        "other_blank": partial.blanks["other_blank"],
+        "spammiest": _find_spammiest(adf, limit("spammiest")),
+        "wordiest_overall": _find_wordiest(adf, limit("wordiest_overall")),
+        "wordiest": _find_wordiest_per_comment(adf, limit("wordiest")),
+        "upvoted_redditors": _find_upvoted_redditors(adf, limit("upvoted_redditors")),
+        "best_redditors": _find_avg_scores(adf, limit("best_redditors")),
         # "memeiest": memeiest_full,
-        "activity": _find_activity_by_hour(tdf),
-        "hourly_wordiest": _find_wordiest_by_hour(tdf),
-        "hourly_spammiest": _find_spammiest_by_hour(tdf),
-        "emoji_spammers": _find_emoji_spammers(cdf),
-        "top_emoji": find_top_emoji(cdf),
-        "unique_users": len(unique_users),
+        "emoji_spammers": _find_emoji_spammers(adf, limit("emoji_spammers")),
+        "top_emoji": _rank_emoji(partial.emoji, limit("top_emoji")),
+        "unique_users": int(unique_users["author"].nunique()),
         "flair_population": _find_flair_population(unique_users),
     }
 
-    return full_stats, _build_short_stats(full_stats)
+
+@stage
+def _build_sketches(partial: StatsPartial) -> DailySketches:
+    """sketch the dt's distributions so that long windows can be summarized without reading every comment"""
+    sketches = DailySketches()
+    contributions = [c for c in partial.ledger.values() if c.author]
+    sketches.authors.update(partial.authors)
+    sketches.score.update(c.score for c in contributions)
+    sketches.word_count.update(c.word_count for c in contributions)
+    sketches.comments_per_user.update(s[0] for s in partial.authors.values())
+    return sketches
 
 
+@stage
+def _build_authors_df(partial: StatsPartial) -> DataFrame:
+    """One row per author with their totals.
+
+    Returns:
+        DataFrame["author", "author_flair_text", "comment_count", "word_count", "score", "emoji_count"]
+    """
+    adf = DataFrame.from_dict(partial.authors, orient="index", columns=["comment_count", "word_count", "score", "emoji_count"])
+    adf = adf.rename_axis("author").reset_index()
+    adf.insert(1, "author_flair_text", adf["author"].map(partial.get_flair))
+    return adf
+
+
+@stage
+def _build_hourly_table(partial: StatsPartial) -> HourlyTable:
+    """One row per author per one-hour span they were active in, shared by all of the hourly stats."""
+    return HourlyTable.from_partial(partial)
+
+
+@stage
 def _build_short_stats(full_stats: dict) -> dict:
     """truncate any list values to only list the top N entries"""
     print("creating short_stats dict...")
     short_stats = {}
     for k, v in full_stats.items():
-        # don't try to truncate anything that's not a list
-        if not isinstance(v, list):
-            short_stats[k] = v
-        elif k.startswith("hourly") or k == "activity":
-            # keep all the hourly records
-            short_stats[k] = v
-        elif k == "top_emoji":
-            # keep at most 150 of the top emoji
-            short_stats[k] = v[: min(len(v), 150)]
+        # don't try to truncate anything that's not a list, and keep all the hourly records
+        if isinstance(v, list) and k in SHORT_STATS_LIMITS:
+            short_stats[k] = v[: SHORT_STATS_LIMITS[k]]
         else:
-            # print(f"{k} found, truncating to top 3")
-            short_stats[k] = v[:3]
+            short_stats[k] = v
 
     return short_stats
 
 
-def _extract_flairmoji(flair_text):
-    if not flair_text:
-        return ""
-
-    try:
-        matches = _FLAIRMOJI_REGEX.match(flair_text)
-    except Exception as e:
-        print(e, flair_text)
-        return ""
-
-    if not matches:
-        # print(f"WARN: regex returned none: {flair_text}")
-        return ""
-
-    groups = matches.groups()
-    if len(groups) == 0:
-        print(f"WARN: no matches: {groups}")
-        return ""
-    return groups[1]
+def _top(df: DataFrame, column: str, limit: Optional[int] = None) -> DataFrame:
+    """Sort by `column`, highest first with ties going to the author's name. With a limit, only the rows needed are selected
+    and sorted rather than the entire frame."""
+    if limit is not None:
+        # keep="all" holds on to anyone tied for the last spot so that the tie-break matches the unlimited sort
+        df = df.nlargest(limit, column, keep="all")
+    df = df.sort_values([column, "author"], ascending=[False, True])
+    return df if limit is None else df.head(limit)
 
 
+@stage
 def _find_flair_population(unique_users_df):
-    flairs = unique_users_df["author_flair_text"].apply(_extract_flairmoji).value_counts()
+    flairs = get_flair_dictionary(statsio).get_labels(unique_users_df["author_flair_text"]).value_counts()
     flair_list = [i for i in zip(flairs, flairs.index) if i[1]]
-    unflaired_count = int(flairs.at[""])
+    unflaired_count = int(flairs.get("", 0))
     r = {"unflaired": unflaired_count, "flaired": flair_list}
     return r
 
 
-def _find_unique_users(df):
-    return df[["author", "author_flair_text"]].drop_duplicates(["author", "author_flair_text"])
+@stage
+def _find_unique_users(partial: StatsPartial) -> DataFrame:
+    """Every distinct author/flair pair seen.
+
+    Returns:
+        DataFrame["author", "author_flair_text"]
+    """
+    pairs = [(author, flair) for author, flairs in partial.flairs.items() for flair in flairs]
+    return DataFrame(pairs, columns=["author", "author_flair_text"])
 
 
-def _find_wordiest_per_comment(wordiest: DataFrame, spammiest: DataFrame) -> List[dict]:
+@stage
+def _find_wordiest_per_comment(adf: DataFrame, limit: Optional[int] = None) -> List[dict]:
     """Find the users who used the most words per comment.
 
     Returns:
         [{'author': str, 'author_flair_text': str, 'avg_words': float}, ...]
     """
-    df = pandas.merge(wordiest, spammiest, on="author")
+    df = adf[["author", "author_flair_text"]].copy()
+    df["avg_words"] = (adf["word_count"] / adf["comment_count"]).round(decimals=1)
+    return _top(df, "avg_words", limit).to_dict("records")
 
-    # add average words column
-    df["avg_words"] = (df["word_count"] / df["comment_count"]).round(decimals=1)
 
-    return df[["author", "author_flair_text", "avg_words"]].sort_values("avg_words", ascending=False).to_dict("records")
-
-
-def _find_wordiest(cdf: DataFrame) -> DataFrame:
+@stage
+def _find_wordiest(adf: DataFrame, limit: Optional[int] = None) -> List[dict]:
     """Find the users who used the most words overall
 
     Returns:
-        DataFrame["author", "author_flair_text", "word_count"]
+        [{'author': str, 'author_flair_text': str, 'word_count': int}, ...]
     """
-    return (
-        cdf[["author", "author_flair_text", "word_count"]]
-        .groupby("author")
-        .sum()
-        .reset_index()
-        .sort_values(["word_count"], ascending=False)
-    )
+    return _top(adf[["author", "author_flair_text", "word_count"]], "word_count", limit).to_dict("records")
 
 
-def _find_avg_scores(upvoted_redditors: DataFrame, spammiest: DataFrame) -> List[dict]:
+@stage
+def _find_avg_scores(adf: DataFrame, limit: Optional[int] = None) -> List[dict]:
     """Find the users with the best average upvote score across all their comments
 
     Returns:
-        [{'author': str, 'score': int}, ...]
+        [{'author': str, 'avg_score': float}, ...]
     """
-    avg_score_df = pandas.merge(upvoted_redditors, spammiest, on="author")
-    avg_score_df["avg_score"] = (avg_score_df["score"] / avg_score_df["comment_count"]).round(decimals=1)
+    df = adf[["author"]].copy()
+    df["avg_score"] = (adf["score"] / adf["comment_count"]).round(decimals=1)
+    return _top(df, "avg_score", limit).to_dict("records")
 
-    return avg_score_df[["author", "avg_score"]].sort_values("avg_score", ascending=False).to_dict("records")
 
-
-def _find_upvoted_redditors(cdf: DataFrame) -> DataFrame:
+@stage
+def _find_upvoted_redditors(adf: DataFrame, limit: Optional[int] = None) -> List[dict]:
     """Find the users who have collected the most upvotes
 
     Returns:
-        DataFrame["author", "score"]
+        [{'author': str, 'score': int}, ...]
     """
-    return cdf[["author", "score"]].groupby("author").sum().reset_index().sort_values(["score"], ascending=False)
-
+    return _top(adf[["author", "score"]], "score", limit).to_dict("records")
 
-def _find_upvoted_comments(cdf: DataFrame) -> List[dict]:
-    """Find the most highly upvoted comments."""
-    return cdf.sort_values(["score"], ascending=False).to_dict("records")
 
+@stage
+def _find_upvoted_comments(partial: StatsPartial, comments: Dict[str, Comment], limit: Optional[int] = None) -> List[dict]:
+    """Find the most highly upvoted comments. Only the comments which make the cut are turned into dicts."""
+    candidates = (i for i, c in partial.ledger.items() if c.author)
+    rank = lambda i: (-partial.ledger[i].score, i)
+    ranked = sorted(candidates, key=rank) if limit is None else heapq.nsmallest(limit, candidates, key=rank)
+    return [comments[i].to_dict() for i in ranked]
 
-def _find_spammiest(cdf: DataFrame) -> DataFrame:
-    """Find the users who posted the most"""
-    return (
-        cdf[["author", "author_flair_text"]]
-        .value_counts()
-        .reset_index()
-        .rename(columns={0: "comment_count"})
-        .sort_values(["comment_count"], ascending=False)
-    )
 
+@stage
+def _find_spammiest(adf: DataFrame, limit: Optional[int] = None) -> List[dict]:
+    """Find the users who posted the most
 
-def _find_bad_author_counts(cdf: DataFrame) -> Tuple[int, int, int]:
-    """Returns counts of blank messages: `deleted`, `removed`, and `other` in that order"""
-    deleted = int(cdf.loc[cdf["body"] == "[deleted]"].size)
-    removed = int(cdf.loc[cdf["body"] == "[removed]"].size)
-    other = int(cdf.loc[cdf["author"] == ""].size)
-    print(f"found {deleted} deleted, {removed} removed, {other} other bad authors.")
-    return deleted, removed, other
+    Returns:
+        [{'author': str, 'author_flair_text': str, 'comment_count': int}, ...]
+    """
+    return _top(adf[["author", "author_flair_text", "comment_count"]], "comment_count", limit).to_dict("records")
 
 
-def _find_activity_by_hour(tdf: DataFrame) -> List[float]:
+@stage
+def _find_activity_by_hour(hourly: HourlyTable) -> List[float]:
     """Get a normalized activity indicator for each one-hour span.
 
     Returns:
         [0<float<1, ...]
     """
-    activity = tdf[["word_count"]].groupby(pandas.Grouper(freq="H")).agg(["sum", "count"])  # type: ignore
-    maximums = activity.max()["word_count"]
-    minimums = activity.min()["word_count"]
-    activity["norm_count"] = (activity["word_count"]["count"] - minimums["count"]) / (maximums["count"] - minimums["count"])
-    return list(activity["norm_count"].to_dict().values())
+    if not hourly.hours:
+        return []
+    counts = hourly.totals("comment_count")
+    spread = counts.max() - counts.min()
+    return ((counts - counts.min()) / spread if spread else counts * 0.0).tolist()
 
 
-def _find_wordiest_by_hour(tdf: DataFrame) -> List[dict]:
-    """Find the users who wrote the most words within each one-hour span.
+@stage
+def _find_wordiest_by_hour(hourly: HourlyTable) -> List[dict]:
+    """Find the users who wrote the most words within each one-hour span, ties included.
 
     Returns:
-        [{'created_at': int, 'author': str, 'word_count': float}, ...]
+        [{'created_et': int, 'author': str, 'word_count': int}, ...]
     """
-    activity = tdf[["word_count", "author"]].groupby([pandas.Grouper(freq="H"), "author"]).sum()  # type: ignore
-    activity = activity[activity == activity.groupby(level=0).transform("max")].dropna().reset_index()
-    activity["created_et"] = activity["created_et"].apply(lambda x: x.value / 10**9).astype(int)
-    return activity.to_dict("records")
+    return hourly.top("word_count", keep_ties=True)
 
 
-def _find_spammiest_by_hour(tdf: DataFrame) -> List[dict]:
-    """Find the users who posted the most often within each one-hour span.
+@stage
+def _find_spammiest_by_hour(hourly: HourlyTable) -> List[dict]:
+    """Find the user who posted the most often within each one-hour span.
 
     Returns:
-        [{'created_et': val, 'author': val, 'comment_count': val}, ...]
+        [{'created_et': int, 'author': str, 'comment_count': int}, ...]
     """
-    spammiest_s: Series[int] = tdf.groupby([pandas.Grouper(freq="H"), "author"]).size()  # type: ignore
-    d = {}
-    for k, v in spammiest_s.iteritems():  # type: ignore # TODO: why does this complain about spammiest_s being an int?
-        dt = int(k[0].value / 10**9)  # type: ignore
-        if dt not in d.keys() or d[dt][1] < v:
-            d[dt] = (k[1], v)  # type: ignore
-    return [{"created_et": k, "author": v[0], "comment_count": v[1]} for k, v in d.items()]
+    return hourly.top("comment_count")
 
 
-def _find_emoji_spammers(cdf: DataFrame) -> List[dict]:
+@stage
+def _find_emoji_spammers(adf: DataFrame, limit: Optional[int] = None) -> List[dict]:
     """Finds the users who used the most emoji
 
     Returns:
         [{'author': val, 'emoji_count': val}, ...]
     """
-    return (
-        cdf[["author", "emoji_count"]]
-        .groupby("author")
-        .sum()
-        .reset_index()
-        .sort_values(by="emoji_count", ascending=False)
-        .to_dict("records")
-    )
+    return _top(adf[["author", "emoji_count"]], "emoji_count", limit).to_dict("records")
+
+
+@stage
+def _rank_emoji(emoji_counts: Dict[str, int], limit: Optional[int] = None) -> List[List]:
+    """Turns emoji counts into a list of the most used emoji
+
+    Returns:
+        [[<count>, <emoji>], ...]
+    """
+    rank = lambda i: (-i[1], i[0])
+    ranked = sorted(emoji_counts.items(), key=rank) if limit is None else heapq.nsmallest(limit, emoji_counts.items(), key=rank)
+    return [[count, e] for e, count in ranked]
 
 
+@stage
 def find_top_emoji(cdf: DataFrame) -> List[List]:
     """Returns a list of the most used emoji
 
     Returns:
         [[<count>, <emoji>], ...]
     """
-    top_emoji = cdf["body"].apply(find_emoji)
-    log.info(top_emoji)
+    top_emoji = cdf["emoji"] if "emoji" in cdf.columns else find_emoji_batch(cdf["body"])
     top_emoji = top_emoji.where(top_emoji.str.len() > 0).dropna().explode().value_counts()  # type: ignore
-    log.info(top_emoji)
+    log.debug(top_emoji)
     return list(zip(top_emoji, top_emoji.index))  # type: ignore
 
 
@@ -3,11 +3,13 @@ from dataclasses import dataclass, field
 from datetime import date, datetime
 from json import JSONDecodeError
 import logging
-from typing import Any, Dict, Generator, Iterable, List, Optional, Union
+import threading
+from typing import Any, Dict, Generator, Iterable, List, Optional, Set, Union
 
 import regex
 
-from tacostats.config import COMMENTS_KEY, USE_LOCAL, USE_S3
+from tacostats.config import COMMENTS_KEY, FULLSTATS_KEY, USE_LOCAL, USE_S3
+from tacostats.fullstats import expand_full_stats
 from tacostats.statsio_backends import BaseBackend, S3Backend, LocalBackend
 from tacostats.models import Comment, Thread
 from tacostats.reddit.dt import get_parent_id
@@ -25,6 +27,8 @@ class CommentsIndex:
     comment_ids_by_dt_date: Dict[date, List[str]] = field(default_factory=dict)
     comment_ids_by_author: Dict[str, List[str]] = field(default_factory=dict)
     comment_ids_by_parent: Dict[str, List[str]] = field(default_factory=dict)
+    # dts whose comments have all been indexed
+    dt_dates: Set[date] = field(default_factory=set)
 
     @property
     def comments(self) -> List[Comment]:
@@ -62,8 +66,9 @@ class CommentsIndex:
 
         return thread
 
-    def index_comments(self, comments: Iterable[Comment]):
-        """Index comments for easy access."""
+    def index_comments(self, comments: Iterable[Comment], dt_date: date):
+        """Index a DT's comments for easy access. They're grouped under the DT they came from rather than the day they
+        were posted on, a DT runs past midnight and recaps pick up a few of the next day's comments."""
         for comment in comments:
             self.comments_by_id[comment.id] = comment
 
@@ -72,7 +77,6 @@ class CommentsIndex:
             else:
                 self.comment_ids_by_author[comment.author].append(comment.id)
 
-            dt_date = comment.created_utc.date()
             if dt_date not in self.comment_ids_by_dt_date:
                 self.comment_ids_by_dt_date[dt_date] = [comment.id]
             else:
@@ -91,9 +95,15 @@ class CommentsIndex:
 class StatsIO:
     _dts: List[str] = []
     _idx: CommentsIndex = CommentsIndex()
+    # the index is shared by every instance, and userstats reads from it on several threads at once
+    _idx_lock = threading.Lock()
     _backends: List[BaseBackend] = []
 
     def __init__(self) -> None:
+        # instance lists, appending to the class-level ones would double up backends whenever a module imports
+        # another module which has its own StatsIO (eg: rollup importing stats)
+        self._dts = []
+        self._backends = []
         if USE_LOCAL:
             self._backends.append(LocalBackend())
         if USE_S3:
@@ -120,6 +130,10 @@ class StatsIO:
         """Get the latest dt date."""
         return datetime.strptime(self.latest_dt_prefix, PREFIX_DATE_FORMAT).date()
 
+    def has_dt(self, dt_date: date) -> bool:
+        """Whether storage has anything for a given dt."""
+        return self.get_dt_prefix(dt_date) in self._dts
+
     def get_age(self, prefix: str, key: str) -> int:
         """Gets the age of a file in seconds. NOTE: Naively uses the age returned from the first available backend."""
         return self._backends[0].get_age(prefix, key)
@@ -189,6 +203,28 @@ class StatsIO:
             except KeyError:
                 log.warning(f"no comments found for {d}{' by ' + username if username else ''}")
 
+    def read_dt_comments(self, dt_date: date) -> List[Comment]:
+        """Returns everything in one DT's comments file, without going through (or growing) the shared index.
+
+        Raises KeyError if the DT has no comments stored."""
+        return [Comment.from_dict(c) for c in self.read(self.get_dt_prefix(dt_date), COMMENTS_KEY)]
+
+    def read_comments_by_id(self, comment_ids: Iterable[str], dt_date: Optional[date] = None) -> List[Comment]:
+        """Returns specific comments from a DT, skipping any that can't be found. Defaults to the latest DT."""
+        self.update_index(dt_date or self.latest_dt_date)
+        return self._idx.get_by_ids(comment_ids)
+
+    def read_full_stats(self, dt_date: Optional[date] = None, comment_limit: Optional[int] = None) -> Dict[str, Any]:
+        """Returns a DT's full_stats in the record-oriented format regardless of how it was stored.
+
+        Compact full_stats only refer to comments by id, the top `comment_limit` (default all) upvoted comments are
+        looked up from the DT's comments. Pass 0 to skip reading comments entirely.
+        """
+        dt_date = dt_date or self.latest_dt_date
+        data = self.read(self.get_dt_prefix(dt_date), FULLSTATS_KEY)
+        get_comments = (lambda ids: self.read_comments_by_id(ids, dt_date)) if comment_limit != 0 else None
+        return expand_full_stats(data, get_comments, comment_limit)
+
     def _read_threads(self, dt_date: date, username: Optional[str] = None) -> Generator[Thread, None, None]:
         self.update_index(dt_date)
 
@@ -227,9 +263,11 @@ class StatsIO:
         return self._idx.get_thread(self._idx.comments_by_id[comment_id])
 
     def update_index(self, dt_date: date):
-        if dt_date not in self._idx.comment_ids_by_dt_date:
-            comments = [Comment.from_dict(c) for c in self.read(self.get_dt_prefix(dt_date), COMMENTS_KEY)]
-            self._idx.index_comments(comments)
+        """Index a DT's comments if they haven't been already. Other threads wait until the whole DT is indexed."""
+        with self._idx_lock:
+            if dt_date not in self._idx.dt_dates:
+                self._idx.index_comments(self.read_dt_comments(dt_date), dt_date)
+                self._idx.dt_dates.add(dt_date)
 
     def _update_parent_id(self, comment: Comment) -> Comment:
         parent_id = None
@@ -262,7 +300,12 @@ class StatsIO:
             counter += 1
         log.info(f"done: {counter} comments")
 
-    def write(self, dt_prefix: str, **kwargs):
-        """Write data to all enabled storage backends. kwargs keys are used for file name, values for data."""
+    def write(self, dt_prefix: str, **kwargs) -> int:
+        """Write data to all enabled storage backends. kwargs keys are used for file name, values for data.
+
+        Returns the number of bytes written to each backend.
+        """
+        written = 0
         for b in self._backends:
-            b.write(dt_prefix, **kwargs)
+            written = b.write(dt_prefix, **kwargs) or written
+        return written
@@ -5,8 +5,8 @@ class BaseBackend:
     """Base class for StatsIO backends"""
 
     @staticmethod
-    def write(prefix: str, **kwargs):
-        """write local stats files. use kwargs keys for name, values for data"""
+    def write(prefix: str, **kwargs) -> int:  # type: ignore
+        """write local stats files. use kwargs keys for name, values for data. returns the number of bytes written"""
         pass
 
     @staticmethod
@@ -18,16 +18,20 @@ log = logging.getLogger(__name__)
 
 class LocalBackend(BaseBackend):
     @staticmethod
-    def write(prefix: str, **kwargs):
-        """wrote local stats files. use kwargs keys for name, values for data"""
+    def write(prefix: str, **kwargs) -> int:
+        """wrote local stats files. use kwargs keys for name, values for data. returns the number of bytes written"""
         parent = Path(LOCAL_PATH) / prefix
         parent.mkdir(parents=True, exist_ok=True)
+        written = 0
         for key, value in kwargs.items():
             path = parent / f"{key}.json"
             log.debug(f"writing to {path}")
             # _check_for_unserializable_shit(value)
-            with open(path, "w", encoding="utf-8") as fh:
-                fh.write(json.dumps(value, cls=NumpyEncoder))
+            body = json.dumps(value, cls=NumpyEncoder).encode("utf-8")
+            with open(path, "wb") as fh:
+                fh.write(body)
+            written += len(body)
+        return written
 
     @staticmethod
     def read(prefix: str, key: str) -> Any:
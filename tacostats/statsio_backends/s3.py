@@ -20,20 +20,26 @@ S3_BUCKET_NOT_SET_ERROR = "S3_BUCKET not set"
 class S3Backend(BaseBackend):
 
     @staticmethod
-    def write(prefix: str, **kwargs):
+    def write(prefix: str, **kwargs) -> int:
         """write data to s3.
 
         Args:
             prefix - s3 "path" to write to. must not include trailing slash.
             kwargs - key is s3 "filename" to write, value is json-serializable data.
+
+        Returns the number of bytes written.
         """
         if not S3_BUCKET:
             raise ValueError(S3_BUCKET_NOT_SET_ERROR)
 
+        written = 0
         for key, value in kwargs.items():
             s3_key = f"{prefix}/{key}.json"
             log.debug(f"writing to {s3_key}")
-            boto3.client("s3").put_object(Body=str(json.dumps(value, cls=NumpyEncoder)), Bucket=S3_BUCKET, Key=s3_key)
+            body = json.dumps(value, cls=NumpyEncoder).encode("utf-8")
+            boto3.client("s3").put_object(Body=body, Bucket=S3_BUCKET, Key=s3_key)
+            written += len(body)
+        return written
 
     @staticmethod
     def read_comments(prefix: str) -> List[Dict[str, Any]]:
@@ -0,0 +1,79 @@
+import re
+
+from io import StringIO
+from typing import Iterable, List
+
+import contractions
+
+from markdown import Markdown
+
+URL_REGEX = re.compile(r"https?://\S+", flags=re.MULTILINE)
+
+# anything Markdown might treat as syntax. text without any of it comes out of Markdown with only its blank lines
+# dropped, so it doesn't need converting at all. whitespace at either end of a line includes the unicode kinds (nbsp,
+# \u2028, \x0b...) which Markdown strips
+MARKDOWN_SYNTAX_REGEX = re.compile(r"[\\`*_\[\]<>&#|~\t\r\x02\x03]|^[^\S\n]|[^\S\n]$|^(?:[-+=>]|\d+[.)])", flags=re.MULTILINE)
+
+# joins comments for batched cleanup, an invisible separator with newlines either side so that urls and contractions
+# can't run across it
+_BATCH_MARK = "\u2063"
+_BATCH_SEPARATOR = f"\n{_BATCH_MARK}\n"
+
+
+def clean_text(text: str) -> str:
+    """Normalise strings by stripping markdown and URLs, lowercasing, and expanding contractions."""
+    return _normalise(unmark(text))
+
+
+def clean_texts(texts: Iterable[str]) -> List[str]:
+    """`clean_text` for many strings at once. URLs, case and contractions are handled in one pass over all of them."""
+    unmarked = [unmark(t) for t in texts]
+    # a comment with the separator in it already would split in the wrong place
+    if any(_BATCH_MARK in t for t in unmarked):
+        return [_normalise(t) for t in unmarked]
+    return _normalise(_BATCH_SEPARATOR.join(unmarked)).split(_BATCH_SEPARATOR)
+
+
+def _normalise(text: str) -> str:
+    text = URL_REGEX.sub("", text)
+    text = text.lower()
+    text = contractions.fix(text)  # type: ignore
+    return text
+
+
+def is_plain(text: str) -> bool:
+    """True if there's nothing in `text` Markdown would treat as syntax"""
+    return MARKDOWN_SYNTAX_REGEX.search(text) is None
+
+
+def unmark(text: str) -> str:
+    """strip markdown from text, skipping the conversion when there isn't any"""
+    if is_plain(text):
+        return "\n".join(line for line in text.split("\n") if line)
+    return strip_markdown(text)
+
+
+### stuff to remove markdown
+# https://stackoverflow.com/questions/761824/python-how-to-convert-markdown-formatted-text-to-text
+def _unmark_element(element, stream=None):
+    """Clean markdown from comment"""
+    if stream is None:
+        stream = StringIO()
+    if element.text:
+        stream.write(element.text)
+    for sub in element:
+        _unmark_element(sub, stream)
+    if element.tail:
+        stream.write(element.tail)
+    return stream.getvalue()
+
+
+# patching Markdown
+Markdown.output_formats["plain"] = _unmark_element  # type: ignore
+__md = Markdown(output_format="plain")  # type: ignore
+__md.stripTopLevelTags = False  # type: ignore
+
+
+def strip_markdown(text: str) -> str:
+    """strip markdown by rendering it and keeping only the text"""
+    return __md.convert(text)
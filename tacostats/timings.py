@@ -0,0 +1,216 @@
+import json
+import logging
+import os
+import resource
+import time
+import tracemalloc
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Any, Callable, Dict, Generator, List, Optional, TypeVar
+
+from pandas import DataFrame
+
+from tacostats.config import MEMORY_KEY, PROFILE_MEMORY, PROFILE_MEMORY_SITES, TIMINGS_KEY
+from tacostats.statsio import StatsIO
+
+# bump whenever the shape of the stored timings changes
+TIMINGS_VERSION = 1
+
+log = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@dataclass
+class Span:
+    """One timed stage of a pipeline. `rows` and `bytes` are filled in by the stage when it knows them."""
+
+    name: str
+    parent: Optional[str] = None
+    started: float = 0.0
+    duration: float = 0.0
+    rows: Optional[int] = None
+    bytes: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: v for k, v in self.__dict__.items() if v is not None}
+
+
+@dataclass
+class SpanMemory:
+    """Memory used by one stage of a pipeline, only recorded when PROFILE_MEMORY is on."""
+
+    name: str
+    parent: Optional[str] = None
+    # resident set size once the stage finished
+    rss_bytes: int = 0
+    # highest python heap size (as seen by tracemalloc) while the stage ran, including any nested stages
+    peak_bytes: int = 0
+    # where the stage's surviving allocations came from, largest first
+    top_allocations: List[Dict[str, Any]] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self.__dict__
+
+
+class Timer:
+    """Collects spans for a single run of a pipeline."""
+
+    def __init__(self, pipeline: str, profile_memory: bool = False):
+        self.pipeline = pipeline
+        self.profile_memory = profile_memory
+        self.started = datetime.now(timezone.utc)
+        self.spans: List[Span] = []
+        self.memory: List[SpanMemory] = []
+        self._stack: List[str] = []
+        # running tracemalloc peak for each open span, see `_memory_span`
+        self._peaks: List[int] = []
+        self._start = time.perf_counter()
+
+    @property
+    def duration(self) -> float:
+        return time.perf_counter() - self._start
+
+    @contextmanager
+    def span(self, name: str) -> Generator[Span, None, None]:
+        span = Span(name, parent=self._stack[-1] if self._stack else None, started=time.time())
+        self._stack.append(name)
+        start = time.perf_counter()
+        try:
+            if self.profile_memory:
+                with self._memory_span(name, span.parent):
+                    yield span
+            else:
+                yield span
+        finally:
+            span.duration = time.perf_counter() - start
+            self._stack.pop()
+            self.spans.append(span)
+            log.info(json.dumps({"pipeline": self.pipeline, **span.to_dict()}))
+
+    @contextmanager
+    def _memory_span(self, name: str, parent: Optional[str]) -> Generator[None, None, None]:
+        # tracemalloc only has one peak, so it's reset for each span and the enclosing span's peak so far is kept aside
+        if self._peaks:
+            self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        self._peaks.append(0)
+        before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            memory = SpanMemory(name, parent, get_rss(), peak, _top_allocations(tracemalloc.take_snapshot(), before))
+            self.memory.append(memory)
+            log.info(json.dumps({"pipeline": self.pipeline, **memory.to_dict()}))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": TIMINGS_VERSION,
+            "pipeline": self.pipeline,
+            "started": self.started.isoformat(),
+            "duration": self.duration,
+            "spans": [s.to_dict() for s in self.spans],
+        }
+
+    def memory_to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": TIMINGS_VERSION,
+            "pipeline": self.pipeline,
+            "started": self.started.isoformat(),
+            "max_rss_bytes": get_max_rss(),
+            "spans": [m.to_dict() for m in self.memory],
+        }
+
+
+# the timer for whichever pipeline is running, stages deep in a module can record spans without being handed it
+_active: ContextVar[Optional[Timer]] = ContextVar("active_timer", default=None)
+
+
+@contextmanager
+def timed(pipeline: str, profile_memory: bool = PROFILE_MEMORY) -> Generator[Timer, None, None]:
+    """Time a pipeline run. Any `span` or `stage` entered inside is recorded against it."""
+    timer = Timer(pipeline, profile_memory)
+    started_tracing = profile_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    token = _active.set(timer)
+    try:
+        yield timer
+    finally:
+        _active.reset(token)
+        if started_tracing:
+            tracemalloc.stop()
+        summary = {"pipeline": pipeline, "duration": timer.duration, "spans": len(timer.spans)}
+        if profile_memory:
+            summary["max_rss_bytes"] = get_max_rss()
+        log.info(json.dumps(summary))
+
+
+@contextmanager
+def span(name: str) -> Generator[Span, None, None]:
+    """Time a stage against the active pipeline. Outside of a pipeline the span is handed out but not recorded."""
+    timer = _active.get()
+    if timer is None:
+        yield Span(name)
+        return
+    with timer.span(name) as s:
+        yield s
+
+
+def stage(func: F) -> F:
+    """Decorator which wraps a function in a span named after it, counting rows in whatever it returns."""
+    name = func.__name__.lstrip("_")
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if _active.get() is None:
+            return func(*args, **kwargs)
+        with span(name) as s:
+            result = func(*args, **kwargs)
+            if isinstance(result, (list, dict, DataFrame)):
+                s.rows = len(result)
+            return result
+
+    return wrapper  # type: ignore
+
+
+def write_timings(statsio: StatsIO, dt_prefix: str, timer: Timer):
+    """Store a run's timings, and its memory profile if there is one, next to the day's stats. Each pipeline keeps
+    only its latest run.
+
+    Every pipeline gets its own files (eg: `timings-stats`) rather than sharing one, so pipelines finishing at the same
+    time can't drop each other's reports. Runs of the same pipeline overlapping (eg: userstats) are last writer wins.
+    """
+    statsio.write(dt_prefix, **{f"{TIMINGS_KEY}-{timer.pipeline}": timer.to_dict()})
+    if timer.profile_memory:
+        statsio.write(dt_prefix, **{f"{MEMORY_KEY}-{timer.pipeline}": timer.memory_to_dict()})
+
+
+def get_rss() -> int:
+    """Current resident set size in bytes. Falls back to the peak where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return get_max_rss()
+
+
+def get_max_rss() -> int:
+    """Peak resident set size of this process in bytes"""
+    # linux reports KiB, which is all lambda cares about
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _top_allocations(after: tracemalloc.Snapshot, before: tracemalloc.Snapshot) -> List[Dict[str, Any]]:
+    """The lines which allocated the most memory between two snapshots and still held on to it."""
+    ignored = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+    stats = after.filter_traces(ignored).compare_to(before.filter_traces(ignored), "lineno")
+    grown = [s for s in stats if s.size_diff > 0][:PROFILE_MEMORY_SITES]
+    return [{"site": str(s.traceback[0]), "bytes": s.size_diff, "blocks": s.count_diff} for s in grown]
@@ -0,0 +1,129 @@
+import logging
+import math
+
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from tacostats.config import KEYWORD_BASELINE_KEY, KEYWORD_MIN_SCORE, KEYWORD_PARTIAL_KEY, TREND_DAYS, TRENDS_PREFIX
+from tacostats.partials import KeywordPartial
+from tacostats.statsio import StatsIO
+
+# bump whenever the shape of the stored baseline changes, older baselines are thrown away and rebuilt
+BASELINE_VERSION = 1
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class KeywordBaseline:
+    """Keyword scores over a rolling window of past DTs, kept as running sums so that moving the window along a day
+    only touches the keywords of the day coming in and the day going out."""
+
+    version: int = BASELINE_VERSION
+    days: int = TREND_DAYS
+    # dt date (iso) -> keyword -> score, exactly what was added for each day so that it can be taken out again
+    daily: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    # keyword -> [days seen, score sum, squared score sum] across `daily`
+    sums: Dict[str, List[float]] = field(default_factory=dict)
+    # set whenever the window moves, so that an unchanged baseline isn't written back
+    unsaved: bool = field(default=False, compare=False)
+
+    def add_day(self, dt_date: date, scores: Dict[str, float]):
+        """Add a day's keyword scores, replacing whatever was there for that day before."""
+        self.remove_day(dt_date)
+        self.daily[dt_date.isoformat()] = scores
+        self._apply(scores, 1)
+        self.unsaved = True
+
+    def remove_day(self, dt_date: date):
+        """Take a day's keyword scores back out. Does nothing for days which aren't in the baseline."""
+        if (scores := self.daily.pop(dt_date.isoformat(), None)) is not None:
+            self._apply(scores, -1)
+            self.unsaved = True
+
+    def surprise(self, keyword: str, score: float) -> float:
+        """How many standard deviations `score` is above the keyword's daily mean, counting days it didn't show up
+        as zero. The variance gets +1 so that keywords which are new, or have never varied, don't divide by zero."""
+        n = len(self.daily)
+        if not n:
+            return score
+        _, total, squares = self.sums.get(keyword, (0, 0.0, 0.0))
+        mean = total / n
+        variance = max(squares / n - mean**2, 0.0)
+        return (score - mean) / math.sqrt(variance + 1)
+
+    def rank(self, scores: Iterable[Tuple[str, float]]) -> List[Tuple[str, float, float]]:
+        """(keyword, score, surprise) for each of today's keywords, most surprising first."""
+        ranked = [(keyword, score, self.surprise(keyword, score)) for keyword, score in scores]
+        return sorted(ranked, key=lambda i: (-i[2], -i[1], i[0]))
+
+    def _apply(self, scores: Dict[str, float], sign: int):
+        for keyword, score in scores.items():
+            sums = self.sums.setdefault(keyword, [0, 0.0, 0.0])
+            sums[0] += sign
+            sums[1] += sign * score
+            sums[2] += sign * score**2
+            if sums[0] == 0:
+                del self.sums[keyword]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"version": self.version, "days": self.days, "daily": self.daily, "sums": self.sums}
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> Optional["KeywordBaseline"]:
+        """Load a stored baseline. Returns None if it was written by an incompatible version."""
+        if data.get("version") != BASELINE_VERSION:
+            return None
+        return KeywordBaseline(days=data["days"], daily=data["daily"], sums=data["sums"])
+
+
+def get_baseline_key(days: int = TREND_DAYS) -> str:
+    return f"{KEYWORD_BASELINE_KEY}-{days}d"
+
+
+def read_baseline(statsio: StatsIO, days: int = TREND_DAYS) -> KeywordBaseline:
+    """Read the stored baseline, starting a fresh one if there isn't a usable one stored."""
+    try:
+        if baseline := KeywordBaseline.from_dict(statsio.read(TRENDS_PREFIX, get_baseline_key(days))):
+            log.info(f"found a keyword baseline covering {len(baseline.daily)} days")
+            return baseline
+        log.info("stored keyword baseline is from an older version, rebuilding...")
+    except KeyError:
+        log.info("no keyword baseline found, starting fresh...")
+    return KeywordBaseline(days=days)
+
+
+def write_baseline(statsio: StatsIO, baseline: KeywordBaseline) -> int:
+    """Store the baseline, skipping the write if the window didn't move. Returns bytes written."""
+    if not baseline.unsaved:
+        return 0
+    written = statsio.write(TRENDS_PREFIX, **{get_baseline_key(baseline.days): baseline.to_dict()})
+    baseline.unsaved = False
+    return written
+
+
+def refresh_baseline(statsio: StatsIO, baseline: KeywordBaseline, dt_date: date) -> KeywordBaseline:
+    """Move the baseline's window to cover the N days before `dt_date`.
+
+    Days leaving the window are subtracted, days entering it are read from their keyword partials. Days without a
+    partial are left out and tried again next time."""
+    window = {(dt_date - timedelta(days=i)).isoformat() for i in range(1, baseline.days + 1)}
+    for expired in set(baseline.daily) - window:
+        baseline.remove_day(date.fromisoformat(expired))
+
+    for missing in sorted(window - set(baseline.daily)):
+        missing_date = date.fromisoformat(missing)
+        if (scores := _read_daily_scores(statsio, missing_date)) is not None:
+            baseline.add_day(missing_date, scores)
+    return baseline
+
+
+def _read_daily_scores(statsio: StatsIO, dt_date: date) -> Optional[Dict[str, float]]:
+    try:
+        partial = KeywordPartial.from_dict(statsio.read(statsio.get_dt_prefix(dt_date), KEYWORD_PARTIAL_KEY))
+    except KeyError:
+        return None
+    if partial is None:
+        return None
+    return dict(partial.get_scores(min_score=KEYWORD_MIN_SCORE))
@@ -1,15 +1,18 @@
 from ast import mod
 from asyncio import threads
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import asdict, dataclass, field
 import logging
 import os
 from random import randint
 import re
+import threading
+import time
 
 from datetime import date, datetime, timedelta, timezone
 from tabnanny import check
 from token import OP
-from typing import Any, Dict, Generator, Hashable, List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, Generator, Hashable, List, Optional, Tuple, Union
 
 import json
 from unittest import result
@@ -23,11 +26,13 @@ from pandas import DataFrame
 from praw.exceptions import ClientException, RedditAPIException
 
 from tacostats.statsio import StatsIO
+from tacostats.author_rollups import AuthorDay, AuthorRollup, merge_author_days, read_author_rollups
 
 # from tacostats.stats import find_top_emoji
 from tacostats.models import Comment, Thread
-from tacostats.openai_api import MaxTokensExceededError, create_chat_completion, estimate_tokens
-from tacostats.config import CHAT_MODEL, GPT_MODE, MAX_TOKENS, USE_CACHE
+from tacostats.openai_api import MaxTokensExceededError, create_chat_completion, estimate_tokens, estimate_tokens_batch
+from tacostats.config import CHAT_MODEL, GPT_MODE, MAX_TOKENS, PROFILE_MEMORY, USE_CACHE, USERSTATS_WORKERS
+from tacostats.timings import span, stage, timed, write_timings
 from tacostats.util import build_time_indexed_df, render_template
 
 # from tacostats.reddit.report import reply
@@ -40,6 +45,17 @@ USERSTATS_PREFIX = "userstats"
 
 statsio = StatsIO()
 
+# hands out a window's rollups, reading them the first time they're asked for, see `_lazy_rollups`
+RollupsGetter = Callable[[], Dict[date, AuthorRollup]]
+
+# (days, end date) -> (time built, overall stats), so that warm invocations don't even need to read them. only the
+# latest dt's are kept, see `_cache_daily_stats`
+_daily_stats_cache: Dict[Tuple[int, date], Tuple[float, Dict[str, Any]]] = {}
+
+
+class NoCommentsError(Exception):
+    """The user didn't comment in the window asked about, retrying won't change that."""
+
 
 @dataclass
 class UserStatsResults:
@@ -73,45 +89,105 @@ class UserStatsResults:
 
 
 def lambda_handler(event, context):
-    """AWS Lambda handler which receives batched messages from SQS"""
+    """AWS Lambda handler which receives batched messages from SQS.
+
+    Messages are grouped by how many days they cover so that the overall stats for each window are only built once,
+    then worked through concurrently. Only the messages which failed are handed back to SQS to be retried."""
     msg_count = len(event["Records"])
     log.info(f"userstats started. processing {msg_count} messages.")
 
+    failures: List[str] = []
     # expecting messages like `{username, requester_comment_id, days, ...}`
-    for idx, msg in enumerate(event["Records"]):
-        data = json.loads(msg["body"])
-        username = data["username"]
-        days = data["days"]
-        comment_id = data["requester_comment_id"]
-
-        log.info(f"({idx}/{msg_count}) ({comment_id}) getting stats for {username} across {days} days...")
-        process_userstats(username, comment_id, days)
-
-
-def process_userstats(username: str, comment_id: str, days: int = 7):
-    """dt stats but for a single user"""
-    results = None
-    if USE_CACHE:
-        log.info(f"cache hit: {username} / {days}.")
-        results = _read_results(username, days)
-    if not results:
-        log.info(f"cache miss: {username} / {days}. building results...")
-        results = _build_results(username, days)
-    log.debug(f"results: {results}")
-
-    # post comment
-    template = "userstats.md.j2" if not GPT_MODE else "userstats_gpt_response.md.j2"
-    try:
-        print(f"replying to {comment_id}")
-        # reply(asdict(results), template, comment_id)
-    except RedditAPIException as e:
-        log.exception(f"While trying to reply, Reddit reported an error: {e}")
-    except ClientException as e:
-        log.exception(f"While trying to reply, PRAW reported an error: {e}")
-    except Exception as e:
-        log.exception(f"While trying to reply, an unknown exception occurred: {e}")
-    else:
-        log.info(f"replied to {comment_id}")
+    requests: Dict[int, List[Tuple[str, Dict[str, Any]]]] = {}
+    for msg in event["Records"]:
+        try:
+            data = json.loads(msg["body"])
+            requests.setdefault(int(data["days"]), []).append((msg["messageId"], data))
+        except (KeyError, TypeError, ValueError) as e:
+            log.exception(f"({msg['messageId']}) unable to read message: {e}")
+            failures.append(msg["messageId"])
+
+    for days, batch in requests.items():
+        failures += _process_batch(days, batch)
+
+    log.info(f"userstats finished. {msg_count - len(failures)}/{msg_count} messages succeeded.")
+    return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in failures]}
+
+
+def _process_batch(days: int, batch: List[Tuple[str, Dict[str, Any]]]) -> List[str]:
+    """Process requests covering the same number of days, returning the message ids of any which failed.
+
+    The window's rollups are read (and any missing ones built) at most once, and only if the overall stats or a user's
+    results actually need building, so a warm batch never reads them. That shared work is timed on its own, and the
+    batch's timer owns tracemalloc so that requests finishing early can't stop it under the others."""
+    with timed("userstats_batch", profile_memory=PROFILE_MEMORY) as timer:
+        get_rollups = _lazy_rollups(days)
+        try:
+            overall_stats = _get_daily_stats(days, get_rollups)
+        except Exception as e:
+            log.exception(f"unable to build overall stats across {days} days: {e}")
+            failures = [message_id for message_id, _ in batch]
+        else:
+            failures = _process_requests(days, batch, overall_stats, get_rollups)
+    write_timings(statsio, statsio.latest_dt_prefix, timer)
+    return failures
+
+
+def _process_requests(
+    days: int, batch: List[Tuple[str, Dict[str, Any]]], overall_stats: Dict[str, Any], get_rollups: RollupsGetter
+) -> List[str]:
+    """Work through a batch's requests concurrently, returning the message ids of any which failed."""
+
+    def process(message_id: str, data: Dict[str, Any]) -> Optional[str]:
+        try:
+            username, comment_id = data["username"], data["requester_comment_id"]
+            log.info(f"({message_id}) ({comment_id}) getting stats for {username} across {days} days...")
+            process_userstats(username, comment_id, days, overall_stats=overall_stats, get_rollups=get_rollups)
+        except NoCommentsError as e:
+            log.warning(f"({message_id}) {e}, dropping the request.")
+        except Exception as e:
+            log.exception(f"({message_id}) unable to get stats for {data}: {e}")
+            return message_id
+
+    with ThreadPoolExecutor(max_workers=max(1, USERSTATS_WORKERS)) as executor:
+        return [failed for failed in executor.map(lambda r: process(*r), batch) if failed]
+
+
+def process_userstats(
+    username: str,
+    comment_id: str,
+    days: int = 7,
+    overall_stats: Optional[Dict[str, Any]] = None,
+    get_rollups: Optional[RollupsGetter] = None,
+):
+    """dt stats but for a single user. `overall_stats` and the window's rollups are read if they aren't provided"""
+    # concurrent requests share one heap, so their memory can't be told apart
+    with timed("userstats", profile_memory=PROFILE_MEMORY and USERSTATS_WORKERS <= 1) as timer:
+        results = None
+        if USE_CACHE:
+            log.info(f"cache hit: {username} / {days}.")
+            results = _read_results(username, days, overall_stats)
+        if not results:
+            log.info(f"cache miss: {username} / {days}. building results...")
+            results = _build_results(username, days, overall_stats, get_rollups)
+        log.debug(f"results: {results}")
+
+        # post comment
+        template = "userstats.md.j2" if not GPT_MODE else "userstats_gpt_response.md.j2"
+        try:
+            print(f"replying to {comment_id}")
+            # reply(asdict(results), template, comment_id)
+        except RedditAPIException as e:
+            log.exception(f"While trying to reply, Reddit reported an error: {e}")
+        except ClientException as e:
+            log.exception(f"While trying to reply, PRAW reported an error: {e}")
+        except Exception as e:
+            log.exception(f"While trying to reply, an unknown exception occurred: {e}")
+        else:
+            log.info(f"replied to {comment_id}")
+
+    # userstats aren't tied to a dt, so they're filed under the latest one
+    write_timings(statsio, statsio.latest_dt_prefix, timer)
 
 
 def _sample_threads(thread_sizes: List[Tuple[str, int]]) -> Generator[Tuple[str, int], None, None]:
@@ -139,19 +215,75 @@ def _get_span(days: int) -> Optional[str]:
         return "all time"
 
 
-def _get_daily_stats(days: int) -> Dict[str, Any]:
-    """Return a dict of daily stats for the last N days"""
-    dt_dates = statsio.get_dt_dates(daysago=days)
-    comments = list(statsio.read_comments(dt_dates))
-    df = DataFrame([c.to_dict() for c in comments])  # type: ignore
+@stage
+def _get_daily_stats(days: int, get_rollups: Optional[RollupsGetter] = None) -> Dict[str, Any]:
+    """Return a dict of daily stats for the last N days. These are the same for every user, so they're cached in memory
+    and in storage for as long as a user's own results would be.
+
+    Storage keeps one copy per window, overwritten whenever a newer dt comes along."""
+    end_date = statsio.latest_dt_date
+    max_age = _get_max_age(days)
+    if (cached := _daily_stats_cache.get((days, end_date))) and time.time() - cached[0] < max_age:
+        log.info(f"overall stats for {days} days ending {end_date} found in memory.")
+        return cached[1]
+
+    key = f"overall-{days}d"
+    try:
+        if (age := statsio.get_age(USERSTATS_PREFIX, key)) < max_age:
+            stored = statsio.read(USERSTATS_PREFIX, key)
+            if stored["end_date"] == statsio.get_dt_prefix(end_date):
+                log.info(f"overall stats for {days} days ending {end_date} found in storage.")
+                _cache_daily_stats(days, end_date, time.time() - age, stored["stats"])
+                return stored["stats"]
+    except KeyError:
+        pass
+
+    log.info(f"building overall stats for {days} days ending {end_date}...")
+    daily_stats = _build_daily_stats(days, get_rollups() if get_rollups else None)
+    statsio.write(dt_prefix=USERSTATS_PREFIX, **{key: {"end_date": statsio.get_dt_prefix(end_date), "stats": daily_stats}})
+    _cache_daily_stats(days, end_date, time.time(), daily_stats)
+    return daily_stats
+
+
+def _cache_daily_stats(days: int, end_date: date, built: float, daily_stats: Dict[str, Any]):
+    """keep overall stats in memory, dropping any for older dts since they'll never be asked for again"""
+    for key in [k for k in _daily_stats_cache if k[1] != end_date]:
+        del _daily_stats_cache[key]
+    _daily_stats_cache[(days, end_date)] = (built, daily_stats)
+
+
+def _build_daily_stats(days: int, rollups: Optional[Dict[date, AuthorRollup]] = None) -> Dict[str, Any]:
+    rollups = rollups if rollups is not None else _read_rollups(days)
+    total = merge_author_days(a for r in rollups.values() for a in r.authors.values())
     return {
-        "comments_per_day": _get_comments_per_day_by_user(df),
-        "words_per_comment": _get_words_per_comment(df),
-        "top_comment": _get_top_comment(df),
-        "average_score": _get_average_score(df),
+        "comments_per_day": _get_comments_per_day_by_user(rollups),
+        "words_per_comment": _get_words_per_comment(total),
+        "top_comment": _get_top_comment(total),
+        "average_score": _get_average_score(total),
     }
 
 
+def _lazy_rollups(days: int) -> RollupsGetter:
+    """share a window's rollups between threads without reading them until something needs them"""
+    lock = threading.Lock()
+    read: List[Dict[date, AuthorRollup]] = []
+
+    def get_rollups() -> Dict[date, AuthorRollup]:
+        with lock:
+            if not read:
+                read.append(_read_rollups(days))
+            return read[0]
+
+    return get_rollups
+
+
+def _read_rollups(days: int) -> Dict[date, AuthorRollup]:
+    with span("read_rollups") as s:
+        rollups = read_author_rollups(statsio, statsio.get_dt_dates(daysago=days))
+        s.rows = len(rollups)
+    return rollups
+
+
 def _build_system_prompt(threads_by_score: List[Tuple[str, int]], results: UserStatsResults) -> str:
     """Build a system prompt for GPT-4 based on the top threads"""
     threads_str = "\n".join([t[0] for t in threads_by_score])
@@ -167,6 +299,7 @@ def _build_system_prompt(threads_by_score: List[Tuple[str, int]], results: UserS
     )
 
 
+@stage
 def _get_gpt_response(results: UserStatsResults, model: str = CHAT_MODEL) -> str:
     # The following is a summary of their activity over the last {results.span}.
     # They wrote {results.comments_per_day['max']} comments in a single day,
@@ -198,25 +331,27 @@ def _get_gpt_response(results: UserStatsResults, model: str = CHAT_MODEL) -> str
     # Keep it SHORT -- 150-200 words MAX.
     threads_by_score = sorted([(t.to_slim_text(), t.get_avg_score()) for t in results.threads], key=lambda x: x[1], reverse=True)
     chat_prompt = render_template({"username": results.username, "span": results.span}, "userstats_chat_prompt.txt.j2")
+
+    # fit as many of the best threads as possible under the token limit, leaving room for the prompts themselves
+    with span("pack_threads") as s:
+        overhead = estimate_tokens(chat_prompt + _build_system_prompt([], results), model)
+        threads_by_score = _pack_threads(threads_by_score, MAX_TOKENS * 0.8 - overhead, model)
+        s.rows = len(threads_by_score)
     system_prompt = _build_system_prompt(threads_by_score, results)
     token_estimate = estimate_tokens(chat_prompt + system_prompt, model)
 
-    # if over MAX_TOKENS, pop low-score threads until we're under to the token limit
-    while token_estimate > MAX_TOKENS * 0.8:
-        threads_by_score.pop(-1)
-        system_prompt = _build_system_prompt(threads_by_score, results)
-        token_estimate = estimate_tokens(chat_prompt + system_prompt, model)
-
     log.info(f"using {len(threads_by_score)}/{len(results.threads)} threads ({token_estimate} tokens) for GPT response.")
 
     response = ""
     attempts = 0
     while response == "" and attempts < 3:
+        attempts += 1
         try:
             response = create_chat_completion(chat_prompt, system_prompt, temperature=0, model=model)
         except MaxTokensExceededError as exc:
             # this shouldn't be necessary, but just in case
-            attempts += 1
+            if not threads_by_score:
+                raise
             threads_by_score.pop(-1)
             system_prompt = _build_system_prompt(threads_by_score, results)
             log.error(f"{exc}. retrying with {len(threads_by_score)} threads...")
@@ -234,87 +369,137 @@ def _get_gpt_response(results: UserStatsResults, model: str = CHAT_MODEL) -> str
         #     response = ""
         #     log.error("gpt response was rejected. retrying...")
 
+    if response:
+        return response
     raise RuntimeError("unable to generate chat completion.")
 
 
-def _build_results(username: str, days: int) -> UserStatsResults:
+def _pack_threads(threads_by_score: List[Tuple[str, int]], budget: float, model: str = CHAT_MODEL) -> List[Tuple[str, int]]:
+    """Take threads in score order, skipping any which no longer fit in `budget` tokens. Each thread is only
+    tokenized once, rather than the whole prompt being re-rendered and re-tokenized for every thread dropped."""
+    sizes = estimate_tokens_batch([t[0] for t in threads_by_score], model)
+    packed = []
+    used = 0
+    for thread, size in zip(threads_by_score, sizes):
+        # +1 for the newline joining it to the others
+        if used + size + 1 <= budget:
+            packed.append(thread)
+            used += size + 1
+    return packed
+
+
+@stage
+def _build_results(
+    username: str,
+    days: int,
+    overall_stats: Optional[Dict[str, Any]] = None,
+    get_rollups: Optional[RollupsGetter] = None,
+) -> UserStatsResults:
     """read in author comments and return result set"""
-    # get all comments by a single author
-    dt_dates = statsio.get_dt_dates(daysago=days)
-    comments = list(statsio.read_comments(dt_dates, username))
-    # yeah... we're swapping a dataclass back to dict right after generating it, but whatever.
-    df = DataFrame([c.to_dict() for c in comments])  # type: ignore
-    top_emoji = []  # find_top_emoji(df) # TODO: Re-enable
-    span = _get_span(days) or "week"
+    # the author's totals for each dt, none of their comments need to be read unless GPT_MODE is on
+    rollups = get_rollups() if get_rollups else _read_rollups(days)
+    user_days = {d: r.authors[username] for d, r in rollups.items() if username in r.authors}
+    if not user_days:
+        raise NoCommentsError(f"no comments by {username} in the last {days} days")
+    total = merge_author_days(user_days.values())
+    span_name = _get_span(days) or "week"
     results = UserStatsResults(
-        comments_per_day=_get_comments_per_day(df),
-        words_per_comment=_get_words_per_comment(df),
-        top_emoji=top_emoji[0] if len(top_emoji) > 0 else None,
-        top_comment=_get_top_comment(df),
-        average_score=_get_average_score(df),
+        comments_per_day=_get_comments_per_day(user_days, list(rollups)),
+        words_per_comment=_get_words_per_comment(total),
+        top_emoji=_get_top_emoji(total),
+        top_comment=_get_top_comment(total),
+        average_score=_get_average_score(total),
         username=username,
-        span=span,
-        overall_stats=_get_daily_stats(days),
+        span=span_name,
+        overall_stats=overall_stats if overall_stats is not None else _get_daily_stats(days, lambda: rollups),
     )
     log.info(f"results: {results}")
 
     if GPT_MODE:
-        results.threads = list(statsio.read_threads(dt_dates, username))
+        with span("read_threads") as s:
+            results.threads = list(statsio.read_threads(statsio.get_dt_dates(daysago=days), username))
+            s.rows = len(results.threads)
         results.gpt_response = _get_gpt_response(results)
 
-    statsio.write(dt_prefix=USERSTATS_PREFIX, **{_get_user_prefix(username, span): results.to_dict()})
+    with span("write") as s:
+        s.bytes = statsio.write(dt_prefix=USERSTATS_PREFIX, **{_get_user_prefix(username, span_name): results.to_dict()})
     return results
 
 
-def _read_results(username, days) -> Optional[UserStatsResults]:
+@stage
+def _read_results(username, days, overall_stats: Optional[Dict[str, Any]] = None) -> Optional[UserStatsResults]:
     """read in past results if they are fresh enough, returns None if too old or not found"""
-    # default to daily allowed refresh...
-    max_age = 24 * 60 * 60
-    # except for today's stats, allow hourly...
-    if days == 1:
-        max_age = max_age / 24
-    # and for all-time stats, only allow weekly...
-    if days > 30:
-        max_age = max_age * 7
-
     user_prefix = _get_user_prefix(username, _get_span(days) or "")
     try:
-        if statsio.get_age(USERSTATS_PREFIX, user_prefix) < max_age:
+        if statsio.get_age(USERSTATS_PREFIX, user_prefix) < _get_max_age(days):
             results = UserStatsResults(**statsio.read(USERSTATS_PREFIX, user_prefix))
             if GPT_MODE and not results.gpt_response:
                 if not results.threads:
                     log.debug(f"no threads found in stored results for {username}. fetching...")
                     results.threads = list(statsio.read_threads(statsio.get_dt_dates(daysago=days), username))
-                _, results.gpt_response = _get_gpt_response(results)
-                statsio.write(dt_prefix=USERSTATS_PREFIX, **{_get_user_prefix(username, results.span): asdict(results)})
-
+                # overall stats aren't stored with a user's results, but the prompt needs them
+                results.overall_stats = overall_stats if overall_stats is not None else _get_daily_stats(days)
+                results.gpt_response = _get_gpt_response(results)
+                statsio.write(dt_prefix=USERSTATS_PREFIX, **{_get_user_prefix(username, results.span): results.to_dict()})
+            return results
     except KeyError:
         pass
+    return None
 
 
-def _get_top_comment(df: DataFrame) -> Dict[Hashable, Any]:
-    """Return comment with most upvotes as a dict with `body`, `score`, and `permalink` keys"""
-    return df[["body", "score", "permalink"]].sort_values(by="score", ascending=False).head(1).to_dict("records")[0]
+def _get_max_age(days: int) -> float:
+    """how old, in seconds, stored results for a window can be before they're rebuilt"""
+    # default to daily allowed refresh...
+    max_age = 24 * 60 * 60
+    # except for today's stats, allow hourly...
+    if days == 1:
+        max_age = max_age / 24
+    # and for all-time stats, only allow weekly...
+    if days > 30:
+        max_age = max_age * 7
+    return max_age
+
+
+def _get_top_comment(total: AuthorDay) -> Dict[Hashable, Any]:
+    """Return comment with most upvotes as a dict with `body`, `score`, and `permalink` keys. The body is cut short
+    for long comments, see TOP_COMMENT_EXCERPT."""
+    return {"body": total.top_body, "score": total.top_score, "permalink": total.top_permalink}
 
 
-def _get_average_score(df: DataFrame):
+def _get_average_score(total: AuthorDay) -> float:
     """Get average comment score"""
-    return df["score"].mean()
+    return total.score / total.comment_count if total.comment_count else float("nan")
 
 
-def _get_comments_per_day(df: DataFrame) -> Dict[str, Union[int, float, str]]:
-    """Find max and mean comments per day"""
-    tdf = build_time_indexed_df(df)
-    cpd = tdf.groupby([pandas.Grouper(freq="D")]).size()  # type: ignore
-    max_day = cpd[cpd == cpd.max()].index.values[0]  # type: ignore
-    return {"max": cpd.max(), "mean": cpd.mean(), "max_day": _get_friendly_date_string(max_day)}
+def _get_top_emoji(total: AuthorDay) -> Optional[List]:
+    """Return the most used emoji as [uses, emoji], or None if there weren't any"""
+    if not total.emoji:
+        return None
+    emoji = min(total.emoji, key=lambda e: (-total.emoji[e], e))
+    return [total.emoji[emoji], emoji]
 
 
-def _get_comments_per_day_by_user(df: DataFrame) -> Dict[str, Union[int, float, str]]:
+@stage
+def _get_comments_per_day(user_days: Dict[date, AuthorDay], dt_dates: List[date]) -> Dict[str, Union[int, float, str]]:
+    """Find max and mean comments per day, counting quiet days between the first and last active ones"""
+    active = sorted(user_days)
+    days_spanned = len([d for d in dt_dates if active[0] <= d <= active[-1]])
+    counts = {d: user_days[d].comment_count for d in active}
+    max_day = min(counts, key=lambda d: (-counts[d], d))
+    return {
+        "max": counts[max_day],
+        "mean": sum(counts.values()) / days_spanned,
+        "max_day": _get_friendly_date_string(numpy.datetime64(max_day)),
+    }
+
+
+@stage
+def _get_comments_per_day_by_user(rollups: Dict[date, AuthorRollup]) -> Dict[str, Union[int, float, str]]:
     """Find max and mean comments per day"""
-    tdf = build_time_indexed_df(df)
-    cpu = tdf.groupby([pandas.Grouper("author"), pandas.Grouper(freq="D")]).size()  # type: ignore
-    return {"max": cpu.max(), "mean": cpu.mean()}
+    counts = [a.comment_count for r in rollups.values() for a in r.authors.values()]
+    if not counts:
+        return {"max": 0, "mean": 0.0}
+    return {"max": max(counts), "mean": sum(counts) / len(counts)}
 
 
 def _get_comments_per_hour(df: DataFrame) -> Dict[str, Union[int, float]]:
@@ -325,10 +510,9 @@ def _get_comments_per_hour(df: DataFrame) -> Dict[str, Union[int, float]]:
     return {"max": cph.max(), "mean": cph.mean(), "max_hour": max_hour}
 
 
-def _get_words_per_comment(df: DataFrame) -> Dict[str, Union[int, float]]:
+def _get_words_per_comment(total: AuthorDay) -> Dict[str, Union[int, float]]:
     """Find max and mean words per comment"""
-    wc = df["body"].str.count(" ") + 1
-    return {"max": wc.max(), "mean": wc.mean()}
+    return {"max": total.max_words, "mean": total.word_count / total.comment_count if total.comment_count else 0.0}
 
 
 def _get_friendly_date_string(dt64: numpy.datetime64) -> str:
@@ -1,24 +1,38 @@
-from collections import Counter
+from collections import Counter, OrderedDict
 import json
 import logging
 import re
+import zlib
 
 from datetime import date, datetime, timedelta, timezone
-from typing import Optional
+from typing import Iterable, List, Optional, Pattern, Tuple
 
 import emoji
 from jinja2 import Environment, PackageLoader, select_autoescape
 import numpy
+import pandas
 import pytz
 
-from pandas import DataFrame
+from dateutil.tz import datetime_ambiguous, gettz
+from pandas import DataFrame, Series
+from pandas.api.types import is_numeric_dtype
 
 from tacostats.config import CREATE_TIME
 
 NEUTER_RE = re.compile(r"!ping", re.MULTILINE | re.IGNORECASE | re.UNICODE)
+EASTERN = pytz.timezone("US/Eastern")
+EPOCH = pandas.Timestamp(0, tz="UTC")
 
 log = logging.getLogger(__name__)
 
+# compiled lazily, building it from the emoji database takes a moment
+_EMOJI_REGEX: Optional[Pattern] = None
+
+# emoji found per (comment id, body hash), so edits miss. least recently used entries are dropped past
+# EMOJI_CACHE_SIZE, it outlives each run in a warm lambda
+EMOJI_CACHE_SIZE = 50_000
+_EMOJI_CACHE: "OrderedDict[Tuple[str, str], List[str]]" = OrderedDict()
+
 
 def get_target_dt_date(daysago: int, date_from: Optional[datetime | date] = None) -> date:
     """Returns a past DT's date from N days ago"""
@@ -36,20 +50,96 @@ def get_target_dt_date(daysago: int, date_from: Optional[datetime | date] = None
     return (datetime.combine(create_date, CREATE_TIME) - timedelta(days=daysago)).date()
 
 
+def get_emoji_regex() -> Pattern:
+    """Returns a single regex matching every emoji in the emoji database, longest sequences first."""
+    global _EMOJI_REGEX
+    if _EMOJI_REGEX is None:
+        # longest first so that ZWJ sequences, skin tones, flags, etc win out over their components
+        ordered = sorted(emoji.EMOJI_DATA, key=len, reverse=True)
+        _EMOJI_REGEX = re.compile("|".join(re.escape(e) for e in ordered))
+    return _EMOJI_REGEX
+
+
 def find_emoji(body: str) -> list[str]:
     """Returns all of the emoji in a given string in the order that they appear."""
-    return [i["emoji"] for i in emoji.emoji_list(body)]
+    # every emoji has at least one non-ascii codepoint, most comments have none at all
+    if not body or body.isascii():
+        return []
+    return get_emoji_regex().findall(body)
+
+
+def find_emoji_batch(bodies: Series, ids: Optional[Iterable[str]] = None) -> Series:
+    """Returns the emoji in each body of a column. When `ids` are supplied, results are cached per comment id."""
+    if ids is None:
+        return bodies.apply(find_emoji)
+
+    results = []
+    for id, body in zip(ids, bodies):
+        key = (id, body_hash(body))
+        cached = _EMOJI_CACHE.get(key)
+        if cached is None:
+            cached = _EMOJI_CACHE[key] = find_emoji(body)
+            if len(_EMOJI_CACHE) > EMOJI_CACHE_SIZE:
+                _EMOJI_CACHE.popitem(last=False)
+        else:
+            _EMOJI_CACHE.move_to_end(key)
+        results.append(cached)
+    return Series(results, index=bodies.index, dtype=object)
 
 
 def build_time_indexed_df(df: DataFrame) -> DataFrame:
-    """Copies the basic dataframe and indexes it along creation time in EST"""
-    tdf = df.copy(deep=True)
-    tdf["created_utc"] = tdf["created_utc"].apply(from_utc_to_est)
-    tdf.rename(columns={"created_utc": "created_et"}, inplace=True)
-    tdf.set_index("created_et", inplace=True)
+    """Returns a view of the basic dataframe indexed along creation time in EST.
+
+    The view shares its columns with `df` rather than copying them. Treat the result as read-only.
+    """
+    tdf = df.copy(deep=False)
+    tdf.index = pandas.DatetimeIndex(to_eastern(df["created_utc"]), name="created_et")
     return tdf
 
 
+def to_eastern(created_utc: Series) -> Series:
+    """Vectorized `from_utc_to_est` over a column of datetimes or unix timestamps."""
+    if is_numeric_dtype(created_utc):
+        return pandas.to_datetime(created_utc, unit="s", utc=True).dt.tz_convert(EASTERN)
+
+    naive = pandas.to_datetime(created_utc)
+    if naive.dt.tz is not None:
+        return naive.dt.tz_convert(EASTERN)
+
+    # naive datetimes come from `datetime.fromtimestamp` and so are in local time. the local zone's file rather than
+    # `tzlocal()`, which pandas would ask for every value's offset one at a time. everything is taken to be the first
+    # pass through the hour repeated when the clocks go back
+    local = gettz()
+    created = naive.dt.tz_localize(local, ambiguous=True, nonexistent="shift_forward").dt.tz_convert("UTC")
+    # the second pass is marked by `fold`, which only survives on python datetimes (datetime64 columns have lost it).
+    # whether the clocks repeat a time is down to its hour, so each distinct hour is checked rather than every comment,
+    # and only comments in a repeated hour are looked at one by one
+    if created_utc.dtype == object:
+        hours = naive.dt.floor("h")
+        last_second = pandas.Timedelta(hours=1, seconds=-1)
+        repeated_hours = [
+            h
+            for h in hours.dropna().unique()
+            if datetime_ambiguous(h.to_pydatetime(), local) or datetime_ambiguous((h + last_second).to_pydatetime(), local)
+        ]
+        repeated = numpy.flatnonzero(hours.isin(repeated_hours)) if repeated_hours else []
+        second_pass = [i for i in repeated if getattr(created_utc.iat[i], "fold", 0) == 1]
+        if second_pass:
+            timestamps = [created_utc.iat[i].timestamp() for i in second_pass]
+            created.iloc[second_pass] = pandas.to_datetime(timestamps, unit="s", utc=True).to_numpy()
+    return created.dt.tz_convert(EASTERN)
+
+
+def to_epoch_seconds(created_utc: Series) -> Series:
+    """Vectorized unix timestamps, in whole seconds, from a column of datetimes or unix timestamps."""
+    return (to_eastern(created_utc) - EPOCH) // pandas.Timedelta(seconds=1)
+
+
+def body_hash(body: str) -> str:
+    """Short, stable (across processes, unlike `hash()`) hash of a comment body."""
+    return format(zlib.crc32(body.encode("utf-8")), "08x")
+
+
 def neuter_ping(comment):
     comment["body"] = NEUTER_RE.sub("*ping", comment["body"])
     return comment
@@ -57,7 +147,7 @@ def neuter_ping(comment):
 
 def from_utc_to_est(created_utc: datetime) -> datetime:
     as_utc = datetime.fromtimestamp(created_utc.timestamp(), tz=timezone.utc)
-    return as_utc.astimezone(pytz.timezone("US/Eastern"))
+    return as_utc.astimezone(EASTERN)
 
 
 def now() -> int:
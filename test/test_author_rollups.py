@@ -0,0 +1,64 @@
+from datetime import date, datetime
+
+from tacostats.author_rollups import TOP_COMMENT_EXCERPT, AuthorDay, AuthorRollup, _backfill_author_rollup, merge_author_days
+from tacostats.models import Comment
+from tacostats.partials import Contribution, StatsPartial
+
+
+def _partial(*comments) -> StatsPartial:
+    partial = StatsPartial()
+    for comment_id, author, score, word_count, emoji in comments:
+        partial.add(comment_id, Contribution("f", author, "", score, word_count, 3600, emoji))
+    return partial
+
+
+def test_rollup_from_partial():
+    partial = _partial(("c1", "someguy", 5, 10, ["🌮"]), ("c2", "someguy", 9, 2, ["🌮", "🔥"]), ("c3", "", 0, 0, []))
+    comments = [Comment("someguy", None, 9, "c2", "/r/c2", "🌮 🔥" * TOP_COMMENT_EXCERPT, datetime.now())]
+    rollup = AuthorRollup.from_dict(AuthorRollup.from_partial(partial, comments).to_dict())
+    assert rollup is not None
+    top_body = ("🌮 🔥" * TOP_COMMENT_EXCERPT)[:TOP_COMMENT_EXCERPT]
+    assert rollup.authors == {"someguy": AuthorDay(2, 12, 10, 14, "c2", 9, {"🌮": 2, "🔥": 1}, "/r/c2", top_body)}
+
+
+def test_merge_author_days_tracks_top_comment():
+    days = [
+        AuthorDay(2, 12, 10, 14, "c2", 9, {"🌮": 2}, "/r/c2", "c2 body"),
+        AuthorDay(1, 3, 3, 20, "d1", 20, {"🌮": 1}, "/r/d1", "d1 body"),
+        AuthorDay(1, 3, 3, 20, "a1", 20, {}, "/r/a1", "a1 body"),
+    ]
+    total = merge_author_days(days)
+    assert (total.comment_count, total.max_words, total.score, total.emoji) == (4, 10, 54, {"🌮": 3})
+    assert (total.top_comment_id, total.top_permalink, total.top_body) == ("a1", "/r/a1", "a1 body")
+
+
+class FakeStatsIO:
+    def __init__(self, comments):
+        self.comments = comments
+        self.written = {}
+
+    def get_dt_prefix(self, dt_date):
+        return dt_date.isoformat()
+
+    def read_dt_comments(self, dt_date):
+        if self.comments is None:
+            raise KeyError(dt_date)
+        return self.comments
+
+    def read(self, prefix, key):
+        raise KeyError(key)
+
+    def write(self, prefix, **kwargs):
+        self.written.update(kwargs)
+
+
+def test_backfilled_rollups_come_from_the_dts_own_comments():
+    statsio = FakeStatsIO([Comment("someguy", None, 9, "c1", "/r/c1", "late night tacos", datetime(2024, 2, 18, 1))])
+    rollup = _backfill_author_rollup(statsio, date(2024, 2, 17))
+    assert (rollup.authors["someguy"].top_permalink, rollup.authors["someguy"].top_body) == ("/r/c1", "late night tacos")
+    assert list(statsio.written) == ["author_rollup"]
+
+    # nothing to build it from yet, so nothing is stored which would stop it being built properly later
+    statsio = FakeStatsIO(None)
+    assert _backfill_author_rollup(statsio, date(2024, 2, 17)).authors == {}
+    assert statsio.written == {}
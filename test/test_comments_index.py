@@ -0,0 +1,62 @@
+from datetime import date, datetime, timezone
+from unittest import mock
+
+import pytest
+
+from tacostats.models import Comment
+from tacostats.statsio import CommentsIndex, StatsIO
+
+
+def _comment(comment_id, created_utc):
+    return Comment(
+        author="someguy",
+        author_flair_text="",
+        score=1,
+        id=comment_id,
+        permalink=f"/r/{comment_id}",
+        body="tacos",
+        created_utc=created_utc,
+        parent_id="t3_dt",
+    )
+
+
+def _stored(comment_id, *created):
+    comment = _comment(comment_id, datetime(*created, tzinfo=timezone.utc)).to_dict()
+    comment["created_utc"] = comment["created_utc"].timestamp()
+    return comment
+
+
+# each dt runs from 07:00 utc until the next one is created, ie: well past midnight on both clocks
+COMMENTS = {
+    "2024-02-16": [_stored("y1", 2024, 2, 16, 20), _stored("y2", 2024, 2, 17, 6)],
+    "2024-02-17": [_stored("a1", 2024, 2, 17, 12), _stored("a2", 2024, 2, 18, 3)],
+}
+
+
+class FakeBackend:
+    def read(self, prefix, key):
+        if prefix not in COMMENTS:
+            raise KeyError(prefix)
+        return [dict(c) for c in COMMENTS[prefix]]
+
+
+@pytest.fixture
+def statsio(monkeypatch):
+    with mock.patch.object(StatsIO, "__init__", lambda self: None):
+        statsio = StatsIO()
+    statsio._backends = [FakeBackend()]
+    monkeypatch.setattr(StatsIO, "_idx", CommentsIndex())
+    return statsio
+
+
+def test_comments_are_grouped_by_the_dt_they_came_from(statsio):
+    statsio.update_index(date(2024, 2, 16))
+    assert sorted(c.id for c in statsio.read_comments(date(2024, 2, 17))) == ["a1", "a2"]
+    assert sorted(c.id for c in statsio.read_comments(date(2024, 2, 16))) == ["y1", "y2"]
+
+
+def test_a_dt_can_be_read_without_the_index(statsio):
+    assert [c.id for c in statsio.read_dt_comments(date(2024, 2, 17))] == ["a1", "a2"]
+    assert StatsIO._idx.size == 0
+    with pytest.raises(KeyError):
+        statsio.read_dt_comments(date(2024, 2, 15))
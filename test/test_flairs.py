@@ -0,0 +1,54 @@
+from pandas import Series
+
+from tacostats.flairs import FlairDictionary, read_flair_dictionary, write_flair_dictionary
+
+
+def test_only_unseen_flairs_are_parsed():
+    flair_dictionary = FlairDictionary()
+    labels = flair_dictionary.get_labels(Series([":taco: Taco", None, "plain text", ":taco: Taco", "x :flag-us: United States"]))
+    assert labels.tolist() == ["Taco", "", "", "Taco", "United States"]
+    assert flair_dictionary.flairs[":taco: Taco"] == [":taco:", "Taco"]
+    assert flair_dictionary.unsaved == 4
+
+    assert flair_dictionary.parse([":taco: Taco", ":ben: Bernanke"]) == 1
+    assert flair_dictionary.get_flairmoji(Series([":ben: Bernanke"])).tolist() == [":ben:"]
+
+
+def test_flair_dictionary_roundtrip():
+    flair_dictionary = FlairDictionary()
+    flair_dictionary.parse([":taco: Taco"])
+    loaded = FlairDictionary.from_dict(flair_dictionary.to_dict())
+    assert loaded == flair_dictionary
+    assert loaded.unsaved == 0
+    assert FlairDictionary.from_dict({"version": 0, "flairs": {}}) is None
+
+
+class FakeStatsIO:
+    def __init__(self):
+        self.stored = {}
+
+    def read(self, prefix, key):
+        return self.stored[(prefix, key)]
+
+    def write(self, prefix, **kwargs):
+        self.stored.update({(prefix, key): value for key, value in kwargs.items()})
+
+
+def test_writes_merge_with_what_was_stored_since_reading():
+    statsio = FakeStatsIO()
+    first, second = read_flair_dictionary(statsio), read_flair_dictionary(statsio)
+    first.parse([":taco: Taco"])
+    second.parse([":ben: Bernanke"])
+    write_flair_dictionary(statsio, first)
+    write_flair_dictionary(statsio, second)
+    assert read_flair_dictionary(statsio).flairs.keys() == {":taco: Taco", ":ben: Bernanke"}
+
+
+def test_merging_only_counts_new_flairs():
+    worker = FlairDictionary()
+    worker.parse([":taco: Taco", ":ben: Bernanke"])
+    flair_dictionary = FlairDictionary()
+    flair_dictionary.parse([":taco: Taco"])
+    assert flair_dictionary.merge(worker.flairs) == 1
+    assert flair_dictionary.flairs[":ben: Bernanke"] == [":ben:", "Bernanke"]
+    assert flair_dictionary.unsaved == 2
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import pytest
+
+from tacostats.fullstats import FULLSTATS_FORMAT, compact_full_stats, expand_full_stats
+from tacostats.models import Comment
+
+COMMENT = Comment(
+    author="someguy",
+    author_flair_text=None,
+    score=10,
+    id="abc",
+    permalink="/r/neoliberal/abc",
+    body="!ping TACO",
+    created_utc=datetime(2024, 2, 17, 12, 37),
+)
+
+FULL_STATS = {
+    "deleted": 1,
+    "spammiest": [{"author": "someguy", "author_flair_text": "", "comment_count": 2}],
+    "upvoted_comments": [{**COMMENT.to_dict(), "body": "*ping TACO"}],
+    "top_emoji": [[3, "🌮"], [1, "😤"]],
+    "flair_population": {"unflaired": 1, "flaired": []},
+    "activity": [0.0, 1.0],
+}
+
+
+def test_compact_is_columnar():
+    compact = compact_full_stats(FULL_STATS)
+    assert compact["format"] == FULLSTATS_FORMAT
+    assert compact["spammiest"] == {"author": ["someguy"], "author_flair_text": [""], "comment_count": [2]}
+    assert compact["upvoted_comments"] == {"id": ["abc"], "score": [10]}
+    assert compact["top_emoji"] == {"count": [3, 1], "emoji": ["🌮", "😤"]}
+
+
+def test_roundtrip_resolves_comments():
+    expanded = expand_full_stats(compact_full_stats(FULL_STATS), lambda ids: [COMMENT])
+    assert expanded == FULL_STATS
+
+
+def test_expand_without_comments():
+    expanded = expand_full_stats(compact_full_stats(FULL_STATS))
+    assert expanded["upvoted_comments"] == [{"id": "abc", "score": 10}]
+
+
+def test_legacy_format_passes_through():
+    assert expand_full_stats(FULL_STATS) is FULL_STATS
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        expand_full_stats({"format": -1})
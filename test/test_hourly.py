@@ -0,0 +1,33 @@
+from tacostats.hourly import HourlyTable
+from tacostats.partials import StatsPartial
+
+
+def _partial() -> StatsPartial:
+    partial = StatsPartial()
+    partial.author_hours = {
+        3600: {"bob": [2, 10], "alice": [2, 30], "carol": [1, 30]},
+        # nobody posted at 7200
+        10800: {"bob": [5, 5]},
+    }
+    return partial
+
+
+def test_totals_include_quiet_hours():
+    hourly = HourlyTable.from_partial(_partial())
+    assert hourly.totals("comment_count").tolist() == [5, 0, 5]
+    assert hourly.totals("word_count").tolist() == [70, 0, 5]
+
+
+def test_top_breaks_ties_by_author():
+    hourly = HourlyTable.from_partial(_partial())
+    assert hourly.top("comment_count") == [
+        {"created_et": 3600, "author": "alice", "comment_count": 2},
+        {"created_et": 10800, "author": "bob", "comment_count": 5},
+    ]
+    assert [r["author"] for r in hourly.top("word_count", keep_ties=True)] == ["alice", "carol", "bob"]
+
+
+def test_empty_partial():
+    hourly = HourlyTable.from_partial(StatsPartial())
+    assert hourly.top("comment_count") == []
+    assert hourly.totals("comment_count").tolist() == []
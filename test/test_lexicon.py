@@ -0,0 +1,18 @@
+from tacostats.config import BOT_TRIGGERS, COMMON_WORDS, STOPWORDS
+from tacostats.lexicon import filter_tokens, has_bot_trigger, is_common, is_junk
+
+
+def test_lookups_match_config_lists():
+    for word in ["tacos", STOPWORDS[0], COMMON_WORDS[0], BOT_TRIGGERS[0]]:
+        assert is_junk(word) == (word in COMMON_WORDS + STOPWORDS + BOT_TRIGGERS)
+    assert is_common(COMMON_WORDS[0])
+    assert not is_common("tacos")
+
+
+def test_bot_triggers_match_anywhere():
+    assert has_bot_trigger(f"what is my {BOT_TRIGGERS[0]} today")
+    assert not has_bot_trigger("nothing to see here")
+
+
+def test_filter_tokens():
+    assert filter_tokens(["ok", STOPWORDS[0], "tacos", "x" * 40, "x" * 39]) == ["tacos", "x" * 39]
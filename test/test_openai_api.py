@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+# the openai client wants a key as it's imported, none of these tests call openai
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from tacostats import openai_api
+from tacostats.openai_api import estimate_tokens, estimate_tokens_batch, get_encoding
+
+
+class FakeEncoding:
+    """a token per character, real encodings are downloaded the first time they're used"""
+
+    def encode(self, text):
+        return list(text)
+
+    def encode_batch(self, texts):
+        return [self.encode(t) for t in texts]
+
+
+@pytest.fixture(autouse=True)
+def loaded(monkeypatch):
+    loaded = []
+
+    def encoding_for_model(model):
+        loaded.append(model)
+        return FakeEncoding()
+
+    monkeypatch.setattr(openai_api.tiktoken, "encoding_for_model", encoding_for_model)
+    get_encoding.cache_clear()
+    yield loaded
+    get_encoding.cache_clear()
+
+
+def test_batch_estimates_match_single_estimates():
+    texts = ["", "tacos", "--- 2024-02-17T12:37 UTC ---\nsomeguy (1):today was a good day 🌮\n\n--- thread ends ---\n"]
+    assert estimate_tokens_batch(texts, "gpt-4") == [estimate_tokens(t, "gpt-4") for t in texts]
+    assert estimate_tokens_batch([], "gpt-4") == []
+
+
+def test_encodings_are_only_loaded_once(loaded):
+    assert get_encoding("gpt-4") is get_encoding("gpt-4")
+    estimate_tokens_batch(["tacos"], "gpt-4")
+    assert loaded == ["gpt-4"]
@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from tacostats.models import Comment
+from tacostats.parse_cache import ParseCache
+
+
+def _comment(id: str, body: str) -> Comment:
+    return Comment(author="someone", author_flair_text=None, score=1, id=id, permalink="", body=body, created_utc=datetime.now())
+
+
+def test_edited_comments_miss_the_cache():
+    cache = ParseCache()
+    assert cache.get(_comment("a", "tacos are good")) is None
+    cache.put(_comment("a", "tacos are good"), [(2.0, "tacos")])
+    assert cache.get(_comment("a", "tacos are good")) == [(2.0, "tacos")]
+    assert cache.get(_comment("a", "tacos are great")) is None
+    assert cache.unsaved == 1
+
+
+def test_parse_cache_roundtrip():
+    cache = ParseCache()
+    cache.put(_comment("a", "tacos are good"), [(2.0, "tacos")])
+    loaded = ParseCache.from_dict(cache.to_dict())
+    assert loaded == cache
+    assert loaded.unsaved == 0
+    assert ParseCache.from_dict({"version": 0, "comments": {}}) is None
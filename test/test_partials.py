@@ -0,0 +1,86 @@
+from tacostats.partials import Contribution, KeywordContribution, KeywordPartial, StatsPartial
+
+
+def _contribution(**kwargs) -> Contribution:
+    defaults = dict(fingerprint="a", author="someguy", author_flair_text="", score=1, word_count=3, hour=3600, emoji=["🌮"])
+    return Contribution(**{**defaults, **kwargs})
+
+
+def test_add_replaces_previous_contribution():
+    partial = StatsPartial()
+    partial.add("c1", _contribution())
+    partial.add("c1", _contribution(fingerprint="b", score=10))
+    assert partial.authors["someguy"] == [1, 3, 10, 1]
+    assert partial.emoji == {"🌮": 1}
+    assert partial.is_current("c1", "b")
+    assert not partial.is_current("c1", "a")
+
+
+def test_retract_prunes_empty_entries():
+    partial = StatsPartial()
+    partial.add("c1", _contribution())
+    partial.retract("c1")
+    assert partial.authors == {}
+    assert partial.flairs == {}
+    assert partial.hours == {}
+    assert partial.author_hours == {}
+    assert partial.emoji == {}
+
+
+def test_blank_comments_only_count_as_blanks():
+    partial = StatsPartial()
+    partial.add("c1", _contribution(author="", emoji=[], blank="deleted"))
+    assert partial.blanks == {"deleted": 1, "removed": 0, "other_blank": 1}
+    assert partial.authors == {}
+
+
+def test_merge_and_roundtrip():
+    first, second = StatsPartial(), StatsPartial()
+    first.add("c1", _contribution())
+    second.add("c2", _contribution(author="otherguy", hour=7200))
+    merged = StatsPartial.from_dict(first.merge(second).to_dict())
+    assert merged is not None
+    assert set(merged.authors) == {"someguy", "otherguy"}
+    assert merged.hours == {3600: [1, 3], 7200: [1, 3]}
+    assert merged.emoji == {"🌮": 2}
+
+
+def test_merge_counts_overlapping_comments_once():
+    first, second = StatsPartial(), StatsPartial()
+    first.add("c1", _contribution())
+    first.add("c2", _contribution(author="otherguy"))
+    second.add("c1", _contribution(fingerprint="b", score=10))
+    first.merge(second)
+    assert first.authors == {"someguy": [1, 3, 10, 1], "otherguy": [1, 3, 1, 1]}
+    assert first.emoji == {"🌮": 2}
+    assert first.is_current("c1", "b")
+
+    first.retract("c1")
+    assert first.authors == {"otherguy": [1, 3, 1, 1]}
+    assert first.hours == {3600: [1, 3]}
+
+    keywords, edited = KeywordPartial(), KeywordPartial()
+    keywords.add("c1", KeywordContribution("a", 100, [(2.0, "tacos")]))
+    edited.add("c1", KeywordContribution("b", 200, [(3.0, "fed")]))
+    keywords.merge(edited)
+    assert keywords.keywords == {"fed": [3.0, 1, 200]}
+    keywords.retract("c1")
+    assert keywords.keywords == {}
+
+
+def test_from_dict_rejects_other_versions():
+    assert StatsPartial.from_dict({**StatsPartial().to_dict(), "version": -1}) is None
+
+
+def test_keyword_partial_replaces_edited_comments():
+    partial = KeywordPartial()
+    partial.add("c1", KeywordContribution("a", 100, [(2.0, "tacos"), (1.5, "fed")]))
+    partial.add("c2", KeywordContribution("a", 200, [(2.0, "tacos")]))
+    partial.add("c1", KeywordContribution("b", 300, [(3.0, "fed")]))
+    assert partial.keywords == {"tacos": [2.0, 1, 200], "fed": [3.0, 1, 300]}
+    assert partial.get_scores(min_score=2.5) == [("fed", 3.0)]
+
+    loaded = KeywordPartial.from_dict(KeywordPartial().merge(partial).to_dict())
+    assert loaded is not None
+    assert loaded.get_scores() == [("fed", 3.0), ("tacos", 2.0)]
+    assert loaded.is_current("c1", "b")
@@ -0,0 +1,24 @@
+from datetime import date, datetime, timezone
+from unittest import mock
+
+from tacostats.partials import Contribution, StatsPartial
+from tacostats.statsio import StatsIO
+
+# rollup and stats list storage as they're imported, none of these tests touch storage
+with mock.patch.object(StatsIO, "__init__", lambda self: None):
+    from tacostats import rollup, stats
+
+
+def test_window_ends_at_the_last_completed_dt():
+    # the 2024-02-02 dt is created at 07:00 utc, until then the 2024-02-01 one is still going
+    assert rollup.get_last_completed_dt_date(datetime(2024, 2, 2, 6, 59, tzinfo=timezone.utc)) == date(2024, 1, 31)
+    assert rollup.get_last_completed_dt_date(datetime(2024, 2, 2, 7, 0, tzinfo=timezone.utc)) == date(2024, 2, 1)
+
+
+def test_unique_users_counts_authors_not_flairs(monkeypatch):
+    monkeypatch.setattr(stats, "_find_flair_population", lambda unique_users: {})
+    partial = StatsPartial()
+    for i, (author, flair) in enumerate([("someguy", ":taco: Taco"), ("someguy", ":ben: Bernanke"), ("otherguy", "")]):
+        contribution = Contribution(fingerprint="a", author=author, author_flair_text=flair, score=1, word_count=3, hour=3600, emoji=[])
+        partial.add(f"c{i}", contribution)
+    assert stats.summarize_partial(partial)["unique_users"] == 2
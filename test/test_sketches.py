@@ -0,0 +1,34 @@
+import json
+
+import numpy
+
+from tacostats.sketches import DailySketches, DistinctSketch, QuantileSketch
+
+
+def test_distinct_sketch_merges_as_a_union():
+    first = DistinctSketch().update(f"user{i}" for i in range(20000))
+    second = DistinctSketch().update(f"user{i}" for i in range(10000, 40000))
+    assert abs(first.estimate() - 20000) < 20000 * 0.05
+    assert abs(first.merge(second).estimate() - 40000) < 40000 * 0.05
+
+
+def test_quantile_sketch_is_within_accuracy():
+    values = numpy.random.default_rng(1).integers(-50, 5000, size=20000)
+    sketch = QuantileSketch().update(values[:10000]).merge(QuantileSketch().update(values[10000:]))
+    for p in [10, 50, 90, 99]:
+        expected = numpy.percentile(values, p, method="lower")
+        assert abs(sketch.quantile(p / 100) - expected) <= abs(expected) * 0.02 + 1
+    assert sketch.quantile(0) == values.min()
+    assert sketch.quantile(1) == values.max()
+
+
+def test_sketches_roundtrip_through_json():
+    sketches = DailySketches()
+    sketches.authors.update(["a", "b", "c"])
+    sketches.score.update([-3, 0, 1, 20])
+    sketches.word_count.update([1, 5, 8])
+    sketches.comments_per_user.update([1, 1, 2])
+    loaded = DailySketches.from_dict(json.loads(json.dumps(sketches.to_dict())))
+    assert loaded is not None
+    assert loaded.summarize() == sketches.summarize()
+    assert DailySketches.from_dict({"version": 0}) is None
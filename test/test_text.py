@@ -0,0 +1,22 @@
+from tacostats.text import clean_text, clean_texts, is_plain, strip_markdown, unmark
+
+
+def test_plain_text_skips_markdown():
+    for text in ["just some words", "two\n\nparagraphs\nand a line", "ends with a dot."]:
+        assert is_plain(text)
+        assert unmark(text) == strip_markdown(text)
+    for text in ["> quoted", "**bold**", "[link](https://example.com)", "1. listed", " indented"]:
+        assert not is_plain(text)
+
+
+def test_unicode_whitespace_at_line_ends_is_not_plain():
+    for text in ["text\xa0", "\u2028text", "\x0btext", "text\x0c", "a\n\u3000\nb"]:
+        assert not is_plain(text)
+        assert unmark(text) == strip_markdown(text)
+    assert is_plain("non\xa0breaking")
+
+
+def test_batched_cleaning_matches_one_at_a_time():
+    texts = ["I'm **here**", "see https://example.com/a for more", "> Don't\n\nquote me", "", "plain"]
+    assert clean_texts(texts) == [clean_text(t) for t in texts]
+    assert clean_texts(["sneaky ⁣ separator"]) == [clean_text("sneaky ⁣ separator")]
@@ -0,0 +1,59 @@
+from tacostats.timings import span, stage, timed, write_timings
+
+
+@stage
+def _find_things(n):
+    return list(range(n))
+
+
+def test_spans_record_parents_and_rows():
+    with timed("test") as timer:
+        with span("outer") as s:
+            _find_things(3)
+            s.bytes = 42
+    spans = {s.name: s for s in timer.spans}
+    assert spans["find_things"].parent == "outer"
+    assert spans["find_things"].rows == 3
+    assert spans["outer"].parent is None
+    assert spans["outer"].bytes == 42
+    assert timer.to_dict()["spans"][0]["name"] == "find_things"
+
+
+def test_spans_outside_a_pipeline_are_not_recorded():
+    with timed("test") as timer:
+        pass
+    with span("orphan"):
+        assert _find_things(2) == [0, 1]
+    assert timer.spans == []
+
+
+def test_memory_profile_tracks_nested_peaks():
+    with timed("test", profile_memory=True) as timer:
+        with span("outer"):
+            with span("inner"):
+                junk = bytearray(2**20)
+            del junk
+    memory = {m.name: m for m in timer.memory}
+    assert memory["inner"].peak_bytes >= 2**20
+    assert memory["outer"].peak_bytes >= memory["inner"].peak_bytes
+    assert memory["inner"].rss_bytes > 0
+    assert memory["inner"].top_allocations[0]["bytes"] >= 2**20
+    assert timer.memory_to_dict()["max_rss_bytes"] > 0
+
+
+def test_pipelines_write_their_own_timings():
+    class FakeStatsIO:
+        def __init__(self):
+            self.written = {}
+
+        def write(self, dt_prefix, **kwargs):
+            for key, data in kwargs.items():
+                self.written[f"{dt_prefix}/{key}"] = data
+
+    statsio = FakeStatsIO()
+    for pipeline in ("stats", "keywords", "stats"):
+        with timed(pipeline) as timer:
+            pass
+        write_timings(statsio, "2024-01-01", timer)
+    assert sorted(statsio.written) == ["2024-01-01/timings-keywords", "2024-01-01/timings-stats"]
+    assert statsio.written["2024-01-01/timings-keywords"]["pipeline"] == "keywords"
@@ -0,0 +1,23 @@
+from datetime import date
+
+from tacostats.trends import KeywordBaseline
+
+
+def test_surprise_favours_unusual_keywords():
+    baseline = KeywordBaseline(days=3)
+    for day in range(1, 4):
+        baseline.add_day(date(2024, 2, day), {"tacos": 100.0 + day, "fed": 5.0})
+    ranked = baseline.rank([("tacos", 104.0), ("fed", 30.0), ("zoning", 10.0)])
+    assert [k for k, _, _ in ranked] == ["fed", "zoning", "tacos"]
+
+
+def test_removing_days_and_roundtrip():
+    baseline = KeywordBaseline(days=2)
+    baseline.add_day(date(2024, 2, 1), {"tacos": 4.0})
+    baseline.add_day(date(2024, 2, 2), {"tacos": 6.0, "fed": 3.0})
+    baseline.remove_day(date(2024, 2, 2))
+    assert baseline.sums == {"tacos": [1, 4.0, 16.0]}
+
+    loaded = KeywordBaseline.from_dict(baseline.to_dict())
+    assert loaded == baseline
+    assert KeywordBaseline.from_dict({**baseline.to_dict(), "version": 0}) is None
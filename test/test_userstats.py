@@ -0,0 +1,232 @@
+import json
+import os
+import time
+import tracemalloc
+
+from datetime import date
+from unittest import mock
+
+import pytest
+
+# the openai client wants a key as it's imported, none of these tests call openai
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from tacostats.openai_api import MaxTokensExceededError
+from tacostats.statsio import StatsIO
+
+# userstats lists storage as it's imported, none of these tests touch storage
+with mock.patch.object(StatsIO, "__init__", lambda self: None):
+    from tacostats import userstats
+
+
+def _record(message_id, body):
+    return {"messageId": message_id, "body": json.dumps(body) if isinstance(body, dict) else body}
+
+
+def _request(username, days):
+    return {"username": username, "requester_comment_id": "c1", "days": days}
+
+
+def _failures(response):
+    return sorted(f["itemIdentifier"] for f in response["batchItemFailures"])
+
+
+@pytest.fixture(autouse=True)
+def timers(monkeypatch):
+    timers = []
+    monkeypatch.setattr(userstats.statsio, "_dts", ["2024-02-01"], raising=False)
+    monkeypatch.setattr(userstats, "write_timings", lambda statsio, dt_prefix, timer: timers.append(timer))
+    return timers
+
+
+def test_messages_are_grouped_by_window(monkeypatch):
+    batches = {}
+
+    def process_batch(days, batch):
+        batches[days] = [message_id for message_id, _ in batch]
+        return []
+
+    monkeypatch.setattr(userstats, "_process_batch", process_batch)
+    event = {"Records": [_record("1", _request("a", 7)), _record("2", _request("b", 30)), _record("3", _request("c", "7"))]}
+    assert userstats.lambda_handler(event, None) == {"batchItemFailures": []}
+    assert batches == {7: ["1", "3"], 30: ["2"]}
+
+
+def test_only_failed_messages_are_retried(monkeypatch):
+    processed, reads = [], []
+
+    def process_userstats(username, comment_id, days, overall_stats=None, get_rollups=None):
+        if username == "bad":
+            raise RuntimeError("reddit is down")
+        if username == "lurker":
+            raise userstats.NoCommentsError(f"no comments by {username}")
+        processed.append((username, overall_stats, get_rollups()))
+
+    monkeypatch.setattr(userstats, "_read_rollups", lambda days: reads.append(days) or {"rollups": days})
+    monkeypatch.setattr(userstats, "_get_daily_stats", lambda days, get_rollups: {"days": days})
+    monkeypatch.setattr(userstats, "process_userstats", process_userstats)
+    event = {
+        "Records": [
+            _record("1", _request("good", 7)),
+            _record("2", _request("bad", 7)),
+            _record("3", "not json"),
+            _record("4", {"username": "no days"}),
+            _record("5", _request("also good", 7)),
+            _record("6", _request("lurker", 7)),
+        ]
+    }
+    # a user with nothing to report on never will have, so that request is dropped rather than retried
+    assert _failures(userstats.lambda_handler(event, None)) == ["2", "3", "4"]
+    # the window's rollups and overall stats are shared by every request in it
+    assert sorted(processed) == [("also good", {"days": 7}, {"rollups": 7}), ("good", {"days": 7}, {"rollups": 7})]
+    assert reads == [7]
+
+
+def test_whole_window_is_retried_when_overall_stats_fail(monkeypatch):
+    def get_daily_stats(days, get_rollups):
+        if days == 30:
+            raise KeyError("no rollups")
+        return {}
+
+    monkeypatch.setattr(userstats, "_read_rollups", lambda days: {})
+    monkeypatch.setattr(userstats, "_get_daily_stats", get_daily_stats)
+    monkeypatch.setattr(userstats, "process_userstats", lambda *args, **kwargs: None)
+    event = {"Records": [_record("1", _request("a", 30)), _record("2", _request("b", 7)), _record("3", _request("c", 30))]}
+    assert _failures(userstats.lambda_handler(event, None)) == ["1", "3"]
+
+
+def test_work_shared_by_a_window_is_timed(monkeypatch, timers):
+    monkeypatch.setattr(userstats.statsio, "get_dt_dates", lambda daysago: [], raising=False)
+    monkeypatch.setattr(userstats, "read_author_rollups", lambda statsio, dt_dates: {})
+    monkeypatch.setattr(userstats, "_get_daily_stats", lambda days, get_rollups: get_rollups())
+    monkeypatch.setattr(userstats, "process_userstats", lambda *args, **kwargs: None)
+    userstats.lambda_handler({"Records": [_record("1", _request("a", 7))]}, None)
+    assert [t.pipeline for t in timers] == ["userstats_batch"]
+    assert [s.name for s in timers[0].spans] == ["read_rollups"]
+
+
+def test_warm_batches_never_read_rollups(monkeypatch):
+    def read_rollups(days):
+        raise AssertionError("rollups read for a warm batch")
+
+    monkeypatch.setattr(userstats, "USE_CACHE", True)
+    monkeypatch.setattr(userstats, "_read_rollups", read_rollups)
+    monkeypatch.setattr(userstats, "_get_daily_stats", lambda days, get_rollups: {"days": days})
+    monkeypatch.setattr(userstats, "_read_results", lambda username, days, overall_stats: _results(username=username))
+    event = {"Records": [_record("1", _request("a", 7)), _record("2", _request("b", 7))]}
+    assert userstats.lambda_handler(event, None) == {"batchItemFailures": []}
+
+
+def test_requests_finishing_early_dont_stop_memory_profiling(monkeypatch, timers):
+    monkeypatch.setattr(userstats, "PROFILE_MEMORY", True)
+    monkeypatch.setattr(userstats, "_read_rollups", lambda days: {})
+    monkeypatch.setattr(userstats, "_get_daily_stats", lambda days, get_rollups: {})
+
+    def process_userstats(username, *args, **kwargs):
+        # as if every request profiled its own memory, the first to finish used to stop tracing under the rest
+        with userstats.timed("userstats", profile_memory=True):
+            with userstats.span("work"):
+                time.sleep(0.01 * int(username))
+
+    monkeypatch.setattr(userstats, "process_userstats", process_userstats)
+    event = {"Records": [_record(str(i), _request(str(i), 7)) for i in range(4)]}
+    assert userstats.lambda_handler(event, None) == {"batchItemFailures": []}
+    assert [t.pipeline for t in timers] == ["userstats_batch"]
+    assert not tracemalloc.is_tracing()
+
+
+def _results(**kwargs):
+    defaults = dict(
+        comments_per_day={"max": 3, "mean": 1.5, "max_day": "today"},
+        words_per_comment={"max": 10, "mean": 4.0},
+        top_emoji=[2, "🌮"],
+        top_comment={"body": "tacos", "score": 9, "permalink": "/r/c1"},
+        average_score=2.5,
+        username="someguy",
+        span="week",
+    )
+    return userstats.UserStatsResults(**{**defaults, **kwargs})
+
+
+def test_pack_threads_skips_threads_which_no_longer_fit(monkeypatch):
+    monkeypatch.setattr(userstats, "estimate_tokens_batch", lambda texts, model: [len(t) for t in texts])
+    threads = [("a" * 50, 9), ("b" * 30, 8), ("c" * 10, 7), ("d" * 5, 1)]
+    # each thread costs an extra token for the newline joining it to the rest
+    assert userstats._pack_threads(threads, 50) == threads[1:]
+    assert userstats._pack_threads(threads, 5) == []
+
+
+def test_gpt_response_gives_up_when_there_are_no_threads_left(monkeypatch):
+    def create_chat_completion(*args, **kwargs):
+        raise MaxTokensExceededError("too long", 200, 100)
+
+    monkeypatch.setattr(userstats, "estimate_tokens", lambda text, model: 0)
+    monkeypatch.setattr(userstats, "estimate_tokens_batch", lambda texts, model: [0 for _ in texts])
+    monkeypatch.setattr(userstats, "create_chat_completion", create_chat_completion)
+    results = _results(overall_stats={"comments_per_day": {"max": 20, "mean": 2.0}})
+    with pytest.raises(MaxTokensExceededError):
+        userstats._get_gpt_response(results)
+
+
+def test_fresh_results_are_read_back(monkeypatch):
+    stored = _results().to_dict()
+    monkeypatch.setattr(userstats.statsio, "get_age", lambda prefix, key: 0, raising=False)
+    monkeypatch.setattr(userstats.statsio, "read", lambda prefix, key: stored, raising=False)
+    results = userstats._read_results("someguy", 7)
+    assert results is not None
+    assert results.to_dict() == stored
+
+    monkeypatch.setattr(userstats.statsio, "get_age", lambda prefix, key: 7 * 24 * 60 * 60, raising=False)
+    assert userstats._read_results("someguy", 7) is None
+
+
+class FakeStatsIO:
+    def __init__(self, latest_dt_date):
+        self.latest_dt_date = latest_dt_date
+        self.stored = {}
+        self.ages = {}
+
+    def get_dt_prefix(self, dt_date):
+        return dt_date.isoformat()
+
+    def get_age(self, prefix, key):
+        if key not in self.stored:
+            raise KeyError(key)
+        return self.ages.get(key, 0)
+
+    def read(self, prefix, key):
+        return self.stored[key]
+
+    def write(self, dt_prefix, **kwargs):
+        self.stored.update(kwargs)
+
+
+def test_overall_stats_come_from_memory_then_storage_then_a_rebuild(monkeypatch):
+    builds = []
+
+    def build_daily_stats(days, rollups=None):
+        builds.append(days)
+        return {"build": len(builds)}
+
+    fake = FakeStatsIO(date(2024, 2, 1))
+    monkeypatch.setattr(userstats, "statsio", fake)
+    monkeypatch.setattr(userstats, "_build_daily_stats", build_daily_stats)
+    monkeypatch.setattr(userstats, "_daily_stats_cache", {})
+
+    assert userstats._get_daily_stats(7) == {"build": 1}
+    assert userstats._get_daily_stats(7) == {"build": 1}
+    userstats._daily_stats_cache.clear()
+    assert userstats._get_daily_stats(7) == {"build": 1}
+    assert builds == [7]
+
+    # too old to reuse
+    userstats._daily_stats_cache.clear()
+    fake.ages["overall-7d"] = 2 * 24 * 60 * 60
+    assert userstats._get_daily_stats(7) == {"build": 2}
+
+    # a new dt replaces what's stored and what's in memory
+    fake.ages.clear()
+    fake.latest_dt_date = date(2024, 2, 2)
+    assert userstats._get_daily_stats(7) == {"build": 3}
+    assert list(fake.stored) == ["overall-7d"]
+    assert list(userstats._daily_stats_cache) == [(7, date(2024, 2, 2))]
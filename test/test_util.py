@@ -0,0 +1,47 @@
+import time
+
+from datetime import datetime, timezone
+
+import emoji
+from pandas import Series
+
+from tacostats import util
+from tacostats.util import find_emoji, find_emoji_batch, to_eastern, to_epoch_seconds
+
+
+def test_find_emoji_matches_emoji_list():
+    body = "hi 👍🏽 and 👨‍👩‍👧 🇺🇸 #️⃣ © 🏳️‍🌈"
+    assert find_emoji(body) == [i["emoji"] for i in emoji.emoji_list(body)]
+
+
+def test_find_emoji_ascii():
+    assert find_emoji("no emoji here :)") == []
+    assert find_emoji("") == []
+
+
+def test_find_emoji_batch_cache_invalidated_by_edit():
+    assert find_emoji_batch(Series(["😀😀"]), ["abc"]).tolist() == [["😀", "😀"]]
+    assert find_emoji_batch(Series(["edited 🌮"]), ["abc"]).tolist() == [["🌮"]]
+
+
+def test_find_emoji_batch_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(util, "EMOJI_CACHE_SIZE", 2)
+    monkeypatch.setattr(util, "_EMOJI_CACHE", util.OrderedDict())
+    find_emoji_batch(Series(["🌮", "🔥"]), ["a", "b"])
+    # "a" was used most recently, so "b" is the one dropped
+    find_emoji_batch(Series(["🌮", "🎉"]), ["a", "c"])
+    assert [key[0] for key in util._EMOJI_CACHE] == ["a", "c"]
+
+
+def test_to_eastern_keeps_the_repeated_hour_apart(monkeypatch):
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    try:
+        # 05:30 and 06:30 utc are both 01:30 local the morning the clocks go back
+        timestamps = [datetime(2023, 11, 5, hour, 30, tzinfo=timezone.utc).timestamp() for hour in (5, 6)]
+        created_utc = Series([datetime.fromtimestamp(t) for t in timestamps], dtype=object)
+        assert [str(t) for t in to_eastern(created_utc)] == ["2023-11-05 01:30:00-04:00", "2023-11-05 01:30:00-05:00"]
+        assert to_epoch_seconds(created_utc).tolist() == timestamps
+    finally:
+        monkeypatch.undo()
+        time.tzset()